@@ -0,0 +1,141 @@
+"""
+Service authorization PDF report.
+
+Filters (payer, member, date range) become a MongoDB query on indexed
+fields and only the report columns are projected, so the server never
+loads whole records or rows outside the report. The cursor is read in
+batches of REPORT_BATCH_SIZE and each row is drawn as it arrives; the
+table header is repeated at the top of every page.
+"""
+from datetime import datetime
+
+from fpdf import FPDF
+from pymongo import ASCENDING
+
+from pdf_render import latin1_text
+
+REPORT_BATCH_SIZE = 500
+
+# (record key, header, column width in mm)
+REPORT_COLUMNS = [
+    ('payer', 'Payer', 45),
+    ('memberId', 'Member ID', 25),
+    ('serviceAuthNumber', 'Service Auth #', 28),
+    ('procedureServiceCode', 'Procedure Code', 27),
+    ('dates', 'Service Dates', 42),
+    ('units', 'Units', 15),
+    ('serviceRate', 'Service Rate', 20),
+    ('hoursPerDay', 'Hours Per Day', 23),
+]
+REPORT_PROJECTION = {key: 1 for key, _, _ in REPORT_COLUMNS}
+REPORT_PROJECTION.update({'_id': 0, 'modifierCode': 1})
+REPORT_SORT = [('memberId', ASCENDING), ('serviceAuthNumber', ASCENDING)]
+ROW_HEIGHT = 7
+
+
+def _parse_day(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a date in YYYY-MM-DD format")
+
+
+def build_query(filters):
+    """
+    MongoDB filter for the report. ``from``/``to`` (YYYY-MM-DD) select
+    authorizations whose service dates overlap the range. Raises
+    ValueError for malformed dates.
+    """
+    query = {}
+    if filters.get('payer'):
+        query['payer'] = filters['payer']
+    if filters.get('memberId'):
+        query['memberId'] = filters['memberId']
+    if filters.get('from'):
+        query['endDate'] = {'$gte': _parse_day(filters['from'], 'from')}
+    if filters.get('to'):
+        query['startDate'] = {'$lte': _parse_day(filters['to'], 'to')}
+    return query
+
+
+def find_rows(collection, query):
+    """
+    Cursor over the report rows, batched and projected.
+    """
+    return collection.find(query, REPORT_PROJECTION).sort(REPORT_SORT).batch_size(REPORT_BATCH_SIZE)
+
+
+def _cell_text(pdf, text, width):
+    # Cut values that would overflow their column
+    text = latin1_text(text)
+    while text and pdf.get_string_width(text) > width - 2:
+        text = text[:-1]
+    return text
+
+
+def _draw_header(pdf):
+    pdf.set_font('Arial', 'B', 9)
+    pdf.set_fill_color(230, 230, 230)
+    for _, header, width in REPORT_COLUMNS:
+        pdf.cell(width, ROW_HEIGHT, header, border=1, fill=True)
+    pdf.ln()
+    pdf.set_font('Arial', '', 8)
+
+
+def _describe(filters):
+    parts = [f"{name}={filters[name]}" for name in ('payer', 'memberId', 'from', 'to') if filters.get(name)]
+    return ', '.join(parts) or 'none'
+
+
+def build_report(rows, filters=None, generated_at=None):
+    """
+    Draw the report for an iterable of rows. Returns (FPDF document, row count).
+    """
+    pdf = FPDF(orientation='L', format='A4')
+    pdf.set_auto_page_break(False)
+    pdf.add_page()
+
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, "Service Authorization Report", ln=True, align='C')
+    pdf.set_font('Arial', '', 10)
+    current_date = (generated_at or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    pdf.cell(0, 6, latin1_text(f"Generated on: {current_date}"), ln=True)
+    pdf.cell(0, 6, latin1_text(f"Filters: {_describe(filters or {})}"), ln=True)
+    pdf.ln(2)
+    _draw_header(pdf)
+
+    bottom = pdf.h - pdf.b_margin - 10
+    count = 0
+    for row in rows:
+        if pdf.get_y() + ROW_HEIGHT > bottom:
+            pdf.add_page()
+            _draw_header(pdf)
+        for key, _, width in REPORT_COLUMNS:
+            value = row.get(key) or ''
+            if key == 'procedureServiceCode':
+                value = f"{value} {row.get('modifierCode') or ''}".strip()
+            pdf.cell(width, ROW_HEIGHT, _cell_text(pdf, value, width), border=1)
+        pdf.ln()
+        count += 1
+
+    if not count:
+        pdf.cell(0, ROW_HEIGHT, "No service authorizations match these filters", ln=True)
+    return pdf, count
+
+
+def report_bytes(pdf):
+    """
+    The PDF document as bytes.
+    """
+    output = pdf.output(dest='S')
+    return output.encode('latin-1') if isinstance(output, str) else bytes(output)
+
+
+def write_report(collection, filters, out):
+    """
+    Run the report query and write the PDF to a binary file object (a
+    GridFS file for background exports). Returns the row count.
+    """
+    pdf, count = build_report(find_rows(collection, build_query(filters)), filters)
+    out.write(report_bytes(pdf))
+    return count
@@ -0,0 +1,121 @@
+"""
+Helpers for batch service-authorization ingestion.
+
+PDF text extraction is CPU-bound, so it runs in a process pool; the pool
+uses the 'spawn' start method so workers only import pdf_text and fitz,
+never the Flask app (and never inherit its threads). LLM calls are I/O-bound
+and run on threads, throttled by ``RateLimiter``.
+"""
+import io
+import multiprocessing
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pdf_text
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool(processes=None):
+    """
+    Return the shared extraction pool, creating it on first use.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+
+def extract_texts(blobs, processes=None, max_pages=None):
+    """
+    Extract text from many PDFs in parallel, preserving order.
+    """
+    if not blobs:
+        return []
+    extract = partial(pdf_text.extract_text, max_pages=max_pages)
+    return list(get_process_pool(processes).map(extract, blobs))
+
+
+class UploadLimitError(ValueError):
+    """An upload has too many files or too many bytes."""
+
+
+def _read_capped(stream, limit, name):
+    data = stream.read(limit + 1) if limit else stream.read()
+    if limit and len(data) > limit:
+        raise UploadLimitError(f"{name} is larger than {limit} bytes")
+    return data
+
+
+def iter_pdf_uploads(files, max_files=None, max_file_bytes=None, max_total_bytes=None):
+    """
+    Yield (filename, bytes) for every PDF in the uploaded files, expanding
+    zip archives. Raises UploadLimitError as soon as a limit is crossed:
+    zip member counts and declared sizes are checked before any member is
+    read, and reads stop one byte past the limit.
+    """
+    count = 0
+    total = 0
+
+    def take(name, data):
+        nonlocal count, total
+        count += 1
+        total += len(data)
+        if max_files and count > max_files:
+            raise UploadLimitError(f"A batch takes at most {max_files} PDFs")
+        if max_total_bytes and total > max_total_bytes:
+            raise UploadLimitError(f"A batch takes at most {max_total_bytes} bytes of PDFs")
+        return name, data
+
+    for file in files:
+        if not file or not file.filename:
+            continue
+        if not file.filename.lower().endswith('.zip'):
+            yield take(file.filename, _read_capped(file.stream, max_file_bytes, file.filename))
+            continue
+
+        data = _read_capped(file.stream, max_total_bytes, file.filename)
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            members = [
+                info for info in archive.infolist()
+                if info.filename.lower().endswith('.pdf') and not info.filename.startswith('__MACOSX/')
+            ]
+            if max_files and len(archive.infolist()) > max_files:
+                raise UploadLimitError(f"{file.filename} has more than {max_files} entries")
+            declared = sum(info.file_size for info in members)
+            if max_total_bytes and declared > max_total_bytes:
+                raise UploadLimitError(f"{file.filename} expands to more than {max_total_bytes} bytes")
+            for info in members:
+                with archive.open(info) as member:
+                    yield take(info.filename, _read_capped(member, max_file_bytes, info.filename))
+
+
+class RateLimiter:
+    """Space out calls so no more than ``rate`` start per second, across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def wrap(self, fn):
+        def limited(*args, **kwargs):
+            self.acquire()
+            return fn(*args, **kwargs)
+        return limited
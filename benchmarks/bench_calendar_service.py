@@ -0,0 +1,90 @@
+"""
+Per-shift overhead of getting a Google Calendar client, before and after
+the client cache.
+
+"before" is what add_shift did for every shift: read the user, build new
+Credentials and call build('calendar', 'v3'), which reads and parses the
+discovery document, then prepare the events().insert request. "after" is
+google_calendar.CalendarServiceCache and its cached events collection.
+Nothing is sent to Google. Users come from mongomock, so the database read
+is close to free here and the real saving per shift is larger by one
+round trip.
+
+    python benchmarks/bench_calendar_service.py [--shifts 200] [--users 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mongomock
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+import google_calendar
+
+EVENT = {
+    'summary': 'Shift',
+    'start': {'dateTime': '2024-06-01T09:00:00Z', 'timeZone': 'UTC'},
+    'end': {'dateTime': '2024-06-01T17:00:00Z', 'timeZone': 'UTC'},
+    'attendees': [{'email': 'client@example.com'}],
+}
+
+
+def seed(count):
+    users = mongomock.MongoClient()['benchmark']['users']
+    users.insert_many([{
+        'email': f"user{n}@example.com",
+        'oauth_token': {
+            'access_token': f"token-{n}",
+            'refresh_token': f"refresh-{n}",
+            'expires_at': int(time.time()) + 3600,
+        },
+    } for n in range(count)])
+    return users
+
+
+def uncached(users, user_email):
+    user = users.find_one({"email": user_email})
+    token_data = user["oauth_token"]
+    creds = Credentials(
+        token=token_data["access_token"],
+        refresh_token=token_data.get("refresh_token"),
+        token_uri=google_calendar.TOKEN_URI,
+        client_id='client-id',
+        client_secret='client-secret'
+    )
+    return build('calendar', 'v3', credentials=creds)
+
+
+def run(get_events, shifts, user_count):
+    started = time.perf_counter()
+    for n in range(shifts):
+        events = get_events(f"user{n % user_count}@example.com")
+        events.insert(calendarId='primary', body=EVENT, sendUpdates='all')
+    return (time.perf_counter() - started) / shifts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shifts', type=int, default=200)
+    parser.add_argument('--users', type=int, default=20)
+    args = parser.parse_args()
+
+    users = seed(args.users)
+    cache = google_calendar.CalendarServiceCache(users, 'client-id', 'client-secret')
+
+    before = run(lambda email: uncached(users, email).events(), args.shifts, args.users)
+    after = run(cache.events, args.shifts, args.users)
+
+    print(f"shifts={args.shifts} users={args.users}")
+    print(f"{'':8} {'ms/shift':>10}")
+    print(f"{'before':8} {before * 1000:>10.2f}")
+    print(f"{'after':8} {after * 1000:>10.2f}")
+    print(f"speedup {before / after:.1f}x  cache={cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Load-test the LLM client offline against the fake backend.
+
+Many threads parse synthetic authorizations through
+service_auth_parser.parse_tiered with every field sent to the client, so
+each document costs one (simulated) LLM call. Reports throughput, latency,
+retries and the peak number of requests in flight, which never exceeds
+--max-concurrency however many threads are used.
+
+    python benchmarks/bench_llm_client.py [--docs 200] [--threads 32] [--max-concurrency 8]
+        [--latency 0.05] [--failure-rate 0.1] [--timeout 1]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_client
+import service_auth_parser
+from bench_service_auth_parser import synthetic_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--max-concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--failure-rate', type=float, default=0.1)
+    parser.add_argument('--timeout', type=float, default=1.0)
+    parser.add_argument('--attempts', type=int, default=3)
+    args = parser.parse_args()
+
+    backend = llm_client.FakeBackend(latency=args.latency, failure_rate=args.failure_rate, seed=1)
+    client = llm_client.LLMClient(
+        backend,
+        timeout=args.timeout,
+        max_attempts=args.attempts,
+        max_concurrency=args.max_concurrency,
+        backoff_base=0.01,
+        backoff_max=0.1
+    )
+    corpus = synthetic_corpus(args.docs)
+
+    def parse(text):
+        started = time.perf_counter()
+        try:
+            # A threshold above 1.0 sends every field to the LLM
+            service_auth_parser.parse_tiered(text, client.extract_lines, threshold=1.1)
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        results = list(executor.map(parse, [text for text, _ in corpus]))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds for _, seconds in results)
+    stats = client.stats()
+    print(f"documents={len(corpus)} threads={args.threads} max_concurrency={args.max_concurrency} "
+          f"latency={args.latency}s failure_rate={args.failure_rate:.0%}")
+    print(f"throughput      {len(corpus) / elapsed:8.1f} docs/s")
+    print(f"mean latency    {1000 * sum(latencies) / len(latencies):8.1f} ms")
+    print(f"p95 latency     {1000 * latencies[int(0.95 * (len(latencies) - 1))]:8.1f} ms")
+    print(f"succeeded       {sum(1 for ok, _ in results if ok):8d}")
+    print(f"attempts        {stats['attempts']:8d}")
+    print(f"retries         {stats['retries']:8d}")
+    print(f"failures        {stats['failures']:8d}")
+    print(f"peak in flight  {stats['peak_in_flight']:8d}")
+
+
+if __name__ == '__main__':
+    main()
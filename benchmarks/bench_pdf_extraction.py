@@ -0,0 +1,71 @@
+"""
+Compare the old temp-file PDF extraction with in-memory extraction.
+
+For generated documents of 1 to 200 pages, times the previous path
+(save upload to disk, fitz.open(path), ``text +=`` per page, os.remove)
+against pdf_text.extract_text on the bytes, and checks both return the
+same text.
+
+    python benchmarks/bench_pdf_extraction.py [pages ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+import pdf_text
+
+LINE = "Member ID: 12345678  Service Auth #: 987654321  S5135, UC  Units: 120  Service Rate: 5.50"
+
+
+def make_pdf(pages):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        for row in range(40):
+            page.insert_text((36, 40 + row * 18), f"{number}:{row} {LINE}", fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def legacy_extract(data):
+    # The previous path: write the upload, reopen it, concatenate, delete
+    fd, file_path = tempfile.mkstemp(suffix='.pdf')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    text = ""
+    doc = fitz.open(file_path)
+    for page in doc:
+        text += page.get_text()
+    doc.close()
+    os.remove(file_path)
+    return text
+
+
+def timed(fn, data, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn(data)
+        best = min(best, time.perf_counter() - started)
+    return value, best
+
+
+def main():
+    page_counts = [int(arg) for arg in sys.argv[1:]] or [1, 10, 50, 100, 200]
+    print(f"{'pages':>6} {'legacy ms':>10} {'in-memory ms':>13} {'speedup':>8} {'same text':>10}")
+    for pages in page_counts:
+        data = make_pdf(pages)
+        legacy, legacy_time = timed(legacy_extract, data)
+        in_memory, memory_time = timed(pdf_text.extract_text, data)
+        print(f"{pages:>6} {legacy_time * 1000:>10.1f} {memory_time * 1000:>13.1f} "
+              f"{legacy_time / memory_time:>7.2f}x {str(legacy == in_memory):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Throughput of the document PDF engines.
+
+Renders pdf_template.html documents through pdf_render.RenderService with
+each engine, and (when wkhtmltopdf is installed) the previous path: one
+pdfkit.from_string per document with no configuration, so the binary is
+looked up and started for every request, with no cap on concurrency.
+
+    python benchmarks/bench_pdf_render.py [--docs 100] [--concurrency 16] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdfkit
+from jinja2 import Environment, FileSystemLoader
+
+import pdf_render
+
+TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+
+
+def make_documents(count):
+    template = Environment(loader=FileSystemLoader(TEMPLATES), autoescape=True).get_template('pdf_template.html')
+    documents = []
+    for index in range(count):
+        fields = pdf_render.document_fields({
+            'client_name': f"Client {index}",
+            'document_type': "Data Privacy Policy",
+            'program_name': "Integrated Community Supports",
+            'print_name_title': "Jane Doe, Director",
+            'date_review': "01/15/2025",
+            'date_revision': "01/01/2025",
+        })
+        documents.append((template.render(**fields), fields))
+    return documents
+
+
+def legacy_render(html, fields):
+    return pdfkit.from_string(html, False, options=pdf_render.WKHTMLTOPDF_OPTIONS)
+
+
+def run(render, documents, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        sizes = list(executor.map(lambda doc: len(render(*doc)), documents))
+    return time.perf_counter() - started, sum(sizes) / len(sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16, help="simultaneous requests")
+    parser.add_argument('--workers', type=int, default=4, help="render workers in the service")
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs)
+    wkhtmltopdf = pdf_render.WkhtmltopdfEngine()
+
+    cases = []
+    if wkhtmltopdf.available():
+        cases.append(('legacy pdfkit', legacy_render))
+        service = pdf_render.RenderService(wkhtmltopdf, workers=args.workers, max_queue=args.docs)
+        service.warm()
+        cases.append(('wkhtmltopdf pool', service.render))
+    else:
+        print("wkhtmltopdf not installed, skipping the wkhtmltopdf engines")
+    service = pdf_render.RenderService(pdf_render.FpdfEngine(), workers=args.workers, max_queue=args.docs)
+    service.warm()
+    cases.append(('fpdf pool', service.render))
+
+    print(f"documents={args.docs} concurrency={args.concurrency} workers={args.workers}")
+    print(f"{'engine':18} {'seconds':>8} {'docs/s':>8} {'avg KB':>8}")
+    for name, render in cases:
+        seconds, size = run(render, documents, args.concurrency)
+        print(f"{name:18} {seconds:>8.2f} {args.docs / seconds:>8.1f} {size / 1024:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare the legacy per-payer revenue loop with the single-pass pipeline.
+
+Seeds a payments collection (a local MongoDB when MONGO_URI is set,
+mongomock otherwise), checks that both versions return the same numbers
+and prints timings for each.
+
+    python benchmarks/bench_revenue_by_payer.py [payers] [payments_per_payer]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from main import revenue_by_payer_pipeline
+
+
+def get_collection():
+    if os.getenv('MONGO_URI'):
+        from pymongo import MongoClient
+        return MongoClient(os.getenv('MONGO_URI'))['benchmark']['payments']
+    import mongomock
+    return mongomock.MongoClient()['benchmark']['payments']
+
+
+def seed(collection, payer_count, per_payer, now):
+    collection.delete_many({})
+    rng = random.Random(42)
+    docs = []
+    for p in range(payer_count):
+        for _ in range(per_payer):
+            docs.append({
+                'payer': f'Payer {p:02d}',
+                'amount': round(rng.uniform(10, 2000), 2),
+                'date': now - timedelta(days=rng.randint(0, 900))
+            })
+    collection.insert_many(docs)
+
+
+def legacy_revenue_by_payer(collection, current_date):
+    # The original implementation: 1 + 5 x N round trips
+    this_month_start = datetime(current_date.year, current_date.month, 1)
+    windows = {
+        'this_month': this_month_start,
+        'last_3_months': current_date - timedelta(days=90),
+        'last_6_months': current_date - timedelta(days=180),
+        'last_12_months': current_date - timedelta(days=365),
+        'lifetime': None
+    }
+    result = []
+    for payer in sorted(collection.distinct('payer')):
+        row = {'payer': payer}
+        for name, since in windows.items():
+            match = {'payer': payer}
+            if since is not None:
+                match['date'] = {'$gte': since}
+            totals = list(collection.aggregate([
+                {'$match': match},
+                {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
+            ]))
+            row[name] = totals[0]['total'] if totals else 0
+        result.append(row)
+    return result
+
+
+def single_pass_revenue_by_payer(collection, current_date):
+    result = []
+    for entry in collection.aggregate(revenue_by_payer_pipeline(current_date)):
+        row = {'payer': entry.pop('_id')}
+        row.update(entry)
+        result.append(row)
+    return result
+
+
+def timed(fn, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return value, best
+
+
+def same_numbers(left, right):
+    if [r['payer'] for r in left] != [r['payer'] for r in right]:
+        return False
+    for a, b in zip(left, right):
+        for key in a:
+            if key != 'payer' and abs(a[key] - b[key]) > 1e-6:
+                return False
+    return True
+
+
+def main():
+    payer_count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    per_payer = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    # BSON dates only keep milliseconds; keep window boundaries comparable
+    now = datetime.now().replace(microsecond=0)
+
+    collection = get_collection()
+    seed(collection, payer_count, per_payer, now)
+
+    legacy, legacy_time = timed(legacy_revenue_by_payer, collection, now)
+    single, single_time = timed(single_pass_revenue_by_payer, collection, now)
+
+    print(f"payers={payer_count} payments={payer_count * per_payer}")
+    print(f"legacy loop:  {legacy_time * 1000:8.1f} ms")
+    print(f"single pass:  {single_time * 1000:8.1f} ms")
+    print(f"results match: {same_numbers(legacy, single)}")
+
+
+if __name__ == '__main__':
+    main()
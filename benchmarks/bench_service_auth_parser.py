@@ -0,0 +1,169 @@
+"""
+Report LLM-call rate, latency and field accuracy for each parser tier.
+
+Tiers:
+    regex    compiled regexes only
+    llm      every field sent to the LLM (the previous behaviour)
+    tiered   regexes first, LLM only for missing/ambiguous fields
+
+By default a synthetic corpus is generated and the LLM is simulated by a
+fake that answers with the expected values after --llm-latency seconds.
+Point --corpus at a directory of <name>.txt files with matching
+<name>.json expected service lines (a list, or one object) to use real
+documents, and pass --live to call
+the real model through main.llm_extract_fields.
+
+    python benchmarks/bench_service_auth_parser.py [--docs 200] [--corpus DIR] [--live]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import service_auth_parser
+from service_auth_parser import FIELD_KEYS
+
+HEADER = """MINNESOTA DEPT OF HUMAN SERVICES
+SERVICE AGREEMENT NOTICE
+Member ID: {memberId}
+Service Auth #: {serviceAuthNumber}
+"""
+LINE = """Procedure Service Code: {procedureServiceCode}, {modifierCode}
+Service Dates: {dates}
+Units: {units}
+Service Rate: {serviceRate}
+"""
+
+# Layout variations the regexes do not cover
+UNLABELLED_UNITS = LINE.replace("Units: {units}", "Authorized total {units}")
+DOLLAR_RATE = LINE.replace("Service Rate: {serviceRate}", "Rate per unit is ${serviceRate}")
+LINE_TEMPLATES = [LINE, LINE, LINE, UNLABELLED_UNITS, DOLLAR_RATE]
+
+
+def synthetic_corpus(count, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        header = {
+            'payer': 'MINNESOTA DEPT OF HUMAN SERVICES',
+            'memberId': str(rng.randint(10000000, 99999999)),
+            'serviceAuthNumber': str(rng.randint(100000000, 999999999)),
+        }
+        text = HEADER.format(**header)
+        codes = rng.sample(['S5125', 'S5130', 'S5135', 'S5150'], rng.choice([1, 1, 2, 3]))
+        expected = []
+        for code in codes:
+            start_month = rng.randint(1, 6)
+            line = {
+                **header,
+                'procedureServiceCode': code,
+                'modifierCode': rng.choice(['UA', 'UC']),
+                'dates': f"{start_month:02d}/01/2025 To {start_month + 5:02d}/30/2025",
+                'units': str(rng.randint(40, 900)),
+                'serviceRate': f"{rng.randint(3, 30)}.{rng.randint(0, 99):02d}",
+            }
+            text += rng.choice(LINE_TEMPLATES).format(**line)
+            expected.append(line)
+        corpus.append((text, expected))
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.txt'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                text = f.read()
+            with open(os.path.join(directory, name[:-4] + '.json'), encoding='utf-8') as f:
+                expected = json.load(f)
+            # A single object is a one-line authorization
+            corpus.append((text, expected if isinstance(expected, list) else [expected]))
+    return corpus
+
+
+class FakeLLM:
+    """Answers with the expected values after a fixed delay and counts calls."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.expected = []
+        self.calls = 0
+
+    def __call__(self, text, keys):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [{key: line.get(key, '') for key in keys} for line in self.expected]
+
+
+def count_correct(services, expected):
+    """
+    Fields matching the expected line at the same position, and the
+    number of fields that should have been produced.
+    """
+    correct = sum(
+        1 for got, want in zip(services, expected) for key in FIELD_KEYS
+        if got.get(key, '') == want.get(key, '')
+    )
+    return correct, max(len(services), len(expected)) * len(FIELD_KEYS)
+
+
+def run_tier(tier, corpus, llm):
+    correct = 0
+    total = 0
+    latencies = []
+    llm_calls = 0
+    for text, expected in corpus:
+        if isinstance(llm, FakeLLM):
+            llm.expected = expected
+        started = time.perf_counter()
+        if tier == 'regex':
+            services, info = service_auth_parser.parse_tiered(text)
+        elif tier == 'llm':
+            services = llm(text, FIELD_KEYS)
+            info = {'llm_fields': FIELD_KEYS}
+        else:
+            services, info = service_auth_parser.parse_tiered(text, llm)
+        latencies.append(time.perf_counter() - started)
+        llm_calls += 1 if info['llm_fields'] else 0
+        doc_correct, doc_total = count_correct(services, expected)
+        correct += doc_correct
+        total += doc_total
+
+    latencies.sort()
+    return {
+        'llm_call_rate': llm_calls / len(corpus),
+        'mean_ms': 1000 * sum(latencies) / len(latencies),
+        'p95_ms': 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        'field_accuracy': correct / total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=200)
+    parser.add_argument('--corpus')
+    parser.add_argument('--llm-latency', type=float, default=0.01)
+    parser.add_argument('--live', action='store_true')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.docs)
+    if args.live:
+        from main import llm_extract_fields
+        llm = llm_extract_fields
+    else:
+        llm = FakeLLM(args.llm_latency)
+
+    print(f"documents={len(corpus)} llm={'live' if args.live else f'fake ({args.llm_latency}s)'}")
+    print(f"{'tier':8} {'llm calls':>10} {'mean ms':>9} {'p95 ms':>9} {'accuracy':>9}")
+    for tier in ('regex', 'llm', 'tiered'):
+        stats = run_tier(tier, corpus, llm)
+        print(f"{tier:8} {stats['llm_call_rate']:>10.1%} {stats['mean_ms']:>9.2f} "
+              f"{stats['p95_ms']:>9.2f} {stats['field_accuracy']:>9.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Double-booking check cost: scanning a caregiver's shifts versus the
+in-process interval index (shift_conflicts.ConflictIndex).
+
+Seeds mongomock with back-to-back shifts for a few staff members, then
+times single checks for random new shifts and a batch validation of an
+imported schedule. The scan compares the new shift with every stored
+shift of that staff member, as a check without an index would. Both
+methods must find the same conflicts.
+
+Write checks (``fresh=True``) read the window around the new shift from
+the database instead of the warm index; they are timed against reloading
+the staff member's whole schedule per write. mongomock has no indexes and
+filters in Python, so the window query costs more here than the
+O(log n + k) index range it is on MongoDB; the full reload grows with the
+staff member's history either way.
+
+    python benchmarks/bench_shift_conflicts.py [shifts_per_staff] [checks]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mongomock
+from bson import ObjectId
+
+import shift_conflicts
+
+STAFF = [f"staff{n}@example.com" for n in range(5)]
+BASE = datetime(2022, 1, 1, 8)
+
+
+def seed(shifts_per_staff):
+    db = mongomock.MongoClient()['benchmark_conflicts']
+    docs = []
+    for staff_email in STAFF:
+        for n in range(shifts_per_staff):
+            # One 6-hour shift every 12 hours
+            start = BASE + timedelta(hours=12 * n)
+            docs.append({'_id': ObjectId(), 'staff_email': staff_email, 'start': start, 'end': start + timedelta(hours=6)})
+    db['shifts'].insert_many(docs)
+    return db, docs
+
+
+def random_shift(rng, shifts_per_staff):
+    start = BASE + timedelta(minutes=30 * rng.randrange(24 * shifts_per_staff))
+    return {'_id': ObjectId(), 'staff_email': rng.choice(STAFF), 'start': start,
+            'end': start + timedelta(hours=rng.choice([2, 4, 8]))}
+
+
+def scan(by_staff, item):
+    return sorted(str(doc['_id']) for doc in by_staff[item['staff_email']]
+                  if doc['start'] < item['end'] and doc['end'] > item['start'])
+
+
+def main():
+    shifts_per_staff = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    checks = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    db, docs = seed(shifts_per_staff)
+    by_staff = {}
+    for doc in docs:
+        by_staff.setdefault(doc['staff_email'], []).append(doc)
+
+    rng = random.Random(5)
+    items = [random_shift(rng, shifts_per_staff) for _ in range(checks)]
+    index = shift_conflicts.ConflictIndex(db['shifts'], db['shift_series'])
+
+    started = time.perf_counter()
+    for staff_email in STAFF:
+        with index.lock:
+            index.schedule(staff_email)
+    load_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scanned = [scan(by_staff, item) for item in items]
+    scan_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    indexed = [sorted(conflict['id'] for conflict in index.conflicts(item)) for item in items]
+    index_time = time.perf_counter() - started
+    assert scanned == indexed, "scan and index disagree"
+
+    writes = items[:min(checks, 200)]
+    started = time.perf_counter()
+    fresh = [sorted(conflict['id'] for conflict in index.conflicts(item, fresh=True)) for item in writes]
+    window_time = time.perf_counter() - started
+    assert fresh == indexed[:len(writes)], "window query and index disagree"
+
+    started = time.perf_counter()
+    for item in writes:
+        with index.lock:
+            index._overlapping(index._load(item['staff_email']), item, None)
+    reload_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    report = index.validate_batch(items)
+    batch_time = time.perf_counter() - started
+
+    print(f"staff={len(STAFF)} shifts/staff={shifts_per_staff} checks={checks}")
+    print(f"index load: {load_time * 1000:.0f} ms for {len(docs)} shifts")
+    print(f"{'method':10} {'us/check':>10}")
+    print(f"{'scan':10} {scan_time / checks * 1e6:>10.1f}")
+    print(f"{'index':10} {index_time / checks * 1e6:>10.1f}")
+    print(f"speedup {scan_time / index_time:.0f}x; {sum(1 for found in indexed if found)} checks found conflicts")
+    print(f"write checks ({len(writes)}):")
+    print(f"{'window':10} {window_time / len(writes) * 1e6:>10.1f}")
+    print(f"{'reload':10} {reload_time / len(writes) * 1e6:>10.1f}")
+    print(f"batch validation: {batch_time * 1000:.0f} ms, {sum(1 for found in report if found)} items flagged")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Range queries over a year of recurring shifts: one document per occurrence
+versus one series document expanded lazily.
+
+Every user gets the same weekly schedule for 2024 (a weekday day shift, a
+Tuesday/Thursday evening shift and a weekend shift), stored both ways.
+Uses a local MongoDB when MONGO_URI is set, mongomock otherwise. For
+week, month and year windows, the script times what get_shifts does per
+user and checks that both layouts return the same occurrences. mongomock
+scans every document, which exaggerates the shifts column; on a real
+server the gap is mostly documents read and sent.
+
+    python benchmarks/bench_shift_series.py [users]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+
+import indexes
+import shift_series
+
+SCHEDULE = [
+    # (first start, hours, rule)
+    (datetime(2024, 1, 1, 8), 8, {'freq': 'weekly', 'byDay': ['MO', 'TU', 'WE', 'TH', 'FR'], 'until': '2024-12-31'}),
+    (datetime(2024, 1, 2, 17), 4, {'freq': 'weekly', 'byDay': ['TU', 'TH'], 'until': '2024-12-31'}),
+    (datetime(2024, 1, 6, 10), 6, {'freq': 'weekly', 'interval': 2, 'byDay': ['SA', 'SU'], 'until': '2024-12-31'}),
+]
+WINDOWS = {
+    'week': (datetime(2024, 6, 10), datetime(2024, 6, 17)),
+    'month': (datetime(2024, 11, 1), datetime(2024, 12, 1)),
+    'year': (datetime(2024, 1, 1), datetime(2025, 1, 1)),
+}
+
+
+def get_db():
+    if os.getenv('MONGO_URI'):
+        from pymongo import MongoClient
+        return MongoClient(os.getenv('MONGO_URI'))['benchmark_shift_series']
+    import mongomock
+    return mongomock.MongoClient()['benchmark_shift_series']
+
+
+def seed(db, users):
+    db['shifts'].delete_many({})
+    db['shift_series'].delete_many({})
+    shifts, series = [], []
+    for n in range(users):
+        user_email = f"user{n}@example.com"
+        for first, hours, rule in SCHEDULE:
+            fields = {'title': 'Shift', 'user_email': user_email, 'staff_name': f"Staff {n}",
+                      'start': first, 'end': first + timedelta(hours=hours)}
+            item = shift_series.new_series(fields, shift_series.parse_rule(rule))
+            item['_id'] = ObjectId()
+            series.append(item)
+            for start in shift_series.occurrences(item, None, None):
+                shifts.append(dict(fields, _id=ObjectId(), start=start, end=start + timedelta(hours=hours)))
+    db['shifts'].insert_many(shifts)
+    db['shift_series'].insert_many(series)
+    for name in ('shifts', 'shift_series'):
+        db[name].create_indexes(indexes.INDEXES[name])
+    return len(shifts), len(series)
+
+
+def materialized(db, user_email, start, end):
+    return [shift['start'] for shift in db['shifts'].find(
+        {'user_email': user_email, 'start': {'$gte': start}, 'end': {'$lte': end}}
+    ).sort('start', 1)]
+
+
+def expanded(db, user_email, start, end):
+    found = []
+    for series in db['shift_series'].find(shift_series.window_filter(user_email, start, end)):
+        found.extend(shift['start'] for shift in shift_series.expand(series, start, end))
+    return sorted(found)
+
+
+def timed(fn, db, users, window, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [fn(db, f"user{n}@example.com", *window) for n in range(users)]
+        best = min(best, time.perf_counter() - started)
+    return best / users, results
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    db = get_db()
+    shift_count, series_count = seed(db, users)
+    print(f"users={users} backend={'mongodb' if os.getenv('MONGO_URI') else 'mongomock'}")
+    print(f"documents: {shift_count} shifts vs {series_count} series")
+    print(f"{'window':8} {'occurrences':>11} {'shifts ms':>10} {'series ms':>10} {'speedup':>8}")
+    for name, window in WINDOWS.items():
+        old_time, old = timed(materialized, db, users, window)
+        new_time, new = timed(expanded, db, users, window)
+        assert old == new, f"{name}: layouts disagree"
+        print(f"{name:8} {len(old[0]):>11} {old_time * 1000:>10.2f} {new_time * 1000:>10.2f} {old_time / new_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
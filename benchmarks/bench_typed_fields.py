@@ -0,0 +1,130 @@
+"""
+Range-query and aggregation speed before and after the typed-field migration.
+
+Seeds shifts and invoices in the old string form (a local MongoDB when
+MONGO_URI is set, mongomock otherwise), times a month-range shift query and
+an invoice revenue aggregation, runs typed_fields.migrate, then times the
+typed versions of the same queries and checks they agree.
+
+Before the migration, ISO strings with mixed UTC offsets compare as text,
+so the string range query can also return the wrong shifts; the "rows"
+column shows how many each version matched. mongomock scans in Python
+either way, so run against a real server for meaningful timings.
+
+    python benchmarks/bench_typed_fields.py [shifts] [invoices]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indexes
+import typed_fields
+
+USERS = [f"user{n}@example.com" for n in range(20)]
+
+
+def get_db():
+    if os.getenv('MONGO_URI'):
+        from pymongo import MongoClient
+        return MongoClient(os.getenv('MONGO_URI'))['benchmark_typed_fields']
+    import mongomock
+    return mongomock.MongoClient()['benchmark_typed_fields']
+
+
+def seed(db, shift_count, invoice_count):
+    rng = random.Random(11)
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    db['shifts'].delete_many({})
+    db['invoices'].delete_many({})
+
+    shifts = []
+    for _ in range(shift_count):
+        start = base + timedelta(minutes=15 * rng.randint(0, 4 * 24 * 365 * 2))
+        offset = timezone(timedelta(hours=rng.choice([0, -5, -6])))
+        shifts.append({
+            'user_email': rng.choice(USERS),
+            'title': 'Shift',
+            # What the browser sent: ISO strings, some with local offsets
+            'start': start.astimezone(offset).isoformat(),
+            'end': (start + timedelta(hours=rng.randint(2, 10))).astimezone(offset).isoformat(),
+        })
+    db['shifts'].insert_many(shifts)
+
+    invoices = []
+    for _ in range(invoice_count):
+        total = round(rng.uniform(50, 5000), 2)
+        invoices.append({
+            'client_name': 'Client',
+            'service_date': (base + timedelta(days=rng.randint(0, 730))).strftime('%Y-%m-%d'),
+            'sub_total': f"{total:.2f}",
+            'discount': "0",
+            'total': f"{total:.2f}",
+            'status': 'Pending',
+        })
+    db['invoices'].insert_many(invoices)
+    db['shifts'].create_indexes(indexes.INDEXES['shifts'])
+
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn()
+        best = min(best, time.perf_counter() - started)
+    return value, best
+
+
+def shift_query(db, typed):
+    start, end = datetime(2024, 6, 1), datetime(2024, 7, 1)
+    if not typed:
+        start, end = start.isoformat() + 'Z', end.isoformat() + 'Z'
+    return lambda: len(list(db['shifts'].find(
+        {'user_email': USERS[0], 'start': {'$gte': start}, 'end': {'$lte': end}},
+        {'_id': 1}
+    )))
+
+
+def revenue_query(db, typed):
+    # Strings have to be converted per document before they can be summed
+    total = '$total' if typed else {'$toDecimal': '$total'}
+    match = {'service_date': {'$gte': datetime(2024, 1, 1), '$lt': datetime(2025, 1, 1)}} if typed \
+        else {'service_date': {'$gte': '2024-01-01', '$lt': '2025-01-01'}}
+    return lambda: str(next(db['invoices'].aggregate([
+        {'$match': match},
+        {'$group': {'_id': None, 'revenue': {'$sum': total}}}
+    ]))['revenue'])
+
+
+def main():
+    shift_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    invoice_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    db = get_db()
+    seed(db, shift_count, invoice_count)
+
+    before = {
+        'shift range': timed(shift_query(db, False)),
+        'invoice revenue': timed(revenue_query(db, False)),
+    }
+    started = time.perf_counter()
+    summary = typed_fields.migrate(db, ['shifts', 'invoices'])
+    migration_seconds = time.perf_counter() - started
+    after = {
+        'shift range': timed(shift_query(db, True)),
+        'invoice revenue': timed(revenue_query(db, True)),
+    }
+
+    print(f"shifts={shift_count} invoices={invoice_count} backend={'mongodb' if os.getenv('MONGO_URI') else 'mongomock'}")
+    print(f"migration: {summary} in {migration_seconds:.2f}s")
+    print(f"{'query':16} {'string ms':>10} {'typed ms':>10} {'speedup':>8}  result (string / typed)")
+    for name in before:
+        (old_value, old_time), (new_value, new_time) = before[name], after[name]
+        print(f"{name:16} {old_time * 1000:>10.1f} {new_time * 1000:>10.1f} {old_time / new_time:>7.2f}x  "
+              f"{old_value} / {new_value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Bulk generation of pdf_template.html documents.
+
+Documents are rendered in a 'spawn' process pool (workers import only
+pdf_render, never the Flask app) with a bounded window of documents in
+flight, so finished PDFs are handed on in order as they complete instead
+of accumulating. ``stream_zip`` writes each PDF into a zip archive and
+yields the compressed bytes straight away; ``merge_to_file`` spools the
+PDFs through temporary files and PyPDF2 into one merged PDF on disk,
+which the caller streams back in chunks.
+"""
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PyPDF2 import PdfMerger
+
+import pdf_render
+
+CHUNK_SIZE = 64 * 1024
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+# Engines built once per worker process
+_engines = {}
+
+
+def get_process_pool(processes=None):
+    """
+    Return the shared render pool, creating it on first use.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        # A worker that died takes the whole pool with it; start a new one
+        if _process_pool is None or getattr(_process_pool, '_broken', False):
+            _process_pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+
+def _engine(name, binary=None):
+    if name not in _engines:
+        engine = pdf_render.create_engine(name, binary=binary)
+        _engines[name] = engine if engine.available() else None
+    return _engines[name]
+
+
+def render_in_process(engine_name, fallback_name, binary, html, fields):
+    """
+    Render one document in a worker process, falling back to the second
+    engine if the first is unavailable or fails.
+    """
+    engine = _engine(engine_name, binary)
+    fallback = _engine(fallback_name) if fallback_name else None
+    if engine is None:
+        engine, fallback = fallback, None
+    if engine is None:
+        raise OSError(f"PDF engine {engine_name} is not available")
+    try:
+        return engine.render(html, fields)
+    except Exception:
+        if fallback is None:
+            raise
+        return fallback.render(html, fields)
+
+
+def render_many(documents, engine_name, fallback_name=None, binary=None, processes=None, window=None):
+    """
+    Render (html, fields) pairs across processes and yield (index, pdf,
+    error) in input order, keeping at most ``window`` documents in flight.
+    """
+    pool = get_process_pool(processes)
+    window = window or 2 * (processes or os.cpu_count() or 2)
+    pending = deque()
+    documents = iter(enumerate(documents))
+
+    def submit_next():
+        for index, (html, fields) in documents:
+            pending.append((index, pool.submit(render_in_process, engine_name, fallback_name, binary, html, fields)))
+            return True
+        return False
+
+    while len(pending) < window and submit_next():
+        pass
+    while pending:
+        index, future = pending.popleft()
+        submit_next()
+        try:
+            yield index, future.result(), None
+        except BrokenProcessPool as e:
+            print(f"Render pool broken at document {index}: {e}")
+            for _, other in pending:
+                other.cancel()
+            raise
+        except Exception as e:
+            print(f"Error rendering document {index}: {e}")
+            yield index, None, str(e)
+
+
+class _StreamBuffer:
+    """Write-only file object that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(rendered, filenames):
+    """
+    Yield a zip archive of the rendered PDFs chunk by chunk. Documents that
+    failed are listed in errors.json inside the archive.
+    """
+    buffer = _StreamBuffer()
+    errors = []
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for index, pdf, error in rendered:
+            if error:
+                errors.append({'index': index, 'filename': filenames[index], 'error': error})
+            else:
+                archive.writestr(filenames[index], pdf)
+            yield buffer.drain()
+        if errors:
+            archive.writestr('errors.json', json.dumps(errors, indent=2))
+    yield buffer.drain()
+
+
+def merge_to_file(rendered):
+    """
+    Merge the rendered PDFs in order into a temporary file. Returns (file
+    positioned at the start, errors); the caller closes the file.
+    """
+    merger = PdfMerger()
+    parts = []
+    errors = []
+    try:
+        for index, pdf, error in rendered:
+            if error:
+                errors.append({'index': index, 'error': error})
+                continue
+            # Pages are read lazily from disk, not kept in memory
+            part = tempfile.TemporaryFile()
+            part.write(pdf)
+            part.seek(0)
+            parts.append(part)
+            merger.append(part)
+
+        output = tempfile.TemporaryFile()
+        merger.write(output)
+        output.seek(0)
+        return output, errors
+    finally:
+        merger.close()
+        for part in parts:
+            part.close()
+
+
+def iter_file(file, chunk_size=CHUNK_SIZE):
+    """
+    Yield a file's contents in chunks, closing it at the end.
+    """
+    try:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
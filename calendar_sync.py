@@ -0,0 +1,370 @@
+"""
+Outbox-based Google Calendar sync for shifts.
+
+Routes save the shift and queue an outbox record, and never wait on
+Google. The record is keyed by the shift id and only says "bring this
+shift's calendar event up to date", so several edits before a sync
+collapse into one call. The worker reads the shift as it is when the
+record is sent:
+
+- if the shift has no event yet, the event is inserted;
+- if the shift already has an event, it is updated;
+- if the shift is gone, its event is deleted.
+
+Events are inserted with an id derived from the shift id. An insert retried
+after a crash then conflicts instead of creating a duplicate, and a delete
+knows the event id even when the insert has not been confirmed. Records
+are claimed with a lease, so several workers (or processes) can run at
+once, and a crashed worker's records come back once the lease expires.
+Each pass groups claimed records by user into Calendar batch requests of up
+to BATCH_SIZE calls. Calls are paced by a RateLimiter, and rate-limit and
+server errors are retried with exponential backoff.
+
+Recurring series (see shift_series) sync the same way, as one recurring
+event each; their records have ``kind`` 'series'.
+"""
+import base64
+import logging
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from googleapiclient.errors import HttpError
+from pymongo import ReturnDocument, UpdateOne
+
+import shift_series
+import typed_fields
+from batch_ingest import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENDING = 'sending'
+FAILED = 'failed'
+
+SYNCED = 'synced'
+
+SHIFT = 'shift'
+SERIES = 'series'
+
+# Calendar accepts at most 50 calls in one batch request
+BATCH_SIZE = 50
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+GONE_STATUSES = {404, 410}
+
+
+def calendar_event_id(shift_id):
+    """
+    Event id for a shift. ObjectId hex digits are valid Calendar id
+    characters (base32hex).
+    """
+    return str(shift_id)
+
+
+def event_id_from_link(event_link):
+    """
+    Event id encoded in an htmlLink (``eid`` is base64 of 'eventId calendarId'),
+    for shifts created before ids were stored. None if it cannot be read.
+    """
+    if not event_link or 'eid=' not in event_link:
+        return None
+    eid = event_link.split('eid=', 1)[1].split('&', 1)[0]
+    try:
+        decoded = base64.urlsafe_b64decode(eid + '=' * (-len(eid) % 4)).decode('utf-8')
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return decoded.split(' ', 1)[0] or None
+
+
+def _event_time(value, time_zone):
+    if not time_zone:
+        return {'dateTime': typed_fields.isoformat_utc(value), 'timeZone': 'UTC'}
+    # Local wall-clock time, so Calendar repeats it across DST changes
+    local = shift_series.to_local(value, shift_series.zone(time_zone))
+    return {'dateTime': local.isoformat(), 'timeZone': time_zone}
+
+
+def event_body(shift):
+    """
+    Calendar event for a shift or series document.
+    """
+    if 'rule' in shift:
+        start = shift['series_start']
+        end = start + timedelta(minutes=shift['duration_minutes'])
+    else:
+        start, end = shift['start'], shift['end']
+    body = {
+        'summary': shift.get('title') or 'New Shift',
+        'description': shift.get('description') or '',
+        'start': _event_time(start, shift.get('time_zone')),
+        'end': _event_time(end, shift.get('time_zone')),
+        'attendees': [{'email': shift['recipient_email']}] if shift.get('recipient_email') else [],
+    }
+    if 'rule' in shift:
+        body['recurrence'] = shift_series.recurrence_lines(shift)
+    return body
+
+
+def _is_retryable(error):
+    if not isinstance(error, HttpError):
+        # Connection errors and timeouts
+        return True
+    if error.resp.status in RETRYABLE_STATUSES:
+        return True
+    # Calendar reports quota errors as 403 rateLimitExceeded/userRateLimitExceeded
+    return error.resp.status == 403 and b'ratelimitexceeded' in (error.content or b'').lower()
+
+
+def _status(error):
+    return error.resp.status if isinstance(error, HttpError) else None
+
+
+class CalendarSync:
+    """Queue shift changes and push them to Google Calendar in the background."""
+
+    def __init__(self, shifts, outbox, services, series=None, rate=5, batch_size=BATCH_SIZE, max_attempts=6,
+                 backoff_base=2.0, backoff_max=600.0, lease=300, poll_interval=10):
+        self.collections = {SHIFT: shifts, SERIES: series}
+        self.outbox = outbox
+        self.services = services
+        self.limiter = RateLimiter(rate)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+
+    def _record_update(self, shift_id, user_email, event_id, kind):
+        now = datetime.utcnow()
+        updates = {
+            'user_email': user_email, 'kind': kind, 'status': PENDING,
+            'due_at': now, 'attempts': 0, 'updated_at': now,
+        }
+        if event_id:
+            updates['event_id'] = event_id
+        return UpdateOne(
+            {'_id': shift_id},
+            {'$set': updates, '$unset': {'last_error': ''}, '$setOnInsert': {'created_at': now}},
+            upsert=True
+        )
+
+    def enqueue(self, shift_id, user_email, event_id=None, kind=SHIFT):
+        """
+        Mark a shift (or series) for sync. Call it before writing the shift
+        itself: a record for a write that then failed just syncs the
+        unchanged state. ``event_id`` is needed only when the shift is about
+        to be deleted.
+        """
+        self.enqueue_many([(shift_id, user_email, event_id, kind)])
+
+    def enqueue_many(self, items):
+        """
+        Mark several (id, user_email, event_id, kind) for sync in one write.
+        """
+        operations = [self._record_update(*item) for item in items]
+        if operations:
+            self.outbox.bulk_write(operations, ordered=False)
+            self.wakeup.set()
+
+    def _claim(self, now):
+        # A record re-queued while in flight stays leased until its sender releases it
+        return self.outbox.find_one_and_update(
+            {
+                'status': {'$in': [PENDING, SENDING]},
+                'due_at': {'$lte': now},
+                '$or': [{'lease_until': None}, {'lease_until': {'$lt': now}}],
+            },
+            {'$set': {
+                'status': SENDING,
+                'claim': uuid.uuid4().hex,
+                'lease_until': now + timedelta(seconds=self.lease),
+            }},
+            sort=[('due_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def run_once(self):
+        """
+        Send every record that is due. Returns counts of the outcomes.
+        """
+        counts = {'synced': 0, 'retried': 0, 'failed': 0}
+        while not self.stopping.is_set():
+            now = datetime.utcnow()
+            claimed = []
+            while len(claimed) < self.batch_size:
+                record = self._claim(now)
+                if record is None:
+                    break
+                claimed.append(record)
+            if not claimed:
+                break
+
+            by_user = {}
+            for record in claimed:
+                by_user.setdefault(record['user_email'], []).append(record)
+            for user_email, records in by_user.items():
+                for outcome in self._send(user_email, records):
+                    counts[outcome] += 1
+        return counts
+
+    def _send(self, user_email, records):
+        try:
+            events = self.services.events(user_email)
+        except ValueError as e:
+            # Not signed in with Google: retrying will not help until they do
+            return [self._fail(record, str(e), final=True) for record in records]
+
+        shifts = {}
+        for kind in (SHIFT, SERIES):
+            ids = [record['_id'] for record in records if record.get('kind', SHIFT) == kind]
+            if ids:
+                shifts.update((doc['_id'], doc) for doc in self.collections[kind].find({'_id': {'$in': ids}}))
+        batch = self.services.get(user_email).new_batch_http_request()
+        calls = {}
+        results = {}
+
+        def collect(request_id, response, exception):
+            results[request_id] = (response, exception)
+
+        for record in records:
+            shift = shifts.get(record['_id'])
+            op, request = self._call(events, record, shift)
+            request_id = str(record['_id'])
+            calls[request_id] = (record, shift, op)
+            self.limiter.acquire()
+            batch.add(request, callback=collect, request_id=request_id)
+
+        try:
+            batch.execute()
+        except Exception as e:
+            logger.warning(f"Calendar batch for {user_email} failed: {e}")
+            return [self._fail(record, str(e)) for record, _, _ in calls.values()]
+
+        outcomes = []
+        for request_id, (record, shift, op) in calls.items():
+            response, error = results.get(request_id, (None, RuntimeError("No response in batch")))
+            outcomes.append(self._handle(record, shift, op, response, error))
+        return outcomes
+
+    def _call(self, events, record, shift):
+        if shift is None:
+            event_id = record.get('event_id') or calendar_event_id(record['_id'])
+            return 'delete', events.delete(calendarId='primary', eventId=event_id, sendUpdates='all')
+        if shift.get('event_id'):
+            return 'update', events.update(
+                calendarId='primary', eventId=shift['event_id'], body=event_body(shift), sendUpdates='all'
+            )
+        body = dict(event_body(shift), id=calendar_event_id(shift['_id']))
+        return 'insert', events.insert(calendarId='primary', body=body, sendUpdates='all')
+
+    def _handle(self, record, shift, op, response, error):
+        status = _status(error)
+        if error is None:
+            if op != 'delete':
+                self._collection(record).update_one({'_id': shift['_id']}, {'$set': {
+                    'event_id': response['id'],
+                    'event_link': response.get('htmlLink'),
+                    'calendar_status': SYNCED,
+                    'calendar_synced_at': datetime.utcnow(),
+                }, '$unset': {'calendar_error': ''}})
+            return self._done(record)
+        if op == 'delete' and status in GONE_STATUSES:
+            # Never created, or already deleted
+            return self._done(record)
+        if op == 'insert' and status == 409:
+            # An earlier attempt got through before the worker stopped: update that event
+            self._collection(record).update_one({'_id': shift['_id']},
+                                                {'$set': {'event_id': calendar_event_id(shift['_id'])}})
+            return self._fail(record, str(error), delay=0)
+        return self._fail(record, str(error), final=not _is_retryable(error))
+
+    def _collection(self, record):
+        return self.collections[record.get('kind', SHIFT)]
+
+    def _release(self, record):
+        # The shift changed while this record was in flight; leave it pending for the next pass
+        self.outbox.update_one({'_id': record['_id'], 'claim': record['claim']},
+                               {'$unset': {'lease_until': '', 'claim': ''}})
+
+    def _done(self, record):
+        deleted = self.outbox.delete_one({'_id': record['_id'], 'claim': record['claim'], 'status': SENDING})
+        if not deleted.deleted_count:
+            self._release(record)
+        return 'synced'
+
+    def _fail(self, record, message, final=False, delay=None):
+        attempts = record.get('attempts', 0) + 1
+        final = final or attempts >= self.max_attempts
+        if delay is None:
+            # Full jitter, as in llm_client
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempts))
+        now = datetime.utcnow()
+        updated = self.outbox.update_one(
+            {'_id': record['_id'], 'claim': record['claim'], 'status': SENDING},
+            {'$set': {
+                'status': FAILED if final else PENDING,
+                'due_at': now + timedelta(seconds=delay),
+                'attempts': attempts,
+                'last_error': message,
+                'updated_at': now,
+            }, '$unset': {'lease_until': '', 'claim': ''}}
+        )
+        if not updated.matched_count:
+            self._release(record)
+            return 'retried'
+        if final:
+            logger.error(f"Calendar sync for {record.get('kind', SHIFT)} {record['_id']} failed: {message}")
+            self._collection(record).update_one({'_id': record['_id']},
+                                   {'$set': {'calendar_status': FAILED, 'calendar_error': message}})
+            return 'failed'
+        return 'retried'
+
+    def retry_failed(self):
+        """
+        Queue every failed record again. Returns how many were queued.
+        """
+        now = datetime.utcnow()
+        return self.outbox.update_many(
+            {'status': FAILED},
+            {'$set': {'status': PENDING, 'due_at': now, 'attempts': 0, 'updated_at': now}}
+        ).modified_count
+
+    def run_forever(self):
+        while not self.stopping.is_set():
+            self.wakeup.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Calendar sync pass failed: {e}")
+            self.wakeup.wait(self.poll_interval)
+
+    def start(self):
+        """
+        Run the worker on a daemon thread. Safe to call from every request;
+        only the first call starts it.
+        """
+        with self.thread_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run_forever, name='calendar-sync', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+    def stats(self):
+        counts = {PENDING: 0, SENDING: 0, FAILED: 0}
+        for row in self.outbox.aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]):
+            counts[row['_id']] = row['count']
+        oldest = self.outbox.find_one({'status': {'$in': [PENDING, SENDING]}}, {'created_at': 1},
+                                      sort=[('created_at', 1)])
+        counts['oldest_pending_seconds'] = (
+            round((datetime.utcnow() - oldest['created_at']).total_seconds(), 1) if oldest else None
+        )
+        return counts
@@ -0,0 +1,207 @@
+"""
+Per-user Google Calendar API clients.
+
+Building a client used to cost a users lookup, new Credentials and a parse
+of the calendar discovery document on every shift. ``CalendarServiceCache``
+keeps one client per user, least recently used first out once
+``max_entries`` is reached, built from the discovery document bundled with
+google-api-python-client (read and parsed once per process, no network).
+
+Credentials carry the stored expiry, so they refresh before a request
+instead of after a 401, and a refreshed access token is written back to the
+user's ``oauth_token`` in one update. The update only applies while the
+stored refresh token is the one that was used, so it never overwrites a
+newer login. Each thread gets its own HTTP connection, as httplib2 is not
+thread-safe. The ``events()`` collection is cached with the client, since
+each call to it builds a new resource from the discovery document.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import google_auth_httplib2
+import httplib2
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+
+TOKEN_URI = "https://oauth2.googleapis.com/token"
+HTTP_TIMEOUT = 30
+
+_discovery_document = None
+_discovery_lock = threading.Lock()
+
+
+def discovery_document():
+    """
+    The calendar v3 discovery document, parsed once.
+    """
+    global _discovery_document
+    with _discovery_lock:
+        if _discovery_document is None:
+            content = discovery_cache.get_static_doc('calendar', 'v3')
+            if content is None:
+                raise RuntimeError("calendar v3 discovery document is not bundled with googleapiclient")
+            _discovery_document = json.loads(content)
+        return _discovery_document
+
+
+def token_expiry(token_data):
+    """
+    Naive UTC expiry from the stored token's ``expires_at``, if any.
+    """
+    expires_at = token_data.get('expires_at')
+    return datetime.utcfromtimestamp(expires_at) if expires_at else None
+
+
+class PersistingCredentials(Credentials):
+    """Credentials that save a refreshed access token back to the user."""
+
+    def __init__(self, *args, on_refresh=None, on_failure=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_refresh = on_refresh
+        self._on_failure = on_failure
+
+    def refresh(self, request):
+        refresh_token = self.refresh_token
+        try:
+            super().refresh(request)
+        except RefreshError:
+            if self._on_failure:
+                self._on_failure()
+            raise
+        if self._on_refresh:
+            self._on_refresh(self, refresh_token)
+
+
+class _Entry:
+    __slots__ = ('service', 'events', 'credentials', 'created_at', 'local')
+
+    def __init__(self, service, credentials):
+        self.service = service
+        self.events = None
+        self.credentials = credentials
+        self.created_at = time.monotonic()
+        self.local = threading.local()
+
+
+class CalendarServiceCache:
+    """Bounded cache of per-user calendar clients."""
+
+    def __init__(self, users, client_id, client_secret, max_entries=256, max_age=3600):
+        self.users = users
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.max_entries = max_entries
+        # Another process may have re-authorized the user; rebuild now and then
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'refreshes': 0, 'refresh_failures': 0}
+
+    def get(self, user_email):
+        """
+        Calendar client for a user. Raises ValueError when the user has not
+        signed in with Google.
+        """
+        return self._entry(user_email).service
+
+    def events(self, user_email):
+        """
+        The user's ``events()`` collection.
+        """
+        return self._entry(user_email).events
+
+    def _entry(self, user_email):
+        with self.lock:
+            entry = self.entries.get(user_email)
+            if entry is not None and time.monotonic() - entry.created_at < self.max_age:
+                self.entries.move_to_end(user_email)
+                self.counters['hits'] += 1
+                return entry
+            self.counters['misses'] += 1
+
+        entry = self._build(user_email)
+        with self.lock:
+            self.entries[user_email] = entry
+            self.entries.move_to_end(user_email)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+        return entry
+
+    def invalidate(self, user_email):
+        """
+        Drop a user's client, e.g. after they sign in again.
+        """
+        with self.lock:
+            self.entries.pop(user_email, None)
+
+    def _build(self, user_email):
+        user = self.users.find_one({"email": user_email}, {"oauth_token": 1})
+        if not user or "oauth_token" not in user:
+            raise ValueError("User not authenticated with Google")
+        token_data = user["oauth_token"]
+
+        credentials = PersistingCredentials(
+            token=token_data["access_token"],
+            refresh_token=token_data.get("refresh_token"),
+            token_uri=TOKEN_URI,
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+            expiry=token_expiry(token_data),
+            on_refresh=lambda creds, used: self._save_token(user_email, creds, used),
+            on_failure=lambda: self._refresh_failed(user_email),
+        )
+        entry = _Entry(None, credentials)
+
+        def request_builder(http, *args, **kwargs):
+            # One authorized connection per thread, reused across requests
+            if not hasattr(entry.local, 'http'):
+                entry.local.http = google_auth_httplib2.AuthorizedHttp(
+                    credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT)
+                )
+            return HttpRequest(entry.local.http, *args, **kwargs)
+
+        entry.service = build_from_document(
+            discovery_document(),
+            http=google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT)),
+            requestBuilder=request_builder,
+        )
+        entry.events = entry.service.events()
+        return entry
+
+    def _save_token(self, user_email, credentials, used_refresh_token):
+        with self.lock:
+            self.counters['refreshes'] += 1
+        updates = {"oauth_token.access_token": credentials.token}
+        if credentials.expiry:
+            expires_at = int((credentials.expiry - datetime(1970, 1, 1)).total_seconds())
+            updates["oauth_token.expires_at"] = expires_at
+            updates["oauth_token.expires_in"] = max(0, expires_at - int(time.time()))
+        if credentials.refresh_token and credentials.refresh_token != used_refresh_token:
+            updates["oauth_token.refresh_token"] = credentials.refresh_token
+        self.users.update_one(
+            {"email": user_email, "oauth_token.refresh_token": used_refresh_token},
+            {"$set": updates}
+        )
+
+    def _refresh_failed(self, user_email):
+        # Revoked or expired grant: the next call rebuilds from whatever login is stored
+        with self.lock:
+            self.counters['refresh_failures'] += 1
+        self.invalidate(user_email)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hit_rate': round(self.counters['hits'] / lookups, 4) if lookups else None,
+                **self.counters,
+            }
@@ -0,0 +1,155 @@
+"""
+Index declarations for the hot collections, and query-plan checks.
+
+Every index the routes rely on is declared in INDEXES and created
+idempotently by ``ensure_indexes``. ``verify_query_plans`` runs ``explain()``
+on the filter each route sends and reports any that fall back to a
+collection scan.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    'shifts': [
+        IndexModel([('user_email', ASCENDING), ('start', ASCENDING), ('end', ASCENDING)],
+                   name='user_email_start_end'),
+        IndexModel([('staff_email', ASCENDING), ('start', ASCENDING)], name='staff_email_start'),
+    ],
+    'shift_series': [
+        IndexModel([('user_email', ASCENDING), ('series_start', ASCENDING), ('series_end', ASCENDING)],
+                   name='user_email_series_start_series_end'),
+        IndexModel([('staff_email', ASCENDING)], name='staff_email'),
+    ],
+    'schedule': [
+        IndexModel([('date', ASCENDING)], name='date'),
+    ],
+    'payments': [
+        IndexModel([('date', ASCENDING)], name='date'),
+    ],
+    'claims': [
+        IndexModel([('status', ASCENDING)], name='status'),
+    ],
+    'timesheet': [
+        IndexModel([('paid', ASCENDING)], name='paid'),
+        IndexModel([('status', ASCENDING)], name='status'),
+    ],
+    'payroll': [
+        IndexModel([('status', ASCENDING)], name='status'),
+    ],
+    'dashboard_stats': [
+        IndexModel([('user_email', ASCENDING)], name='user_email'),
+    ],
+    'users': [
+        IndexModel([('email', ASCENDING)], name='email'),
+    ],
+    'service_auth': [
+        IndexModel([('memberId', ASCENDING), ('serviceAuthNumber', ASCENDING)], name='memberId_serviceAuthNumber'),
+        IndexModel([('payer', ASCENDING), ('memberId', ASCENDING), ('serviceAuthNumber', ASCENDING)],
+                   name='payer_memberId_serviceAuthNumber'),
+        IndexModel([('endDate', ASCENDING), ('startDate', ASCENDING)], name='endDate_startDate'),
+        IndexModel([('serviceAuthNumber', ASCENDING), ('procedureServiceCode', ASCENDING)],
+                   name='serviceAuthNumber_procedureServiceCode'),
+    ],
+    'hashes_new': [
+        IndexModel([('text_hash', ASCENDING)], name='text_hash'),
+        IndexModel([('last_used_at', ASCENDING)], name='last_used_at'),
+        IndexModel([('expires_at', ASCENDING)], name='expires_at', expireAfterSeconds=0),
+    ],
+    # GridFS files of background report exports, cleaned up by upload date
+    'export_files.files': [
+        IndexModel([('uploadDate', ASCENDING)], name='uploadDate'),
+    ],
+    'calendar_outbox': [
+        IndexModel([('status', ASCENDING), ('due_at', ASCENDING)], name='status_due_at'),
+    ],
+}
+
+
+def ensure_indexes(db):
+    """
+    Create every declared index. Safe to run repeatedly.
+    """
+    created = {}
+    for collection_name, models in INDEXES.items():
+        created[collection_name] = db[collection_name].create_indexes(models)
+        logger.info(f"Indexes ensured on {collection_name}: {created[collection_name]}")
+    return created
+
+
+def route_queries(current_date=None):
+    """
+    Return (route, collection, filter) for the filters the routes send.
+
+    /api/revenue/by_payer and /api/payments/by_payer are left out: they
+    $group every payment with no filter, so no index can serve them.
+    """
+    now = current_date or datetime.now()
+    month_start = datetime(now.year, now.month, 1)
+    return [
+        ('/get-shifts', 'shifts', {
+            'user_email': 'user@example.com',
+            '$or': [
+                {'start': {'$gte': month_start}, 'end': {'$lte': now}},
+                {'start': {'$gte': month_start.isoformat()}, 'end': {'$lte': now.isoformat()}}
+            ]
+        }),
+        ('/get-shifts', 'shift_series', {
+            'user_email': 'user@example.com',
+            'series_start': {'$lte': now},
+            '$or': [{'series_end': None}, {'series_end': {'$gte': month_start}}]
+        }),
+        ('/add-shift', 'shifts', {'staff_email': 'staff@example.com'}),
+        ('/add-shift', 'shift_series', {'staff_email': 'staff@example.com'}),
+        ('/api/schedule/caregivers', 'schedule', {
+            'date': {'$gte': month_start, '$lt': now}
+        }),
+        ('/api/schedule/details', 'schedule', {
+            'date': {'$gte': month_start, '$lt': month_start + timedelta(days=1)}
+        }),
+        ('/api/revenue/yearly', 'payments', {
+            'date': {'$gte': now - timedelta(days=365), '$lte': now}
+        }),
+        ('rebuild-rollups', 'claims', {'status': 'unpaid'}),
+        ('rebuild-rollups', 'timesheet', {'paid': False}),
+        ('rebuild-rollups', 'timesheet', {'status': 'approved'}),
+        ('rebuild-rollups', 'payroll', {'status': 'paid'}),
+        ('/api/dashboard-stats', 'dashboard_stats', {'user_email': 'user@example.com'}),
+        ('/google/callback', 'users', {'email': 'user@example.com'}),
+        ('/api/export-pdf', 'service_auth', {'memberId': '12345678'}),
+        ('/api/service-auth/<number>/balance', 'service_auth', {'serviceAuthNumber': '987654321'}),
+        ('/api/export-pdf', 'service_auth', {
+            'payer': 'MINNESOTA DEPT OF HUMAN SERVICES', 'endDate': {'$gte': month_start}
+        }),
+        ('/api/export-pdf', 'service_auth', {
+            'endDate': {'$gte': month_start}, 'startDate': {'$lte': now}
+        }),
+    ]
+
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def verify_query_plans(db, current_date=None):
+    """
+    Explain each route query and return a list of (route, collection, filter)
+    whose winning plan is a COLLSCAN.
+    """
+    failures = []
+    for route, collection_name, query in route_queries(current_date):
+        explain = db[collection_name].find(query).explain()
+        winning_plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+        if 'COLLSCAN' in _plan_stages(winning_plan):
+            failures.append((route, collection_name, query))
+    return failures
@@ -0,0 +1,103 @@
+"""
+Background job queue for slow request work (PDF extraction, LLM parsing).
+
+Job state lives in a MongoDB collection so any worker process can answer a
+status request. The execution backend is pluggable: ``ThreadPoolBackend``
+runs jobs on an in-process pool, ``InlineBackend`` runs them immediately in
+the caller (handy for tests and local runs).
+"""
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class InlineBackend:
+    """Run each job synchronously in the submitting thread."""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+    def shutdown(self):
+        pass
+
+
+class ThreadPoolBackend:
+    """Run jobs on a bounded pool of background threads."""
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+
+    def submit(self, fn, *args):
+        self.executor.submit(fn, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def create_backend(name, max_workers=4):
+    """
+    Build a backend by name ('thread' or 'inline'). Any object with
+    submit(fn, *args) and shutdown() can be passed to JobQueue instead.
+    """
+    if name == 'thread':
+        return ThreadPoolBackend(max_workers=max_workers)
+    if name == 'inline':
+        return InlineBackend()
+    raise ValueError(f"Unknown job queue backend: {name}")
+
+
+class JobQueue:
+    """Submit callables as jobs and track their status in MongoDB."""
+
+    def __init__(self, jobs_collection, backend):
+        self.jobs = jobs_collection
+        self.backend = backend
+
+    def submit(self, kind, fn, *args, **metadata):
+        """
+        Record a queued job and hand it to the backend. Returns the job id.
+        """
+        job_id = uuid.uuid4().hex
+        self.jobs.insert_one({
+            '_id': job_id,
+            'kind': kind,
+            'status': QUEUED,
+            'created_at': datetime.utcnow(),
+            **metadata
+        })
+        self.backend.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id, fn, args):
+        self.jobs.update_one(
+            {'_id': job_id},
+            {'$set': {'status': RUNNING, 'started_at': datetime.utcnow()}}
+        )
+        try:
+            result = fn(*args)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            self.jobs.update_one(
+                {'_id': job_id},
+                {'$set': {'status': FAILED, 'error': str(e), 'finished_at': datetime.utcnow()}}
+            )
+            return
+
+        self.jobs.update_one(
+            {'_id': job_id},
+            {'$set': {'status': DONE, 'result': result, 'finished_at': datetime.utcnow()}}
+        )
+
+    def get(self, job_id):
+        """
+        Return the job document, or None if the id is unknown.
+        """
+        return self.jobs.find_one({'_id': job_id})
@@ -0,0 +1,209 @@
+"""
+LLM client for service authorization extraction.
+
+The prompt and chain are built once per client and reused for every call;
+the model answers in JSON mode, so its output is parsed in one
+``json.loads``. Each attempt has a timeout, failed attempts are retried
+with jittered exponential backoff, and a semaphore caps how many requests
+are in flight across all threads.
+
+Backends are pluggable: ``OpenAIBackend`` talks to the OpenAI API through
+one long-lived ChatOpenAI instance (and so one HTTP connection pool),
+``FakeBackend`` answers locally from the regex tier after a configurable
+delay so the parser can be load-tested offline.
+"""
+import json
+import random
+import threading
+import time
+
+import openai
+from langchain.prompts import PromptTemplate
+from langchain_openai import ChatOpenAI
+
+import service_auth_parser
+
+PROMPT = """
+        Extract every authorized service line from the healthcare service authorization text.
+        A document can list several procedure codes and modifiers; return one entry per line.
+        Respond with a JSON object of the form {{"services": [{{...}}, ...]}} where each entry
+        has exactly these keys (use an empty string when a value is not present):
+
+{fields}
+
+        Here is the text from the service authorization document:
+        {text}
+        """
+
+# Errors worth another attempt; anything else (bad key, bad request) fails at once
+RETRYABLE_ERRORS = (
+    TimeoutError,
+    json.JSONDecodeError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def field_hints(keys):
+    """
+    The prompt lines describing the requested fields.
+    """
+    return "\n".join(
+        f"        - {key}: {service_auth_parser.FIELD_HINTS[key]}" for key in keys
+    )
+
+
+class OpenAIBackend:
+    """Send prompts to the OpenAI chat API in JSON mode."""
+
+    def __init__(self, model="gpt-3.5-turbo", timeout=30):
+        # Retries are handled by LLMClient, so the SDK's own are turned off
+        self.model = ChatOpenAI(
+            model=model,
+            temperature=0.0,  # Set to 0 for more deterministic responses
+            timeout=timeout,
+            max_retries=0,
+        )
+        prompt = PromptTemplate(input_variables=["fields", "text"], template=PROMPT)
+        self.chain = prompt | self.model.bind(response_format={"type": "json_object"})
+
+    def complete(self, fields, text, timeout):
+        """
+        Return the raw JSON string answered for the prompt. The timeout is
+        enforced by the model's HTTP client.
+        """
+        return self.chain.invoke({"fields": fields, "text": text}).content
+
+    def count_tokens(self, text):
+        return self.model.get_num_tokens(text)
+
+
+class FakeBackend:
+    """
+    Answer locally with the regex tier's lines after ``latency`` seconds.
+    ``failure_rate`` makes that fraction of calls raise a retryable error.
+    """
+
+    def __init__(self, latency=0.5, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def complete(self, fields, text, timeout):
+        if timeout and self.latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake LLM did not answer within {timeout}s")
+        time.sleep(self.latency)
+        with self.lock:
+            failed = self.random.random() < self.failure_rate
+        if failed:
+            raise TimeoutError("Simulated LLM failure")
+
+        header, lines = service_auth_parser.regex_extract(text)
+        header_values = {key: value for key, (value, _) in header.items()}
+        services = [
+            {**header_values, **{key: value for key, (value, _) in line.items()}}
+            for line in lines
+        ]
+        return json.dumps({"services": services})
+
+    def count_tokens(self, text):
+        # Roughly four characters per token for English text
+        return len(text) // 4
+
+
+def create_backend(name, model="gpt-3.5-turbo", timeout=30, fake_latency=0.5):
+    """
+    Build a backend by name ('openai' or 'fake'). Any object with
+    complete(fields, text, timeout) and count_tokens(text) can be passed to
+    LLMClient instead.
+    """
+    if name == 'openai':
+        return OpenAIBackend(model=model, timeout=timeout)
+    if name == 'fake':
+        return FakeBackend(latency=fake_latency)
+    raise ValueError(f"Unknown LLM backend: {name}")
+
+
+class LLMClient:
+    """Structured service-line extraction with timeouts, retries and a concurrency cap."""
+
+    def __init__(self, backend, timeout=30, max_attempts=3, max_concurrency=8,
+                 backoff_base=0.5, backoff_max=8.0):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.counters = {
+            'calls': 0,
+            'attempts': 0,
+            'retries': 0,
+            'failures': 0,
+            'in_flight': 0,
+            'peak_in_flight': 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.counters[key] += amount
+            if key == 'in_flight':
+                self.counters['peak_in_flight'] = max(self.counters['peak_in_flight'], self.counters['in_flight'])
+
+    def backoff(self, attempt):
+        """
+        Full-jitter delay before retry number ``attempt`` (1-based).
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def _attempt(self, fields, text):
+        with self.slots:
+            self._count('attempts')
+            self._count('in_flight')
+            try:
+                return json.loads(self.backend.complete(fields, text, self.timeout))
+            finally:
+                self._count('in_flight', -1)
+
+    def extract_lines(self, text, keys):
+        """
+        Return a list of service lines, each {key: value} for the requested
+        keys ('' where the model found nothing).
+        """
+        self._count('calls')
+        fields = field_hints(keys)
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                result = self._attempt(fields, text)
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_attempts:
+                    self._count('failures')
+                    raise
+                print(f"LLM attempt {attempt} failed ({e}), retrying")
+                self._count('retries')
+                time.sleep(self.backoff(attempt))
+            except Exception:
+                self._count('failures')
+                raise
+
+        lines = []
+        for line in result.get("services", []):
+            values = {}
+            for key in keys:
+                value = str(line.get(key) or "").strip()
+                values[key] = "" if value.lower() == "not found" else value
+            lines.append(values)
+        return lines
+
+    def count_tokens(self, text):
+        return self.backend.count_tokens(text)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
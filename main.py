@@ -1,8 +1,7 @@
 from venv import logger
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_from_directory
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_from_directory, abort
 from authlib.integrations.flask_client import OAuth
 import requests
-import json
 import os
 import hashlib
 from datetime import datetime
@@ -10,16 +9,36 @@ import logging
 from dotenv import load_dotenv
 import logging
 import PyPDF2
-from functools import wraps
+from functools import wraps, partial
 from docx import Document
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from datetime import datetime,timedelta
-from bson import ObjectId
+from bson import Decimal128, ObjectId
+from flask.json.provider import DefaultJSONProvider
 from bs4 import BeautifulSoup
+import threading
+import click
+import time
 from flask_cors import CORS
 
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+import auth_report
+import batch_ingest
+import bulk_render
+import indexes
+import job_queue
+import llm_client
+import parse_cache
+import pdf_render
+import pdf_text
+import render_cache
+import service_auth_parser
+import typed_fields
+import unit_ledger
+from streaming import stream_cursor
+
 # Load environment variables
 load_dotenv()
 
@@ -34,6 +53,48 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 MONGO_URI = os.getenv('MONGO_URI')
 URL = 'https://www.revisor.mn.gov/statutes/cite/245D/full'
 MODE = os.getenv('MODE', 'production')
+AGGREGATE_STATS_TTL = int(os.getenv('AGGREGATE_STATS_TTL', '30'))  # Seconds to cache anonymous dashboard stats
+ROLLUP_MAX_AGE = int(os.getenv('ROLLUP_MAX_AGE', '900'))  # Seconds before the dashboard rollup is rebuilt in the background, 0 to rely on watch-rollups
+PDF_QUEUE_BACKEND = os.getenv('PDF_QUEUE_BACKEND', 'thread')  # 'thread' or 'inline'
+PDF_QUEUE_WORKERS = int(os.getenv('PDF_QUEUE_WORKERS', '4'))
+PARSE_CACHE_TTL = int(os.getenv('PARSE_CACHE_TTL', str(30 * 24 * 3600)))  # Seconds
+PARSE_CACHE_MAX_ENTRIES = int(os.getenv('PARSE_CACHE_MAX_ENTRIES', '10000'))
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '0')) or None  # Pages read per uploaded PDF, 0 for no cap
+LLM_CONTEXT_CHARS = int(os.getenv('LLM_CONTEXT_CHARS', '6000'))  # Document text budget per LLM prompt
+BATCH_EXTRACT_PROCESSES = int(os.getenv('BATCH_EXTRACT_PROCESSES', str(os.cpu_count() or 2)))
+BATCH_LLM_CONCURRENCY = int(os.getenv('BATCH_LLM_CONCURRENCY', '4'))
+BATCH_LLM_RATE = float(os.getenv('BATCH_LLM_RATE', '2'))  # LLM calls started per second
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '500'))  # PDFs (or zip entries) per batch upload
+BATCH_MAX_FILE_BYTES = int(os.getenv('BATCH_MAX_FILE_BYTES', str(16 * 1024 * 1024)))  # Per PDF, after unzipping
+BATCH_MAX_TOTAL_BYTES = int(os.getenv('BATCH_MAX_TOTAL_BYTES', str(128 * 1024 * 1024)))  # Whole batch, after unzipping
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(16 * 1024 * 1024)))  # Request body limit for every route but the PDF batch
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')  # 'openai' or 'fake' for offline load tests
+LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '30'))  # Seconds per attempt
+LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '3'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))  # In-flight LLM requests per process
+LLM_FAKE_LATENCY = float(os.getenv('LLM_FAKE_LATENCY', '0.5'))
+PDF_RENDER_ENGINE = os.getenv('PDF_RENDER_ENGINE', 'wkhtmltopdf')  # 'wkhtmltopdf' or 'fpdf'
+PDF_RENDER_FALLBACK = os.getenv('PDF_RENDER_FALLBACK', 'fpdf')  # Engine used when the primary fails, '' for none
+PDF_RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS', '4'))  # Concurrent renders per process
+PDF_RENDER_QUEUE = int(os.getenv('PDF_RENDER_QUEUE', '16'))  # Renders allowed to wait for a worker
+PDF_RENDER_TIMEOUT = float(os.getenv('PDF_RENDER_TIMEOUT', '60'))  # Seconds to wait for a rendered PDF
+WKHTMLTOPDF_PATH = os.getenv('WKHTMLTOPDF_PATH')  # Found on PATH when unset
+RENDER_CACHE_MAX_BYTES = int(os.getenv('RENDER_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))  # Rendered previews/PDFs kept per process
+EXPORT_PDF_SYNC_ROWS = int(os.getenv('EXPORT_PDF_SYNC_ROWS', '2000'))  # Larger reports run as background jobs
+EXPORT_RETENTION_HOURS = int(os.getenv('EXPORT_RETENTION_HOURS', '24'))  # Finished report files kept this long
+BULK_PDF_PROCESSES = int(os.getenv('BULK_PDF_PROCESSES', str(os.cpu_count() or 2)))
+BULK_PDF_MAX_DOCUMENTS = int(os.getenv('BULK_PDF_MAX_DOCUMENTS', '1000'))
+CALENDAR_SERVICE_CACHE_SIZE = int(os.getenv('CALENDAR_SERVICE_CACHE_SIZE', '256'))  # Users with a cached calendar client
+CALENDAR_SERVICE_MAX_AGE = int(os.getenv('CALENDAR_SERVICE_MAX_AGE', '3600'))  # Seconds before a client is rebuilt from the stored token
+CALENDAR_SYNC_MODE = os.getenv('CALENDAR_SYNC_MODE', 'thread')  # 'thread' syncs in the app process, 'external' leaves it to `flask sync-calendar`
+CALENDAR_SYNC_RATE = float(os.getenv('CALENDAR_SYNC_RATE', '5'))  # Calendar calls per second per process
+CALENDAR_SYNC_MAX_ATTEMPTS = int(os.getenv('CALENDAR_SYNC_MAX_ATTEMPTS', '6'))
+BULK_SHIFT_MAX_ITEMS = int(os.getenv('BULK_SHIFT_MAX_ITEMS', '500'))  # Shifts plus series per bulk request
+SHIFT_CONFLICT_MODE = os.getenv('SHIFT_CONFLICT_MODE', 'reject')  # 'reject', 'flag' (save and report) or 'off'
+SHIFT_CONFLICT_MAX_AGE = int(os.getenv('SHIFT_CONFLICT_MAX_AGE', '300'))  # Seconds before a staff schedule is reloaded
+SHIFT_TIME_ZONE = os.getenv('SHIFT_TIME_ZONE', 'UTC')  # IANA zone for shifts sent without a timeZone
+SCHEDULE_VIEW_TTL = int(os.getenv('SCHEDULE_VIEW_TTL', '30'))  # Seconds a built month/day calendar view is reused
 
 
 dummy_user = {
@@ -51,6 +112,8 @@ app.config['SESSION_COOKIE_NAME'] = 'google-login-session'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=60)  # Increased session lifetime
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
+# Large enough for a full PDF batch (plus multipart overhead); other routes are held to UPLOAD_MAX_BYTES below
+app.config['MAX_CONTENT_LENGTH'] = max(UPLOAD_MAX_BYTES, BATCH_MAX_TOTAL_BYTES + 1024 * 1024)
 
 app.logger.setLevel(logging.INFO)
 
@@ -58,6 +121,17 @@ app.logger.setLevel(logging.INFO)
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 
+@app.before_request
+def limit_upload_size():
+    if request.endpoint != 'extract_pdf_batch' and (request.content_length or 0) > UPLOAD_MAX_BYTES:
+        abort(413)
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": "Upload is too large"}), 413
+
+
 # MongoDB Setup
 client = MongoClient(os.getenv("MONGO_URI"))  # Use the MongoDB URI from the .env file
 db = client["test"]  # Replace with your database name
@@ -67,6 +141,42 @@ chats_collection = db["chats"]
 dashboard_stats_collection = db["dashboard_stats"]
 hashes_collection = db["hashes_new"]
 
+# Indexes for the hot collections are declared in indexes.py
+if os.getenv('ENSURE_INDEXES_ON_STARTUP', 'false').lower() == 'true':
+    try:
+        indexes.ensure_indexes(db)
+    except Exception as e:
+        app.logger.error(f"Error creating indexes on startup: {e}")
+
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Create the indexes declared in indexes.py (idempotent)."""
+    for collection_name, names in indexes.ensure_indexes(db).items():
+        print(f"{collection_name}: {', '.join(names)}")
+
+
+@app.cli.command('verify-indexes')
+def verify_indexes_command():
+    """Explain each route query and fail if any of them is a COLLSCAN."""
+    failures = indexes.verify_query_plans(db)
+    for route, collection_name, query in failures:
+        print(f"COLLSCAN: {route} on {collection_name} with {query}")
+    if failures:
+        raise SystemExit(1)
+    print("All route queries use an index")
+
+
+@app.cli.command('migrate-typed-fields')
+@click.option('--collection', 'collections', multiple=True, type=click.Choice(list(typed_fields.MIGRATIONS)),
+              help='Collection to migrate (repeatable, default all).')
+@click.option('--batch-size', default=typed_fields.BATCH_SIZE, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Count what would change without writing.')
+def migrate_typed_fields_command(collections, batch_size, dry_run):
+    """Rewrite string amounts, units and dates to Decimal128 and BSON dates."""
+    for name, summary in typed_fields.migrate(db, collections or None, batch_size, dry_run).items():
+        print(f"{name}: {summary}")
+
 
 
 oauth = OAuth(app)
@@ -113,13 +223,15 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-class JSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, ObjectId):
+class JSONProvider(DefaultJSONProvider):
+    # ObjectIds and Decimal128 values go out as strings
+    @staticmethod
+    def default(o):
+        if isinstance(o, (ObjectId, Decimal128)):
             return str(o)
-        return json.JSONEncoder.default(self, o)
+        return DefaultJSONProvider.default(o)
 
-app.json_encoder = JSONEncoder
+app.json = JSONProvider(app)
 
 @app.route('/login')
 def login():
@@ -170,6 +282,7 @@ def google_callback():
                 upsert=True
             )
             logger.info(f"User data updated: matched={result.matched_count}, modified={result.modified_count}, upserted_id={result.upserted_id}")
+            calendar_services.invalidate(user_data["email"])
         except Exception as e:
             logger.error(f"Error saving user data to MongoDB: {e}")
 
@@ -289,77 +402,89 @@ def initialize_new_user_dashboard_stats(user_email):
         upsert=True
     )
 
+REVENUE_PERIODS = ["this_month", "last_3_months", "last_6_months", "last_12_months", "lifetime"]
+DEFAULT_PAYERS = ["Medicare", "Medicaid", "Blue Cross"]
+
+_aggregate_stats_cache = {"stats": None, "expires_at": 0}
+_aggregate_stats_lock = threading.Lock()
+
+
 def get_aggregate_dashboard_stats():
-    """Get aggregate statistics from all users"""
-    # Use MongoDB aggregation to get totals
+    """Get aggregate statistics from all users, cached for AGGREGATE_STATS_TTL seconds"""
+    with _aggregate_stats_lock:
+        if _aggregate_stats_cache["stats"] is not None and time.monotonic() < _aggregate_stats_cache["expires_at"]:
+            return jsonify(_aggregate_stats_cache["stats"])
+
+    stats = compute_aggregate_dashboard_stats()
+
+    with _aggregate_stats_lock:
+        _aggregate_stats_cache["stats"] = stats
+        _aggregate_stats_cache["expires_at"] = time.monotonic() + AGGREGATE_STATS_TTL
+
+    return jsonify(stats)
+
+def compute_aggregate_dashboard_stats():
+    """Compute totals, average changes and revenue by payer across all users in one pipeline"""
     pipeline = [
         {
-            "$group": {
-                "_id": None,
-                "total_revenue": {"$sum": "$total_revenue"},
-                "total_claims": {"$sum": "$total_claims"},
-                "active_clients": {"$sum": "$active_clients"},
-                "staff_members": {"$sum": "$staff_members"},
-                "denied_claims": {"$sum": "$denied_claims"},
-                "voided_claims": {"$sum": "$voided_claims"},
-                "replaced_claims": {"$sum": "$replaced_claims"},
-                "payroll_total": {"$sum": "$payroll_total"},
-                "user_count": {"$sum": 1}
+            "$facet": {
+                "totals": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "total_revenue": {"$sum": "$total_revenue"},
+                            "total_claims": {"$sum": "$total_claims"},
+                            "active_clients": {"$sum": "$active_clients"},
+                            "staff_members": {"$sum": "$staff_members"},
+                            "denied_claims": {"$sum": "$denied_claims"},
+                            "voided_claims": {"$sum": "$voided_claims"},
+                            "replaced_claims": {"$sum": "$replaced_claims"},
+                            "payroll_total": {"$sum": "$payroll_total"},
+                            "user_count": {"$sum": 1},
+                            "avg_revenue_change": {"$avg": "$revenue_change"},
+                            "avg_claims_change": {"$avg": "$claims_change"},
+                            "avg_clients_change": {"$avg": "$clients_change"},
+                            "avg_staff_change": {"$avg": "$staff_change"}
+                        }
+                    }
+                ],
+                "revenue_by_payer": [
+                    {"$project": {"payers": {"$objectToArray": {"$ifNull": ["$revenue_by_payer", {}]}}}},
+                    {"$unwind": "$payers"},
+                    {"$project": {"payer": "$payers.k", "periods": {"$objectToArray": "$payers.v"}}},
+                    {"$unwind": "$periods"},
+                    {
+                        "$group": {
+                            "_id": {"payer": "$payer", "period": "$periods.k"},
+                            "amount": {"$sum": "$periods.v"}
+                        }
+                    }
+                ]
             }
         }
     ]
-    
+
     result = list(dashboard_stats_collection.aggregate(pipeline))
-    
-    if result and len(result) > 0:
-        agg_stats = result[0]
-        
-        # Calculate average changes (simplified approach)
-        avg_changes_pipeline = [
-            {
-                "$group": {
-                    "_id": None,
-                    "avg_revenue_change": {"$avg": "$revenue_change"},
-                    "avg_claims_change": {"$avg": "$claims_change"},
-                    "avg_clients_change": {"$avg": "$clients_change"},
-                    "avg_staff_change": {"$avg": "$staff_change"}
-                }
-            }
-        ]
-        
-        avg_changes = list(dashboard_stats_collection.aggregate(avg_changes_pipeline))
-        changes = avg_changes[0] if avg_changes else {
-            "avg_revenue_change": 0,
-            "avg_claims_change": 0,
-            "avg_clients_change": 0,
-            "avg_staff_change": 0
-        }
-        
-        # Aggregate revenue by payer data
-        # This is more complex, but let's create a simplified version
+    agg_stats = result[0]["totals"][0] if result and result[0]["totals"] else None
+
+    if agg_stats:
         revenue_by_payer = {
-            "Medicare": {"this_month": 0, "last_3_months": 0, "last_6_months": 0, "last_12_months": 0, "lifetime": 0},
-            "Medicaid": {"this_month": 0, "last_3_months": 0, "last_6_months": 0, "last_12_months": 0, "lifetime": 0},
-            "Blue Cross": {"this_month": 0, "last_3_months": 0, "last_6_months": 0, "last_12_months": 0, "lifetime": 0}
+            payer: {period: 0 for period in REVENUE_PERIODS} for payer in DEFAULT_PAYERS
         }
-        
-        # Collect all user data to calculate payer totals
-        all_users = dashboard_stats_collection.find({})
-        for user_data in all_users:
-            if "revenue_by_payer" in user_data:
-                for payer, periods in user_data["revenue_by_payer"].items():
-                    for period, amount in periods.items():
-                        revenue_by_payer[payer][period] += amount
-        
-        return jsonify({
+        for entry in result[0]["revenue_by_payer"]:
+            payer = entry["_id"]["payer"]
+            period = entry["_id"]["period"]
+            revenue_by_payer.setdefault(payer, {p: 0 for p in REVENUE_PERIODS})[period] = entry["amount"]
+
+        return {
             "total_revenue": agg_stats.get("total_revenue", 0),
-            "revenue_change": round(changes.get("avg_revenue_change", 0), 1),
+            "revenue_change": round(agg_stats.get("avg_revenue_change") or 0, 1),
             "total_claims": agg_stats.get("total_claims", 0),
-            "claims_change": round(changes.get("avg_claims_change", 0), 1),
+            "claims_change": round(agg_stats.get("avg_claims_change") or 0, 1),
             "active_clients": agg_stats.get("active_clients", 0),
-            "clients_change": round(changes.get("avg_clients_change", 0), 1),
+            "clients_change": round(agg_stats.get("avg_clients_change") or 0, 1),
             "staff_members": agg_stats.get("staff_members", 0),
-            "staff_change": round(changes.get("avg_staff_change", 0), 1),
+            "staff_change": round(agg_stats.get("avg_staff_change") or 0, 1),
             "denied_claims": agg_stats.get("denied_claims", 0),
             "voided_claims": agg_stats.get("voided_claims", 0),
             "replaced_claims": agg_stats.get("replaced_claims", 0),
@@ -367,10 +492,10 @@ def get_aggregate_dashboard_stats():
             "payroll_total": agg_stats.get("payroll_total", 0),
             "revenue_by_payer": revenue_by_payer,
             "user_count": agg_stats.get("user_count", 0)
-        })
+        }
     else:
         # Fallback to sample data if no users exist yet
-        return jsonify({
+        return {
             "total_revenue": 1236742,
             "revenue_change": 5.8,
             "total_claims": 1425,
@@ -408,7 +533,7 @@ def get_aggregate_dashboard_stats():
                 }
             },
             "user_count": 0
-        })
+        }
     
 
 @app.route('/dashboard')
@@ -497,127 +622,448 @@ def serve_static(filename):
     return send_from_directory(app.static_folder, filename)
 
 
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+import google_calendar
+
+calendar_services = google_calendar.CalendarServiceCache(
+    users_collection,
+    GOOGLE_CLIENT_ID,
+    GOOGLE_CLIENT_SECRET,
+    max_entries=CALENDAR_SERVICE_CACHE_SIZE,
+    max_age=CALENDAR_SERVICE_MAX_AGE
+)
 
 def get_google_calendar_service(user_email):
-    """Retrieve OAuth token from MongoDB and create a Google Calendar API service."""
-    user = users_collection.find_one({"email": user_email})
-    if not user or "oauth_token" not in user:
-        raise ValueError("User not authenticated with Google")
-
-    token_data = user["oauth_token"]
-
-    creds = Credentials(
-        token=token_data["access_token"],
-        refresh_token=token_data.get("refresh_token"),
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=GOOGLE_CLIENT_ID,
-        client_secret=GOOGLE_CLIENT_SECRET
-    )
+    """Return the user's cached Google Calendar API service, building it from the stored OAuth token."""
+    return calendar_services.get(user_email)
 
-    return build('calendar', 'v3', credentials=creds)
+
+@app.route('/api/calendar-services/stats', methods=['GET'])
+@login_required
+def calendar_service_stats():
+    """
+    Hit rate, size and token refresh counts of the calendar client cache.
+    """
+    return jsonify(calendar_services.stats()), 200
 
 
 
 
 from bson import ObjectId
 shifts_collection = db["shifts"]
+shift_series_collection = db["shift_series"]
+
+import calendar_sync
+import shift_conflicts
+import shift_series
+
+calendar_outbox = db["calendar_outbox"]
+calendar_sync_worker = calendar_sync.CalendarSync(
+    shifts_collection,
+    calendar_outbox,
+    calendar_services,
+    series=shift_series_collection,
+    rate=CALENDAR_SYNC_RATE,
+    max_attempts=CALENDAR_SYNC_MAX_ATTEMPTS
+)
+
+@app.before_request
+def start_calendar_sync():
+    # Started by the first request a process serves, so CLI commands and
+    # scripts that import main never run a sync thread of their own
+    if CALENDAR_SYNC_MODE == 'thread' and calendar_sync_worker.thread is None:
+        calendar_sync_worker.start()
+
+
+shift_conflict_index = shift_conflicts.ConflictIndex(
+    shifts_collection,
+    shift_series_collection,
+    max_age=SHIFT_CONFLICT_MAX_AGE
+)
+
+SHIFT_FIELDS = {
+    # request key -> shift field
+    'title': 'title',
+    'description': 'description',
+    'recipientEmail': 'recipient_email',
+    # 245D Compliance Fields
+    'staffName': 'staff_name',
+    'staffEmail': 'staff_email',
+    'serviceType': 'service_type',
+    'clockIn': 'clock_in',
+    'clockOut': 'clock_out',
+    'internalNotes': 'internal_notes',
+}
+
+def shift_updates(data):
+    """
+    Shift fields present in a request body, with start/end as datetimes.
+    Raises ValueError (typed_fields.ConversionError included) for
+    unreadable times or an unknown timeZone.
+    """
+    updates = {field: data[key] for key, field in SHIFT_FIELDS.items() if key in data}
+    for key in ('start', 'end'):
+        if key in data:
+            updates[key] = typed_fields.to_datetime(data[key])
+    if data.get('timeZone'):
+        shift_series.zone(data['timeZone'])
+        updates['time_zone'] = data['timeZone']
+    return updates
+
+def shift_conflicts_for(item, ignore=None):
+    """
+    Overlapping shifts for the same staff member, checked against the
+    database since the item is about to be saved. In 'flag' mode they are
+    also stored on the item.
+    """
+    if SHIFT_CONFLICT_MODE == shift_conflicts.OFF:
+        return []
+    conflicts = shift_conflict_index.conflicts(item, ignore=ignore, fresh=True)
+    if SHIFT_CONFLICT_MODE == shift_conflicts.FLAG:
+        item["conflicts"] = conflicts
+    return conflicts
+
+def check_shift_times(shift):
+    """
+    Raise ValueError for a shift that ends before it starts or lasts longer
+    than shift_conflicts.MAX_SHIFT; the conflict check before a write only
+    looks that far back.
+    """
+    start, end = shift.get("start"), shift.get("end")
+    if not isinstance(start, datetime) or not isinstance(end, datetime):
+        return
+    if end <= start:
+        raise ValueError("end must be after start")
+    if end - start > shift_conflicts.MAX_SHIFT:
+        raise ValueError(f"A shift can last at most {shift_conflicts.MAX_SHIFT.days} days")
+
+def new_shift(data, user_email):
+    """
+    Shift document for a request body, not yet saved. Raises ValueError
+    (ConversionError included) for missing or unreadable fields.
+    """
+    shift = shift_updates(data)
+    if not shift.get('start') or not shift.get('end'):
+        raise ValueError("start and end are required")
+    check_shift_times(shift)
+    shift.setdefault('title', 'New Shift')
+    shift.setdefault('description', '')
+    shift.setdefault('time_zone', SHIFT_TIME_ZONE)
+    shift.update({
+        "_id": ObjectId(),
+        "user_email": user_email,
+        "event_link": None,
+        "calendar_status": calendar_sync.PENDING,
+    })
+    return shift
+
+def new_shift_series(data, user_email):
+    """
+    Series document for a request body with a 'rule' (see
+    shift_series.parse_rule), optional 'cancelled' occurrence starts and an
+    IANA 'timeZone' the rule repeats in.
+    """
+    shift = new_shift(data, user_email)
+    rule = shift_series.parse_rule(data.get('rule'), shift['time_zone'])
+    series = shift_series.new_series(shift, rule, data.get('cancelled') or ())
+    series["_id"] = shift["_id"]
+    return series
 
 @app.route('/add-shift', methods=['POST'])
 def add_shift():
-    """Create a Google Calendar event using the user's stored OAuth token and save in MongoDB."""
+    """Save a shift and queue its Google Calendar invite."""
     try:
         user_email = session.get('user', {}).get('email')
         if not user_email:
             return jsonify({"error": "User not logged in"}), 401
 
-        # Get Google Calendar API service
-        service = get_google_calendar_service(user_email)
-
-        # Extract form data
-        data = request.json
-        title = data.get('title', 'New Shift')
-        start_time = data.get('start')
-        end_time = data.get('end')
-        description = data.get('description', '')
-        recipient_email = data.get('recipientEmail')
-
-        # 245D Compliance Fields
-        staff_name = data.get('staffName')
-        staff_email = data.get('staffEmail')
-        service_type = data.get('serviceType')
-        clock_in = data.get('clockIn')
-        clock_out = data.get('clockOut')
-        internal_notes = data.get('internalNotes')
-
-        event = {
-            'summary': title,
-            'description': description,
-            'start': {'dateTime': start_time, 'timeZone': 'UTC'},
-            'end': {'dateTime': end_time, 'timeZone': 'UTC'},
-            'attendees': [{'email': recipient_email}],
-        }
+        try:
+            shift = new_shift(request.json, user_email)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Insert event into Google Calendar
-        event_result = service.events().insert(calendarId='primary', body=event, sendUpdates='all').execute()
-        event_link = event_result.get('htmlLink')
-
-        # Store in MongoDB with 245D Compliance Data
-        shift_id = shifts_collection.insert_one({
-            "title": title,
-            "start": start_time,
-            "end": end_time,
-            "description": description,
-            "recipient_email": recipient_email,
-            "user_email": user_email,
-            "event_link": event_link,
+        with shift_conflict_index.lock:
+            conflicts = shift_conflicts_for(shift)
+            if conflicts and SHIFT_CONFLICT_MODE == shift_conflicts.REJECT:
+                return jsonify({"error": "Shift overlaps another shift for this staff member",
+                                "conflicts": conflicts}), 409
 
-            # 245D Compliance Fields
-            "staff_name": staff_name,
-            "staff_email": staff_email,
-            "service_type": service_type,
-            "clock_in": clock_in,
-            "clock_out": clock_out,
-            "internal_notes": internal_notes
-        }).inserted_id
+            # Outbox first: if the shift insert then fails, the record syncs nothing
+            calendar_sync_worker.enqueue(shift["_id"], user_email)
+            shift_id = shifts_collection.insert_one(shift).inserted_id
+            shift_conflict_index.add(shift)
 
-        return jsonify({"message": "Shift created and invite sent!", "eventLink": event_link, "shift_id": str(shift_id)})
+        return jsonify({
+            "message": "Shift created; the calendar invite will be sent shortly.",
+            "eventLink": None,
+            "calendarStatus": calendar_sync.PENDING,
+            "shift_id": str(shift_id),
+            "conflicts": conflicts
+        })
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/add-shifts/bulk', methods=['POST'])
+@login_required
+def add_shifts_bulk():
+    """
+    Save many shifts and recurring series at once and queue their calendar
+    events in one outbox write. Body: {"shifts": [...], "series": [...]},
+    where each series is a shift plus a "rule". Nothing is saved if any
+    item is invalid.
+    """
+    user_email = session.get('user', {}).get('email')
+    data = request.json or {}
+    shift_items = data.get('shifts') or []
+    series_items = data.get('series') or []
+    if not shift_items and not series_items:
+        return jsonify({"error": "No shifts or series provided"}), 400
+    if len(shift_items) + len(series_items) > BULK_SHIFT_MAX_ITEMS:
+        return jsonify({"error": f"At most {BULK_SHIFT_MAX_ITEMS} shifts and series per request"}), 400
+
+    try:
+        shifts, series, labels = build_shift_batch(shift_items, series_items, user_email)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with shift_conflict_index.lock:
+        conflicts = batch_conflicts(shifts + series, labels)
+        if conflicts and SHIFT_CONFLICT_MODE == shift_conflicts.REJECT:
+            return jsonify({"error": "Some shifts overlap other shifts for the same staff member",
+                            "conflicts": conflicts}), 409
+
+        try:
+            calendar_sync_worker.enqueue_many(
+                [(shift["_id"], user_email, None, calendar_sync.SHIFT) for shift in shifts] +
+                [(item["_id"], user_email, None, calendar_sync.SERIES) for item in series]
+            )
+            if shifts:
+                shifts_collection.insert_many(shifts, ordered=False)
+            if series:
+                shift_series_collection.insert_many(series, ordered=False)
+        except Exception as e:
+            print(f"Error saving bulk shifts: {e}")
+            return jsonify({"error": str(e)}), 500
+        for item in shifts + series:
+            shift_conflict_index.add(item)
+
+    return jsonify({
+        "message": "Shifts created; calendar invites will be sent shortly.",
+        "shift_ids": [str(shift["_id"]) for shift in shifts],
+        "series_ids": [str(item["_id"]) for item in series],
+        "calendarStatus": calendar_sync.PENDING,
+        "conflicts": conflicts
+    }), 201
+
+
+@app.route('/api/shifts/validate', methods=['POST'])
+@login_required
+def validate_shifts():
+    """
+    Check an imported schedule for double bookings without saving it.
+    Same body as /add-shifts/bulk.
+    """
+    data = request.json or {}
+    try:
+        shifts, series, labels = build_shift_batch(data.get('shifts') or [], data.get('series') or [],
+                                                   session.get('user', {}).get('email'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    conflicts = batch_conflicts(shifts + series, labels, store=False)
+    return jsonify({"valid": not conflicts, "checked": len(labels), "conflicts": conflicts}), 200
+
+
+def build_shift_batch(shift_items, series_items, user_email):
+    """
+    Shift and series documents for a bulk request, and a label per item
+    ('shifts[0]', 'series[2]', ...). Raises ValueError naming the bad item.
+    """
+    shifts, series, labels = [], [], []
+    for name, items, build_item, out in (('shifts', shift_items, new_shift, shifts),
+                                        ('series', series_items, new_shift_series, series)):
+        for index, item in enumerate(items):
+            try:
+                out.append(build_item(item, user_email))
+            except ValueError as e:
+                raise ValueError(f"{name}[{index}]: {e}")
+            labels.append(f"{name}[{index}]")
+    return shifts, series, labels
+
+
+def batch_conflicts(items, labels, store=True):
+    """
+    [{'item': label, 'conflicts': [...]}] for the items that overlap stored
+    shifts or each other. With ``store`` the items are about to be saved:
+    each staff member is checked against the database rather than the warm
+    index and, in 'flag' mode, the conflicts are stored on the items.
+    """
+    if SHIFT_CONFLICT_MODE == shift_conflicts.OFF and store:
+        return []
+    report = []
+    for label, item, found in zip(labels, items, shift_conflict_index.validate_batch(items, fresh=store)):
+        for conflict in found:
+            if 'batchIndex' in conflict:
+                conflict['batchItem'] = labels[conflict.pop('batchIndex')]
+        if store and SHIFT_CONFLICT_MODE == shift_conflicts.FLAG:
+            item["conflicts"] = found
+        if found:
+            report.append({"item": label, "conflicts": found})
+    return report
+
+
+def find_occurrence(occurrence_id):
+    """
+    (series, occurrence start) for an occurrence id of an existing,
+    uncancelled occurrence, or (None, None).
+    """
+    parsed = shift_series.parse_occurrence_id(occurrence_id)
+    if not parsed:
+        return None, None
+    series_id, start = parsed
+    series = shift_series_collection.find_one({"_id": series_id})
+    if not series or start in series.get("cancelled", []):
+        return None, None
+    if next(shift_series.occurrences(series, start, None), None) != start:
+        return None, None
+    return series, start
+
+def cancel_occurrence(series, start, extra_outbox=()):
+    """
+    Drop one occurrence from a series and queue the series' calendar update.
+    """
+    calendar_sync_worker.enqueue_many(
+        [(series["_id"], series["user_email"], None, calendar_sync.SERIES)] + list(extra_outbox)
+    )
+    shift_series_collection.update_one(
+        {"_id": series["_id"]},
+        {"$addToSet": {"cancelled": start}, "$set": {"calendar_status": calendar_sync.PENDING}}
+    )
+
+
+@app.route('/update-shift/<shift_id>', methods=['PUT'])
+@login_required
+def update_shift(shift_id):
+    """
+    Update a shift and queue the change for its Google Calendar event.
+    """
+    try:
+        updates = shift_updates(request.json or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not updates:
+        return jsonify({"error": "No shift fields to update"}), 400
+
+    if shift_series.parse_occurrence_id(shift_id):
+        # Editing one occurrence detaches it from its series as an ordinary shift
+        series, start = find_occurrence(shift_id)
+        if not series:
+            return jsonify({"error": "Shift not found"}), 404
+        shift = shift_series.occurrence(series, start)
+        shift.update(updates)
+        shift.update({
+            "_id": ObjectId(),
+            "occurrence": start,
+            "event_link": None,
+            "calendar_status": calendar_sync.PENDING,
+        })
+        try:
+            check_shift_times(shift)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        with shift_conflict_index.lock:
+            conflicts = shift_conflicts_for(shift, ignore=shift_id)
+            if conflicts and SHIFT_CONFLICT_MODE == shift_conflicts.REJECT:
+                return jsonify({"error": "Shift overlaps another shift for this staff member",
+                                "conflicts": conflicts}), 409
+            cancel_occurrence(series, start, [(shift["_id"], series["user_email"], None, calendar_sync.SHIFT)])
+            shifts_collection.insert_one(shift)
+            # The series changed too: reload its staff schedules
+            shift_conflict_index.invalidate(series.get("staff_email"))
+            shift_conflict_index.invalidate(shift.get("staff_email"))
+        return jsonify({
+            "message": "Shift updated",
+            "shift_id": str(shift["_id"]),
+            "calendarStatus": calendar_sync.PENDING,
+            "conflicts": conflicts
+        }), 200
+
+    shift = shifts_collection.find_one({"_id": ObjectId(shift_id)})
+    if not shift:
+        return jsonify({"error": "Shift not found"}), 404
+    updated = dict(shift, **updates)
+    try:
+        check_shift_times(updated)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with shift_conflict_index.lock:
+        conflicts = shift_conflicts_for(updated, ignore=shift["_id"])
+        if conflicts and SHIFT_CONFLICT_MODE == shift_conflicts.REJECT:
+            return jsonify({"error": "Shift overlaps another shift for this staff member",
+                            "conflicts": conflicts}), 409
+        if "conflicts" in updated:
+            updates["conflicts"] = updated["conflicts"]
+        calendar_sync_worker.enqueue(shift["_id"], shift["user_email"])
+        updates["calendar_status"] = calendar_sync.PENDING
+        shifts_collection.update_one({"_id": shift["_id"]}, {"$set": updates})
+        shift_conflict_index.remove(shift["_id"], shift.get("staff_email"))
+        shift_conflict_index.add(updated)
+    return jsonify({"message": "Shift updated", "calendarStatus": calendar_sync.PENDING, "conflicts": conflicts}), 200
+
+
 @app.route('/get-shifts', methods=['GET'])
 @login_required
 def get_shifts():
     """
     Fetch shifts for the logged-in user based on the provided date range.
     """
-    start = request.args.get('start')
-    end = request.args.get('end')
     user_email = session.get('user', {}).get('email')
 
     if not user_email:
         return jsonify({"error": "User not logged in."}), 401
 
-    # Query the database for shifts within the specified date range
-    shifts = shifts_collection.find({
+    try:
+        start = typed_fields.to_datetime(request.args.get('start'))
+        end = typed_fields.to_datetime(request.args.get('end'))
+    except typed_fields.ConversionError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Query the database for shifts within the specified date range. Shifts
+    # saved before migrate-typed-fields still hold the ISO strings the client
+    # sent; string bounds only match strings, as the route did before
+    shifts = []
+    for shift in shifts_collection.find({
         "user_email": user_email,
-        "start": {"$gte": start},
-        "end": {"$lte": end}
-    })
+        "$or": [
+            {"start": {"$gte": start}, "end": {"$lte": end}},
+            {"start": {"$gte": request.args.get('start')}, "end": {"$lte": request.args.get('end')}}
+        ]
+    }):
+        try:
+            shift["start"] = typed_fields.to_datetime(shift.get("start"))
+            shift["end"] = typed_fields.to_datetime(shift.get("end"))
+        except typed_fields.ConversionError as e:
+            print(f"Skipping shift {shift['_id']}: {e}")
+            continue
+        shifts.append(shift)
+    # Recurring series are expanded for the requested window only
+    if start and end:
+        for series in shift_series_collection.find(shift_series.window_filter(user_email, start, end)):
+            shifts.extend(shift_series.expand(series, start, end))
+        shifts.sort(key=lambda shift: shift["start"])
 
     # Format the shifts for the calendar, including 245D Compliance Data
     formatted_shifts = []
     for shift in shifts:
         formatted_shifts.append({
             "id": str(shift["_id"]),  # Include the shift ID
+            "seriesId": str(shift["series_id"]) if shift.get("series_id") else None,
             "title": shift["title"],
-            "start": shift["start"],
-            "end": shift["end"],
+            "start": typed_fields.isoformat_utc(shift["start"]),
+            "end": typed_fields.isoformat_utc(shift["end"]),
             "description": shift.get("description", ""),
-            "eventLink": shift.get("event_link", "#"),  # Link to Google Calendar event
+            "eventLink": shift.get("event_link") or "#",  # Link to Google Calendar event
+            "calendarStatus": shift.get("calendar_status", calendar_sync.SYNCED),
             
             # 245D Compliance Data
             "staffName": shift.get("staff_name", "N/A"),
@@ -635,12 +1081,64 @@ def get_shifts():
 @login_required
 def delete_shift(shift_id):
     """
-    Delete a shift from the database.
+    Delete a shift from the database and queue the deletion of its calendar
+    event. For an occurrence of a series, only that occurrence is cancelled.
     """
-    shifts_collection.delete_one({"_id": ObjectId(shift_id)})
+    if shift_series.parse_occurrence_id(shift_id):
+        series, start = find_occurrence(shift_id)
+        if series:
+            cancel_occurrence(series, start)
+            shift_conflict_index.invalidate(series.get("staff_email"))
+        return jsonify({"message": "Shift deleted successfully"}), 200
+
+    shift = shifts_collection.find_one({"_id": ObjectId(shift_id)},
+                                       {"user_email": 1, "staff_email": 1, "event_id": 1, "event_link": 1})
+    if shift:
+        event_id = (shift.get("event_id")
+                    or calendar_sync.event_id_from_link(shift.get("event_link"))
+                    or calendar_sync.calendar_event_id(shift["_id"]))
+        calendar_sync_worker.enqueue(shift["_id"], shift["user_email"], event_id=event_id)
+        shifts_collection.delete_one({"_id": shift["_id"]})
+        shift_conflict_index.remove(shift["_id"], shift.get("staff_email"))
     return jsonify({"message": "Shift deleted successfully"}), 200
 
 
+@app.route('/shift-series/<series_id>', methods=['DELETE'])
+@login_required
+def delete_shift_series(series_id):
+    """
+    Delete a recurring series and queue the deletion of its calendar event.
+    Occurrences already detached as their own shifts are kept.
+    """
+    series = shift_series_collection.find_one({"_id": ObjectId(series_id)},
+                                              {"user_email": 1, "staff_email": 1, "event_id": 1})
+    if not series:
+        return jsonify({"error": "Series not found"}), 404
+    event_id = series.get("event_id") or calendar_sync.calendar_event_id(series["_id"])
+    calendar_sync_worker.enqueue(series["_id"], series["user_email"], event_id=event_id, kind=calendar_sync.SERIES)
+    shift_series_collection.delete_one({"_id": series["_id"]})
+    shift_conflict_index.remove(series["_id"], series.get("staff_email"))
+    return jsonify({"message": "Series deleted successfully"}), 200
+
+
+@app.route('/api/calendar-sync/stats', methods=['GET'])
+@login_required
+def calendar_sync_stats():
+    """
+    Outbox records by status and the age of the oldest unsent change.
+    """
+    return jsonify(calendar_sync_worker.stats()), 200
+
+
+@app.route('/api/shift-conflicts/stats', methods=['GET'])
+@login_required
+def shift_conflict_stats():
+    """
+    Staff schedules held by the conflict index and check counts.
+    """
+    return jsonify(shift_conflict_index.stats()), 200
+
+
 
 
 
@@ -661,27 +1159,34 @@ def create_invoice():
         "total": data.get('total'),
         "status": "Pending"
     }
+    try:
+        # Stored typed so totals can be summed and dates ranged over in MongoDB
+        invoice["service_date"] = typed_fields.to_datetime(invoice["service_date"])
+        for field in ("sub_total", "discount", "total"):
+            invoice[field] = typed_fields.to_decimal(invoice[field])
+    except typed_fields.ConversionError as e:
+        return jsonify({"error": str(e)}), 400
     invoices_collection.insert_one(invoice)
     return jsonify({"message": "Invoice created successfully"})
 
 @app.route('/get-invoices', methods=['GET'])
 @login_required
 def get_invoices():
-    invoices = invoices_collection.find()
-    formatted_invoices = []
-    for invoice in invoices:
-        formatted_invoices.append({
+    def format_invoice(invoice):
+        service_date = invoice["service_date"]
+        return {
             "client_name": invoice["client_name"],
             "service_type": invoice["service_type"],
-            "service_date": invoice["service_date"],
+            "service_date": service_date.strftime('%Y-%m-%d') if isinstance(service_date, datetime) else service_date,
             "service_location": invoice["service_location"],
             "items": invoice["items"],
-            "sub_total": invoice["sub_total"],
-            "discount": invoice["discount"],
-            "total": invoice["total"],
+            "sub_total": typed_fields.decimal_to_float(invoice["sub_total"]),
+            "discount": typed_fields.decimal_to_float(invoice["discount"]),
+            "total": typed_fields.decimal_to_float(invoice["total"]),
             "status": invoice["status"]
-        })
-    return jsonify(formatted_invoices)
+        }
+
+    return stream_cursor(invoices_collection.find({}, {"_id": 0}), format_invoice)
 
 @app.route('/billing', methods=['GET'])
 def billing():
@@ -756,247 +1261,239 @@ def add_employee():
     user = session.get('user')
     return render_template('add-employee.html', user=user)
 
-from flask import Flask, render_template, request, send_file, jsonify
-import pdfkit
+from flask import Flask, Response, render_template, request, send_file, jsonify, stream_with_context
 import io
 import os
 import base64
 from datetime import datetime
 
+# Bounded pool of render workers, started once per process
+pdf_renderer = pdf_render.RenderService(
+    pdf_render.create_engine(PDF_RENDER_ENGINE, binary=WKHTMLTOPDF_PATH),
+    fallback=pdf_render.create_engine(PDF_RENDER_FALLBACK) if PDF_RENDER_FALLBACK else None,
+    workers=PDF_RENDER_WORKERS,
+    max_queue=PDF_RENDER_QUEUE
+)
+pdf_renderer.warm()
+
+# Rendered HTML/PDF for repeated previews of the same form
+document_cache = render_cache.RenderCache(
+    os.path.join(app.root_path, app.template_folder, 'pdf_template.html'),
+    max_bytes=RENDER_CACHE_MAX_BYTES
+)
+
+
+def render_document_html(fields, key=None):
+    key = key or render_cache.fields_key(fields)
+    html = document_cache.get(render_cache.HTML, key)
+    if html is None:
+        html = render_template('pdf_template.html', **fields)
+        document_cache.put(render_cache.HTML, key, html)
+    return html
+
+
 @app.route('/preview_pdf', methods=['POST'])
 def preview_pdf():
-    # Get form data
-    client_name = request.form.get('client_name', '')
-    document_type = request.form.get('document_type', '')
-    program_name = request.form.get('program_name', '')
-    print_name_title = request.form.get('print_name_title', '')
-    date_review = request.form.get('date_review', '')
-    date_revision = request.form.get('date_revision', '')
-    signature = request.form.get('signature', '')
-    
-    # Remove header from base64 encoded signature if present
-    if signature and ',' in signature:
-        signature = signature.split(',')[1]
-    
     # Create HTML content for preview
-    html_content = render_template(
-        'pdf_template.html',
-        client_name=client_name,
-        document_type=document_type,
-        program_name=program_name,
-        print_name_title=print_name_title,
-        date_review=date_review,
-        date_revision=date_revision,
-        signature=signature
-    )
-    
-    return html_content
+    return render_document_html(pdf_render.document_fields(request.form))
 
 @app.route('/generate_pdf', methods=['POST'])
 def generate_pdf():
-    # Get form data
-    client_name = request.form.get('client_name', '')
-    document_type = request.form.get('document_type', '')
-    program_name = request.form.get('program_name', '')
-    print_name_title = request.form.get('print_name_title', '')
-    date_review = request.form.get('date_review', '')
-    date_revision = request.form.get('date_revision', '')
-    signature = request.form.get('signature', '')
-    
-    # Remove header from base64 encoded signature if present
-    if signature and ',' in signature:
-        signature = signature.split(',')[1]
-    
-    # Create HTML content for PDF
-    html_content = render_template(
-        'pdf_template.html',
-        client_name=client_name,
-        document_type=document_type,
-        program_name=program_name,
-        print_name_title=print_name_title,
-        date_review=date_review,
-        date_revision=date_revision,
-        signature=signature
-    )
-    
-    # Configure pdfkit options
-    options = {
-        'page-size': 'A4',
-        'margin-top': '0.75in',
-        'margin-right': '0.75in',
-        'margin-bottom': '0.75in',
-        'margin-left': '0.75in',
-        'encoding': 'UTF-8',
-    }
-    
+    fields = pdf_render.document_fields(request.form)
+    key = render_cache.fields_key(fields)
+
     # Convert HTML to PDF
     try:
-        # Note: For Windows, you may need to specify the path to wkhtmltopdf
-        # config = pdfkit.configuration(wkhtmltopdf='C:\\Program Files\\wkhtmltopdf\\bin\\wkhtmltopdf.exe')
-        # pdf = pdfkit.from_string(html_content, False, options=options, configuration=config)
-        
-        pdf = pdfkit.from_string(html_content, False, options=options)
-        
+        pdf = document_cache.get(render_cache.PDF, key)
+        if pdf is None:
+            # Note: For Windows, set WKHTMLTOPDF_PATH to the wkhtmltopdf executable
+            pdf = pdf_renderer.render(render_document_html(fields, key), fields, timeout=PDF_RENDER_TIMEOUT)
+            document_cache.put(render_cache.PDF, key, pdf)
+
         # Create a BytesIO object
         pdf_io = io.BytesIO(pdf)
         pdf_io.seek(0)
-        
-        # Gen+erate a filename based on client name and document type
-        filename = f"{client_name.split()[0]}_{document_type.split()[0]}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-        
+
         return send_file(
             pdf_io,
             mimetype='application/pdf',
-            download_name=filename,
+            download_name=pdf_render.document_filename(fields),
             as_attachment=True
         )
+    except pdf_render.RenderBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@app.route('/generate_pdf/batch', methods=['POST'])
+def generate_pdf_batch():
+    """
+    Render many policy documents in one request.
+
+    Body: {"documents": [{client_name, document_type, ...}, ...],
+           "defaults": {fields shared by every document},
+           "format": "zip" (default) or "pdf" for one merged PDF}
+    """
+    data = request.get_json(silent=True) or {}
+    documents = data.get('documents')
+    output_format = data.get('format', 'zip')
+    if not isinstance(documents, list) or not documents:
+        return jsonify({'error': 'documents must be a non-empty list'}), 400
+    if len(documents) > BULK_PDF_MAX_DOCUMENTS:
+        return jsonify({'error': f'At most {BULK_PDF_MAX_DOCUMENTS} documents per request'}), 400
+    if output_format not in ('zip', 'pdf'):
+        return jsonify({'error': "format must be 'zip' or 'pdf'"}), 400
+
+    defaults = data.get('defaults') or {}
+    if not isinstance(defaults, dict):
+        return jsonify({'error': 'defaults must be an object'}), 400
+    for index, document in enumerate(documents):
+        if not isinstance(document, dict):
+            return jsonify({'error': f'documents[{index}] must be an object'}), 400
+    fields_list = [pdf_render.document_fields({**defaults, **document}) for document in documents]
+    # Numbered so two documents for the same client never collide
+    filenames = [f"{index + 1:04d}_{pdf_render.document_filename(fields)}" for index, fields in enumerate(fields_list)]
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+
+    # HTML is rendered lazily, as the process pool asks for more work
+    rendered = bulk_render.render_many(
+        ((render_template('pdf_template.html', **fields), fields) for fields in fields_list),
+        PDF_RENDER_ENGINE,
+        fallback_name=PDF_RENDER_FALLBACK or None,
+        binary=WKHTMLTOPDF_PATH,
+        processes=BULK_PDF_PROCESSES
+    )
+
+    try:
+        if output_format == 'zip':
+            return Response(
+                stream_with_context(bulk_render.stream_zip(rendered, filenames)),
+                mimetype='application/zip',
+                headers={'Content-Disposition': f'attachment; filename=documents_{stamp}.zip'}
+            )
+
+        merged, errors = bulk_render.merge_to_file(rendered)
+        if len(errors) == len(fields_list):
+            merged.close()
+            return jsonify({'error': 'No documents could be rendered', 'errors': errors}), 500
+        return Response(
+            bulk_render.iter_file(merged),
+            mimetype='application/pdf',
+            headers={
+                'Content-Disposition': f'attachment; filename=documents_{stamp}.pdf',
+                'X-Failed-Documents': ','.join(str(error['index']) for error in errors)
+            }
+        )
+    except Exception as e:
+        print(f"Error generating document batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/pdf-render/stats', methods=['GET'])
+def pdf_render_stats():
+    return jsonify(pdf_renderer.stats())
+
+
+@app.route('/api/render-cache/stats', methods=['GET'])
+def render_cache_stats():
+    return jsonify(document_cache.stats())
     
 
 from flask import Flask, request, jsonify, send_file
 
 import os
-import json
 import uuid
 import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import PyPDF2
 import io
-import re
-import fitz
 from werkzeug.utils import secure_filename
-from fpdf import FPDF
-from langchain_openai import ChatOpenAI
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
 
 service_auth = db['service_auth']
+pdf_jobs = db['pdf_jobs']
+llm_usage = db['llm_usage']
+
+# Shared across batch requests so the LLM rate limit holds per process
+llm_rate_limiter = batch_ingest.RateLimiter(BATCH_LLM_RATE)
+
+# Parsed services keyed on upload/text hashes, so repeat uploads skip the LLM
+auth_parse_cache = parse_cache.ParseCache(
+    hashes_collection,
+    ttl_seconds=PARSE_CACHE_TTL,
+    max_entries=PARSE_CACHE_MAX_ENTRIES
+)
+
+# Background workers for /api/extract-pdf?async=true
+pdf_queue = job_queue.JobQueue(
+    pdf_jobs,
+    job_queue.create_backend(PDF_QUEUE_BACKEND, max_workers=PDF_QUEUE_WORKERS)
+)
 
 UPLOAD_FOLDER = 'uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# In-memory database for demo purposes
-llm = ChatOpenAI(
-    model="gpt-3.5-turbo",
-    temperature=0.0,  # Set to 0 for more deterministic responses
+# One client (prompt, chain and HTTP connections) shared by every request
+llm = llm_client.LLMClient(
+    llm_client.create_backend(LLM_BACKEND, model=LLM_MODEL, timeout=LLM_TIMEOUT, fake_latency=LLM_FAKE_LATENCY),
+    timeout=LLM_TIMEOUT,
+    max_attempts=LLM_MAX_ATTEMPTS,
+    max_concurrency=LLM_MAX_CONCURRENCY
 )
 
 
-# Function to extract text from PDF
-def extract_text_from_pdf(file_path):
-    text = ""
+def record_llm_usage(text, excerpt, keys, window_info):
+    """Store prompt token counts for the full text and what was actually sent."""
     try:
-        doc = fitz.open(file_path)
-        for page in doc:
-            text += page.get_text()
-        doc.close()
+        llm_usage.insert_one({
+            "created_at": datetime.utcnow(),
+            "fields": keys,
+            "tokens_full_text": llm.count_tokens(text),
+            "tokens_sent": llm.count_tokens(excerpt),
+            **window_info
+        })
     except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
-    return text
+        print(f"Error recording LLM usage: {e}")
 
 
-# Function to parse service auth data using GPT-3.5
-def parse_service_auth_data_with_llm(text):
-    prompt_template = PromptTemplate(
-        input_variables=["text"],
-        template="""
-        Extract the following information from the healthcare service authorization text. 
-        If the information is not present, respond with "Not found" for that field.
-        
-        Payer: (Look for insurance company name or MINNESOTA DEPT OF HUMAN SERVICES)
-        Member ID: (Look for a member ID number, usually following 'Member ID' or similar)
-        Service Auth #: (Look for a service authorization number, usually following 'Service Auth #' or similar)
-        Procedure Service Code: (Look for a code like S5XXX where X are digits)
-        Modifier Code: (Look for UA or UC, usually following the procedure code)
-        Service Dates: (Look for a date range in format MM/DD/YYYY to MM/DD/YYYY)
-        Units: (Look for a number following 'Units' or similar)
-        Service Rate: (Look for a dollar amount following 'Service Rate' or similar)
-        
-        Here is the text from the service authorization document:
-        {text}
-        
-        Format your response exactly like this, with only the extracted values:
-        Payer: [payer]
-        Member ID: [member_id]
-        Service Auth #: [service_auth_num]
-        Procedure Service Code: [procedure_code]
-        Modifier Code: [modifier_code]
-        Service Dates: [dates]
-        Units: [units]
-        Service Rate: [service_rate]
-        """
-    )
-    
-    chain = LLMChain(llm=llm, prompt=prompt_template)
-    
+@app.route('/api/llm-usage/summary', methods=['GET'])
+def llm_usage_summary():
+    result = list(llm_usage.aggregate([
+        {'$group': {
+            '_id': None,
+            'requests': {'$sum': 1},
+            'filtered_requests': {'$sum': {'$cond': ['$filtered', 1, 0]}},
+            'tokens_full_text': {'$sum': '$tokens_full_text'},
+            'tokens_sent': {'$sum': '$tokens_sent'}
+        }}
+    ]))
+    summary = result[0] if result else {'requests': 0, 'filtered_requests': 0, 'tokens_full_text': 0, 'tokens_sent': 0}
+    summary.pop('_id', None)
+    summary['tokens_saved'] = summary['tokens_full_text'] - summary['tokens_sent']
+    summary['client'] = llm.stats()
+    return jsonify(summary)
+
+
+# Ask the LLM (JSON mode) for every service line, with just the fields the regex tier could not settle
+def llm_extract_fields(text, keys):
+    # Only the windows that look like authorization details go in the prompt
+    excerpt, window_info = service_auth_parser.select_relevant_text(text, max_chars=LLM_CONTEXT_CHARS)
+    record_llm_usage(text, excerpt, keys, window_info)
+    return llm.extract_lines(excerpt, keys)
+
+
+# Function to parse service auth data: regex first, GPT-3.5 only for missing/ambiguous fields
+def parse_service_auth_data_with_llm(text, llm_fill=None):
     try:
-        # Get the LLM output
-        output = chain.invoke({"text": text})
-        result = output['text']
-        
-        # Parse the structured output
-        payer_match = re.search(r'Payer:\s*(.*?)(?:\n|$)', result)
-        member_id_match = re.search(r'Member ID:\s*(.*?)(?:\n|$)', result)
-        auth_match = re.search(r'Service Auth #:\s*(.*?)(?:\n|$)', result)
-        procedure_code_match = re.search(r'Procedure Service Code:\s*(.*?)(?:\n|$)', result)
-        modifier_code_match = re.search(r'Modifier Code:\s*(.*?)(?:\n|$)', result)
-        dates_match = re.search(r'Service Dates:\s*(.*?)(?:\n|$)', result)
-        units_match = re.search(r'Units:\s*(.*?)(?:\n|$)', result)
-        service_rate_match = re.search(r'Service Rate:\s*(.*?)(?:\n|$)', result)
-        
-        # Extract and clean data from matches
-        payer = payer_match.group(1).strip() if payer_match else ""
-        payer = "" if payer.lower() == "not found" else payer
-        
-        member_id = member_id_match.group(1).strip() if member_id_match else ""
-        member_id = "" if member_id.lower() == "not found" else member_id
-        
-        service_auth_num = auth_match.group(1).strip() if auth_match else ""
-        service_auth_num = "" if service_auth_num.lower() == "not found" else service_auth_num
-        
-        procedure_code = procedure_code_match.group(1).strip() if procedure_code_match else ""
-        procedure_code = "" if procedure_code.lower() == "not found" else procedure_code
-        
-        modifier_code = modifier_code_match.group(1).strip() if modifier_code_match else ""
-        modifier_code = "" if modifier_code.lower() == "not found" else modifier_code
-        
-        dates = dates_match.group(1).strip() if dates_match else ""
-        dates = "" if dates.lower() == "not found" else dates
-        
-        units = units_match.group(1).strip() if units_match else ""
-        units = "" if units.lower() == "not found" else units
-        
-        service_rate = service_rate_match.group(1).strip() if service_rate_match else ""
-        service_rate = "" if service_rate.lower() == "not found" else service_rate
-        
-        # Try to convert units to float for calculation
-        try:
-            units_float = float(units) if units else 0
-        except ValueError:
-            units_float = 0
-        
-        # Create services list with extracted data
-        services = [{
-            "id": str(uuid.uuid4()),
-            "payer": payer,
-            "memberId": member_id,
-            "serviceAuthNumber": service_auth_num,
-            "procedureServiceCode": procedure_code,
-            "modifierCode": modifier_code,
-            "dates": dates,
-            "units": units,
-            "serviceRate": service_rate,
-            "usedUnits": "0",
-            "totalHoursRemaining": f"{units_float} hrs",
-            "hoursPerDay": "3",  # Default value
-            "hoursPerWeek": "21",  # Default value
-        }]
-        
-        return {"services": services}
+        services, info = service_auth_parser.parse_tiered(text, llm_fill or llm_extract_fields)
+        if info['llm_fields']:
+            print(f"LLM used for fields: {', '.join(info['llm_fields'])}")
+        return {"services": [service_auth_parser.build_service(values) for values in services]}
     
     except Exception as e:
         print(f"Error parsing with OpenAI: {e}")
@@ -1004,58 +1501,59 @@ def parse_service_auth_data_with_llm(text):
         return parse_service_auth_data(text)
 
 
-# Existing regex-based parser as fallback
+# Regex-only parser, used as fallback
 def parse_service_auth_data(text):
-    # Extract Member ID
-    member_id_match = re.search(r'Member ID[:\s]+(\d+)', text)
-    member_id = member_id_match.group(1) if member_id_match else ""
-    
-    # Extract Payer information
-    payer_match = re.search(r'(MINNESOTA DEPT OF HUMAN SERVICES)', text, re.IGNORECASE)
-    payer = payer_match.group(1) if payer_match else ""
-    
-    # Extract Service Auth Number
-    auth_match = re.search(r'Service Auth #[:\s]+(\d+)', text)
-    service_auth_num = auth_match.group(1) if auth_match else ""
-    
-    # Extract Procedure Service Code
-    proc_code_match = re.search(r'S5\d+', text)
-    procedure_code = proc_code_match.group(0) if proc_code_match else ""
-    
-    # Extract Modifier Code (if any)
-    modifier_match = re.search(r'(?:' + re.escape(procedure_code) + r')?[,\s]+(UA|UC)?', text)
-    modifier_code = modifier_match.group(1) if modifier_match and modifier_match.group(1) else ""
-    
-    # Extract Service Rate
-    rate_match = re.search(r'Service Rate[:\s]+([\d.]+)', text)
-    service_rate = rate_match.group(1) if rate_match else ""
-    
-    # Extract Units
-    units_match = re.search(r'Units[:\s]+([\d.]+)', text)
-    units = units_match.group(1) if units_match else ""
-    
-    # Extract Dates
-    dates_match = re.search(r'(\d{2}/\d{2}/\d{4})\s+[Tt]o\s+(\d{2}/\d{2}/\d{4})', text)
-    dates = f"{dates_match.group(1)} To {dates_match.group(2)}" if dates_match else ""
-    
-    # Create services list with extracted data
-    services = [{
-        "id": str(uuid.uuid4()),
-        "payer": payer,
-        "memberId": member_id,
-        "serviceAuthNumber": service_auth_num,
-        "procedureServiceCode": procedure_code,
-        "modifierCode": modifier_code,
-        "dates": dates,
-        "units": units,
-        "serviceRate": service_rate,
-        "usedUnits": "0",
-        "totalHoursRemaining": f"{float(units) if units else 0} hrs",
-        "hoursPerDay": "3",
-        "hoursPerWeek": "21",
-    }]
-    
-    return {"services": services}
+    services, _ = service_auth_parser.parse_tiered(text)
+    return {"services": [service_auth_parser.build_service(values) for values in services]}
+
+
+def parse_text_with_cache(file_hash, text, parse=None):
+    """
+    Resolve services for extracted text: text-level cache first, then the
+    parser. Returns (services, source) where source is 'text_cache' or 'llm'.
+    """
+    parse = parse or parse_service_auth_data_with_llm
+    text_hash = parse_cache.hash_text(text)
+
+    # Different bytes, same document text
+    services = auth_parse_cache.get_by_text(text_hash)
+    source = 'text_cache'
+
+    if services is None:
+        # Parse the text to extract service auth data
+        services = parse(text)["services"]
+        source = 'llm'
+
+    # Only cache parses that actually found the authorization
+    if any(service.get("memberId") or service.get("serviceAuthNumber") for service in services):
+        auth_parse_cache.put(file_hash, text_hash, services)
+
+    return services, source
+
+
+def process_service_auth_pdf(data):
+    """
+    Extract, parse and store one uploaded service authorization PDF from
+    its bytes. Runs inline or on a pdf_queue worker.
+    """
+    file_hash = parse_cache.hash_bytes(data)
+
+    # Same upload seen before: skip extraction and the LLM entirely
+    services = auth_parse_cache.get_by_file(file_hash)
+
+    if services is None:
+        # Extract text from the PDF bytes in memory
+        text = pdf_text.extract_text(data, max_pages=PDF_MAX_PAGES)
+        services, _ = parse_text_with_cache(file_hash, text)
+
+    # Every stored record gets its own id, cached or not
+    parsed_data = {"services": [dict(service, id=str(uuid.uuid4())) for service in services]}
+
+    # Save every service line to MongoDB (copies, so the response has no ObjectId)
+    if parsed_data["services"]:
+        service_auth.insert_many([typed_fields.typed_service(service) for service in parsed_data["services"]])
+
+    return parsed_data
 
 
 @app.route('/api/extract-pdf', methods=['POST'])
@@ -1073,29 +1571,154 @@ def extract_pdf():
         
         if file:
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            # Extract text from PDF
-            text = extract_text_from_pdf(file_path)
-            
-            # Parse the text to extract service auth data
-            parsed_data = parse_service_auth_data_with_llm(text)
-            
-            # Save to MongoDB
-            if parsed_data and "services" in parsed_data and len(parsed_data["services"]) > 0:
-                service_auth.insert_one(parsed_data["services"][0])
-            
-            # Clean up the file
-            os.remove(file_path)
-            
-            return jsonify(parsed_data)
+            # Work from the uploaded bytes, nothing is written to disk
+            data = file.read()
+
+            # Queue mode: hand the work to a background worker and return at once
+            if request.args.get('async', 'false').lower() == 'true':
+                job_id = pdf_queue.submit('extract-pdf', process_service_auth_pdf, data, filename=filename)
+                return jsonify({
+                    "job_id": job_id,
+                    "status": job_queue.QUEUED,
+                    "status_url": url_for('extract_pdf_status', job_id=job_id)
+                }), 202
+
+            return jsonify(process_service_auth_pdf(data))
     
     except Exception as e:
         print(f"Error processing PDF: {e}")
         return jsonify({"error": "Failed to process PDF"}), 500
 
 
+def run_pdf_batch(uploads):
+    """
+    Ingest a batch of (filename, bytes) PDFs on a pdf_queue worker. Text
+    extraction runs in a process pool, LLM parsing on a rate-limited
+    thread pool, and all records are written with a single insert_many.
+    """
+    started = time.perf_counter()
+    results = [{"filename": filename, "status": "ok"} for filename, _ in uploads]
+
+    # File-level cache hits need neither extraction nor the LLM
+    pending = []
+    for index, (_, data) in enumerate(uploads):
+        file_hash = parse_cache.hash_bytes(data)
+        services = auth_parse_cache.get_by_file(file_hash)
+        if services is not None:
+            results[index].update(source="file_cache", services=services)
+        else:
+            pending.append((index, file_hash, data))
+
+    extraction_started = time.perf_counter()
+    texts = batch_ingest.extract_texts([data for _, _, data in pending], BATCH_EXTRACT_PROCESSES, PDF_MAX_PAGES)
+    extraction_seconds = time.perf_counter() - extraction_started
+
+    parse_started = time.perf_counter()
+    # Only real LLM calls count against the rate limit
+    limited_parse = partial(parse_service_auth_data_with_llm, llm_fill=llm_rate_limiter.wrap(llm_extract_fields))
+    with ThreadPoolExecutor(max_workers=BATCH_LLM_CONCURRENCY) as executor:
+        futures = {}
+        for (index, file_hash, _), text in zip(pending, texts):
+            # Unreadable or image-only PDFs are not worth an LLM call
+            if not text.strip():
+                results[index].update(status="error", error="No text could be extracted from PDF")
+                continue
+            futures[executor.submit(parse_text_with_cache, file_hash, text, limited_parse)] = index
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                services, source = future.result()
+                results[index].update(source=source, services=services)
+            except Exception as e:
+                print(f"Error parsing {results[index]['filename']}: {e}")
+                results[index].update(status="error", error="Failed to process PDF")
+    parse_seconds = time.perf_counter() - parse_started
+
+    # Every stored record gets its own id, cached or not
+    records = []
+    for result in results:
+        if result["status"] == "ok":
+            result["services"] = [dict(service, id=str(uuid.uuid4())) for service in result["services"]]
+            records.extend(typed_fields.typed_service(service) for service in result["services"])
+
+    if records:
+        service_auth.insert_many(records)
+
+    total_seconds = time.perf_counter() - started
+    return {
+        "results": results,
+        "metrics": {
+            "files": len(results),
+            "succeeded": sum(1 for r in results if r["status"] == "ok"),
+            "failed": sum(1 for r in results if r["status"] == "error"),
+            "cache_hits": sum(1 for r in results if r.get("source") in ("file_cache", "text_cache")),
+            "llm_calls": sum(1 for r in results if r.get("source") == "llm"),
+            "records_inserted": len(records),
+            "extraction_seconds": round(extraction_seconds, 3),
+            "parse_seconds": round(parse_seconds, 3),
+            "total_seconds": round(total_seconds, 3),
+            "files_per_second": round(len(results) / total_seconds, 2) if total_seconds else None
+        }
+    }
+
+
+@app.route('/api/extract-pdf/batch', methods=['POST'])
+def extract_pdf_batch():
+    """
+    Queue many service authorization PDFs (or zips of them) for ingestion.
+    Returns 202 with a job id; results and metrics come from status_url.
+    """
+    try:
+        uploads = list(batch_ingest.iter_pdf_uploads(
+            request.files.getlist('pdfs') + request.files.getlist('pdf'),
+            max_files=BATCH_MAX_FILES,
+            max_file_bytes=BATCH_MAX_FILE_BYTES,
+            max_total_bytes=BATCH_MAX_TOTAL_BYTES
+        ))
+        if not uploads:
+            return jsonify({"error": "No PDF files uploaded"}), 400
+
+        job_id = pdf_queue.submit('extract-pdf-batch', run_pdf_batch, uploads, files=len(uploads))
+        return jsonify({
+            "job_id": job_id,
+            "status": job_queue.QUEUED,
+            "files": len(uploads),
+            "status_url": url_for('extract_pdf_status', job_id=job_id)
+        }), 202
+
+    except batch_ingest.UploadLimitError as e:
+        return jsonify({"error": str(e)}), 413
+
+    except RequestEntityTooLarge as e:
+        return upload_too_large(e)
+
+    except zipfile.BadZipFile:
+        return jsonify({"error": "Invalid zip archive"}), 400
+
+    except Exception as e:
+        print(f"Error queueing PDF batch: {e}")
+        return jsonify({"error": "Failed to process PDF batch"}), 500
+
+
+@app.route('/api/extract-pdf/<job_id>', methods=['GET'])
+def extract_pdf_status(job_id):
+    job = pdf_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    response = {"job_id": job["_id"], "status": job["status"]}
+    if job["status"] == job_queue.DONE:
+        response["result"] = job["result"]
+    elif job["status"] == job_queue.FAILED:
+        response["error"] = job.get("error", "Failed to process PDF")
+    return jsonify(response)
+
+
+@app.route('/api/parse-cache/stats', methods=['GET'])
+def parse_cache_stats():
+    return jsonify(auth_parse_cache.stats())
+
+
 @app.route('/api/manual-entry', methods=['POST'])
 def manual_entry():
     try:
@@ -1105,6 +1728,8 @@ def manual_entry():
         daily_usage = float(data.get("dailyUsage", 0))
         hours_per_week = daily_usage * 7
         
+        start_date, end_date = service_auth_parser.parse_date_range(data.get("dates", ""))
+
         # Create a service auth record
         service = {
             "id": str(uuid.uuid4()),
@@ -1114,16 +1739,20 @@ def manual_entry():
             "procedureServiceCode": data.get("procedureServiceCode", ""),
             "modifierCode": data.get("modifierCode", ""),
             "dates": data.get("dates", ""),
+            "startDate": start_date,
+            "endDate": end_date,
             "units": data.get("units", ""),
             "serviceRate": data.get("serviceRate", ""),
-            "usedUnits": "0",
-            "totalHoursRemaining": f"{float(data.get('units', 0))} hrs",
+            "unitsAuthorized": unit_ledger.parse_units(data.get("units")),
+            "unitsUsed": 0.0,
             "hoursPerDay": data.get("dailyUsage", ""),
             "hoursPerWeek": str(hours_per_week),
         }
+        # usedUnits / totalHoursRemaining, kept current by the ledger
+        service.update(unit_ledger.legacy_fields(service))
         
         # Add to our database
-        service_auth.insert_one(service)
+        service_auth.insert_one(typed_fields.typed_service(service))
         
         return jsonify({"services": [service]})
     
@@ -1132,52 +1761,62 @@ def manual_entry():
         return jsonify({"error": "Failed to process manual entry"}), 500
 
 
+import gridfs
+
+# Finished reports live in GridFS next to the job state, so any instance can serve the download
+export_files = gridfs.GridFS(db, collection='export_files')
+
+
+def remove_old_exports():
+    """Delete report files older than EXPORT_RETENTION_HOURS."""
+    cutoff = datetime.utcnow() - timedelta(hours=EXPORT_RETENTION_HOURS)
+    for old in export_files.find({"uploadDate": {"$lt": cutoff}}):
+        try:
+            export_files.delete(old._id)
+        except Exception as e:
+            print(f"Error removing old export {old._id}: {e}")
+
+
+def run_export_job(filters, export_id):
+    with export_files.new_file(_id=export_id, filename=f"{export_id}.pdf", content_type='application/pdf') as out:
+        rows = auth_report.write_report(service_auth, filters, out)
+    return {"rows": rows}
+
+
 @app.route('/api/export-pdf', methods=['POST'])
 def export_pdf():
+    """
+    Service authorization report as a PDF.
+
+    Body (all optional): {"payer", "memberId", "from": "YYYY-MM-DD", "to": "YYYY-MM-DD"}.
+    Reports over EXPORT_PDF_SYNC_ROWS rows, or any report with ?async=true,
+    run in the background and return 202 with status and download links.
+    """
     try:
-        # Create a PDF document
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # Set font
-        pdf.set_font("Arial", size=12)
-        
-        # Add title
-        pdf.cell(200, 10, txt="Service Authorization Report", ln=True, align='C')
-        
-        # Add date
-        current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        pdf.cell(200, 10, txt=f"Generated on: {current_date}", ln=True, align='L')
-        
-        # Get services data from MongoDB
-        services = list(service_auth.find())
-        
-        # Add table headers
-        pdf.set_font("Arial", style='B', size=10)
-        pdf.cell(30, 10, txt="Member ID", border=1)
-        pdf.cell(30, 10, txt="Service Auth #", border=1)
-        pdf.cell(40, 10, txt="Procedure Code", border=1)
-        pdf.cell(30, 10, txt="Units", border=1)
-        pdf.cell(30, 10, txt="Service Rate", border=1)
-        pdf.cell(30, 10, txt="Hours Per Day", border=1)
-        pdf.ln()
-        
-        # Add data rows
-        pdf.set_font("Arial", size=10)
-        for service in services:
-            pdf.cell(30, 10, txt=service.get("memberId", ""), border=1)
-            pdf.cell(30, 10, txt=service.get("serviceAuthNumber", ""), border=1)
-            pdf.cell(40, 10, txt=f"{service.get('procedureServiceCode', '')} {service.get('modifierCode', '')}", border=1)
-            pdf.cell(30, 10, txt=service.get("units", ""), border=1)
-            pdf.cell(30, 10, txt=service.get("serviceRate", ""), border=1)
-            pdf.cell(30, 10, txt=service.get("hoursPerDay", ""), border=1)
-            pdf.ln()
-        
-        # Save PDF to a buffer
-        pdf_buffer = io.BytesIO()
-        pdf.output(pdf_buffer)
-        pdf_buffer.seek(0)
-        
+        data = request.get_json(silent=True) or {}
+        filters = {name: data.get(name) for name in ('payer', 'memberId', 'from', 'to') if data.get(name)}
+        try:
+            query = auth_report.build_query(filters)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        rows = service_auth.count_documents(query)
+        if request.args.get('async') == 'true' or rows > EXPORT_PDF_SYNC_ROWS:
+            remove_old_exports()
+            export_id = uuid.uuid4().hex
+            job_id = pdf_queue.submit('export_pdf', run_export_job, filters, export_id,
+                                      filters=filters, rows=rows, export_id=export_id)
+            return jsonify({
+                "job_id": job_id,
+                "status": job_queue.QUEUED,
+                "rows": rows,
+                "status_url": url_for('export_pdf_status', job_id=job_id),
+                "download_url": url_for('export_pdf_download', job_id=job_id)
+            }), 202
+
+        pdf, _ = auth_report.build_report(auth_report.find_rows(service_auth, query), filters)
+        pdf_buffer = io.BytesIO(auth_report.report_bytes(pdf))
+
         # Send file as attachment
         return send_file(
             pdf_buffer,
@@ -1185,11 +1824,46 @@ def export_pdf():
             as_attachment=True,
             download_name='service_authorization.pdf'
         )
-    
+
     except Exception as e:
         print(f"Error generating PDF: {e}")
         return jsonify({"error": "Failed to generate PDF"}), 500
-    
+
+
+@app.route('/api/export-pdf/<job_id>', methods=['GET'])
+def export_pdf_status(job_id):
+    job = pdf_queue.get(job_id)
+    if not job or job.get("kind") != "export_pdf":
+        return jsonify({"error": "Job not found"}), 404
+
+    response = {"job_id": job["_id"], "status": job["status"], "rows": job.get("rows")}
+    if job["status"] == job_queue.DONE:
+        response["rows"] = job["result"]["rows"]
+        response["download_url"] = url_for('export_pdf_download', job_id=job_id)
+    elif job["status"] == job_queue.FAILED:
+        response["error"] = job.get("error", "Failed to generate PDF")
+    return jsonify(response)
+
+
+@app.route('/api/export-pdf/<job_id>/download', methods=['GET'])
+def export_pdf_download(job_id):
+    job = pdf_queue.get(job_id)
+    if not job or job.get("kind") != "export_pdf":
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] != job_queue.DONE:
+        return jsonify({"error": "Report is not ready", "status": job["status"]}), 409
+    try:
+        report = export_files.get(job["export_id"])
+    except gridfs.NoFile:
+        return jsonify({"error": "Report has expired"}), 410
+    return send_file(
+        report,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name='service_authorization.pdf'
+    )
+
+
 @app.route('/serviceAuth', methods=['GET'])
 def serviceAuth():
     """
@@ -1207,7 +1881,6 @@ UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -1302,20 +1975,81 @@ def upload_photo(client_id):
             'message': f'Error uploading photo: {str(e)}'
         }), 500
 
+MAX_PAGE_SIZE = 1000
+
+
+def get_page_args():
+    """
+    Read keyset pagination parameters (limit, after) from the query string.
+    A missing limit means "everything", which callers serve as a stream.
+    """
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValueError('limit must be a positive integer')
+        limit = min(int(limit), MAX_PAGE_SIZE)
+
+    if after is not None:
+        if not ObjectId.is_valid(after):
+            raise ValueError('after must be a valid id')
+        after = ObjectId(after)
+
+    return limit, after
+
+
+def keyset_find(collection, query, projection=None, limit=None, after=None):
+    """
+    Find documents in _id order, starting after the given _id.
+    """
+    if after is not None:
+        query = {**query, '_id': {'$gt': after}}
+    cursor = collection.find(query, projection).sort('_id', 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def serialize_client(client):
+    client['_id'] = str(client['_id'])
+    return client
+
+
 @app.route('/api/clients', methods=['GET'])
 def get_clientss():
     try:
-        clients = list(client_details.find())
-        
-        # Convert ObjectId to string for JSON serialization
-        for client in clients:
-            client['_id'] = str(client['_id'])
-        
+        limit, after = get_page_args()
+
+        # Optional projection, e.g. ?fields=firstName,lastName,status
+        fields = request.args.get('fields')
+        projection = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+
+        cursor = keyset_find(client_details, {}, projection, limit, after)
+
+        if limit is None:
+            # No page requested, stream every client in constant memory
+            return stream_cursor(
+                cursor,
+                serialize_client,
+                prefix='{"success": true, "clients": [',
+                suffix=']}'
+            )
+
+        clients = [serialize_client(client) for client in cursor]
+
         return jsonify({
             'success': True,
-            'clients': clients
+            'clients': clients,
+            'next_after': clients[-1]['_id'] if len(clients) == limit else None
         }), 200
-        
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1382,63 +2116,142 @@ def update_client(client_id):
 
 
 
+import rollups
+
 claims = db["claims"]
 payments = db["payments"]
 payroll = db["payroll"]
 timesheet = db["timesheet"]
 schedules = db["schedule"]
+dashboard_rollups = db["dashboard_rollups"]
+
+# Rollup rebuilds scan every source collection, so they stay off the request path
+rollup_queue = job_queue.JobQueue(
+    db['rollup_jobs'],
+    job_queue.create_backend(PDF_QUEUE_BACKEND, max_workers=1)
+)
+
+
+def run_rollup_rebuild():
+    summary = rollups.rebuild(db, dashboard_rollups)
+    return {'total_claims': summary['total_claims'], 'payroll_total': summary['payroll_total']}
 
 
 @app.route('/api/stats/summary', methods=['GET'])
 def get_stats_summary():
-    # Fetch summary statistics from MongoDB
-    unpaid_claims = claims.count_documents({'status': 'unpaid'})
-    total_claims = claims.count_documents({})
-    
-    unpaid_hours = timesheet.aggregate([
-        {'$match': {'paid': False}},
-        {'$group': {'_id': None, 'total': {'$sum': '$hours'}}}
-    ])
-    unpaid_hours_value = list(unpaid_hours)[0]['total'] if unpaid_hours.alive else 0
-    
-    scheduled_hours = schedules.aggregate([
-        {'$match': {'date': {'$gte': datetime.now()}}},
-        {'$group': {'_id': None, 'total': {'$sum': '$hours'}}}
-    ])
-    scheduled_hours_value = list(scheduled_hours)[0]['total'] if scheduled_hours.alive else 0
-    
-    worked_hours = timesheet.aggregate([
-        {'$match': {'status': 'approved'}},
-        {'$group': {'_id': None, 'total': {'$sum': '$hours'}}}
-    ])
-    worked_hours_value = list(worked_hours)[0]['total'] if worked_hours.alive else 0
-    
-    denied_claims = claims.count_documents({'status': 'denied'})
-    voided_claims = claims.count_documents({'status': 'voided'})
-    replaced_claims = claims.count_documents({'status': 'replaced'})
-    
-    payroll_paid = payroll.aggregate([
-        {'$match': {'status': 'paid'}},
-        {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-    ])
-    payroll_paid_value = list(payroll_paid)[0]['total'] if payroll_paid.alive else 0
-    
-    payroll_total = payroll.aggregate([
-        {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-    ])
-    payroll_total_value = list(payroll_total)[0]['total'] if payroll_total.alive else 0
-    
+    # Read the materialized rollup kept current by rollups.apply_change / watch
+    summary = rollups.read_summary(dashboard_rollups)
+    if rollups.needs_rebuild(summary, ROLLUP_MAX_AGE) and rollups.claim_rebuild(dashboard_rollups):
+        # Fresh database, partial document or writes made outside this app;
+        # the current totals are served until the rebuild lands
+        rollup_queue.submit('rebuild-rollups', run_rollup_rebuild)
+        summary = rollups.read_summary(dashboard_rollups)
+
+    if summary is None or not summary.get('last_rebuilt'):
+        response = jsonify({'error': 'Dashboard summary is being built, try again shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    total_claims = summary.get('total_claims', 0)
+
     return jsonify({
-        'unpaid_claims': {'count': unpaid_claims, 'total': total_claims},
-        'unpaid_hours': unpaid_hours_value,
-        'scheduled_hours': scheduled_hours_value,
-        'worked_hours': worked_hours_value,
-        'denied_claims': {'count': denied_claims, 'total': total_claims},
-        'voided_claims': {'count': voided_claims, 'total': total_claims},
-        'replaced_claims': {'count': replaced_claims, 'total': total_claims},
-        'payroll': {'paid': payroll_paid_value, 'total': payroll_total_value}
+        'unpaid_claims': {'count': summary.get('unpaid_claims', 0), 'total': total_claims},
+        'unpaid_hours': summary.get('unpaid_hours', 0),
+        'scheduled_hours': summary['scheduled_hours'],
+        'worked_hours': summary.get('worked_hours', 0),
+        'denied_claims': {'count': summary.get('denied_claims', 0), 'total': total_claims},
+        'voided_claims': {'count': summary.get('voided_claims', 0), 'total': total_claims},
+        'replaced_claims': {'count': summary.get('replaced_claims', 0), 'total': total_claims},
+        'payroll': {'paid': summary.get('payroll_paid', 0), 'total': summary.get('payroll_total', 0)}
     })
 
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the dashboard rollup from claims, timesheet, schedule and payroll."""
+    summary = rollups.rebuild(db, dashboard_rollups)
+    print(f"Rollup rebuilt: {summary['total_claims']} claims, {summary['payroll_total']} payroll total")
+
+
+@app.cli.command('watch-rollups')
+def watch_rollups_command():
+    """Keep the dashboard rollup current from MongoDB change streams."""
+    rollups.watch(db, dashboard_rollups)
+
+
+unit_ledger_collection = db["unit_ledger"]
+
+
+@app.route('/api/timesheet/<entry_id>/approve', methods=['POST'])
+@login_required
+def approve_timesheet_entry(entry_id):
+    """Approve a timesheet entry and charge its units to the matching service authorization."""
+    try:
+        changes = {'status': 'approved', 'approved_at': datetime.utcnow()}
+        before = timesheet.find_one_and_update(
+            {'_id': ObjectId(entry_id)},
+            {'$set': changes},
+            return_document=ReturnDocument.BEFORE
+        )
+        if not before:
+            return jsonify({'error': 'Timesheet entry not found'}), 404
+
+        entry = dict(before, **changes)
+        rollups.apply_change(dashboard_rollups, 'timesheet', before, entry)
+        unit_ledger.apply_change(service_auth, unit_ledger_collection, entry['_id'], entry)
+        return jsonify({'message': 'Timesheet entry approved', 'units': unit_ledger.entry_units(entry)})
+    except Exception as e:
+        print(f"Error approving timesheet entry: {e}")
+        return jsonify({'error': 'Failed to approve timesheet entry'}), 500
+
+
+@app.route('/api/service-auth/<auth_number>/balance', methods=['GET'])
+def service_auth_balance(auth_number):
+    """Authorized, used and remaining units for each line of a service authorization."""
+    lines = service_auth.find(
+        {'serviceAuthNumber': auth_number},
+        {'_id': 0, 'id': 1, 'memberId': 1, 'procedureServiceCode': 1, 'modifierCode': 1,
+         'units': 1, 'unitsAuthorized': 1, 'unitsUsed': 1}
+    )
+    result = []
+    for line in lines:
+        result.append({
+            'id': line.get('id'),
+            'memberId': line.get('memberId'),
+            'procedureServiceCode': line.get('procedureServiceCode'),
+            'modifierCode': line.get('modifierCode'),
+            **unit_ledger.balance(line)
+        })
+    if not result:
+        return jsonify({'error': 'Service authorization not found'}), 404
+    return jsonify({'serviceAuthNumber': auth_number, 'lines': result})
+
+
+@app.cli.command('reconcile-ledger')
+def reconcile_ledger_command():
+    """Rebuild service authorization unit balances from approved timesheet entries."""
+    summary = unit_ledger.reconcile(db, service_auth, unit_ledger_collection)
+    print(f"Ledger reconciled: {summary}")
+
+
+@app.cli.command('watch-ledger')
+def watch_ledger_command():
+    """Keep service authorization unit balances current from the timesheet change stream."""
+    unit_ledger.watch(db, service_auth, unit_ledger_collection)
+
+
+@app.cli.command('sync-calendar')
+@click.option('--once', is_flag=True, help='Send what is due and exit instead of polling.')
+@click.option('--retry-failed', is_flag=True, help='Queue failed calendar changes again first.')
+def sync_calendar_command(once, retry_failed):
+    """Push queued shift changes to Google Calendar."""
+    if retry_failed:
+        print(f"Queued {calendar_sync_worker.retry_failed()} failed changes again")
+    if once:
+        print(f"Calendar sync: {calendar_sync_worker.run_once()}")
+    else:
+        calendar_sync_worker.run_forever()
+
 @app.route('/api/revenue/yearly', methods=['GET'])
 def get_yearly_revenue():
     # Get monthly revenue for the last 12 months
@@ -1491,82 +2304,109 @@ def get_payments_by_payer():
     
     return jsonify(result)
 
+import schedule_calendar
+
+schedule_views = schedule_calendar.ViewCache(ttl=SCHEDULE_VIEW_TTL)
+
+def schedule_view_response(payload, etag):
+    """
+    JSON response with an ETag; 304 when the browser already has it.
+    """
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 @app.route('/api/schedule/caregivers', methods=['GET'])
 def get_caregiver_schedule():
-    # Get caregiver schedule for the current month
-    current_date = datetime.now()
-    start_date = datetime(current_date.year, current_date.month, 1)
-    if current_date.month == 12:
-        end_date = datetime(current_date.year + 1, 1, 1)
-    else:
-        end_date = datetime(current_date.year, current_date.month + 1, 1)
-    
-    schedule = list(schedules.find({
-        'date': {'$gte': start_date, '$lt': end_date}
-    }))
-    
-    # Convert ObjectId to string for JSON serialization
-    for item in schedule:
-        item['_id'] = str(item['_id'])
-        item['date'] = item['date'].strftime('%Y-%m-%d')
-    
-    return jsonify(schedule)
+    """
+    Caregiver schedule for ?month=1-12&year=YYYY (default: this month),
+    grouped by day and by caregiver.
+    """
+    try:
+        year, month = schedule_calendar.parse_month(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        start_date, end_date = schedule_calendar.month_range(year, month)
+        docs = schedules.find(
+            {'date': {'$gte': start_date, '$lt': end_date}},
+            schedule_calendar.MONTH_PROJECTION
+        ).sort('date', 1)
+        return schedule_calendar.month_view(docs, year, month)
 
-@app.route('/api/revenue/by_payer', methods=['GET'])
-def get_revenue_by_payer():
-    # Get revenue by payer for different time periods
-    current_date = datetime.now()
-    
+    try:
+        return schedule_view_response(*schedule_views.get(('month', year, month), build))
+    except Exception as e:
+        print(f"Error fetching caregiver schedule: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/schedule/details', methods=['GET'])
+def get_schedule_details():
+    """
+    Appointments for ?date=YYYY-MM-DD, ordered by start time.
+    """
+    try:
+        day = schedule_calendar.parse_day(request.args.get('date'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        start_date, end_date = schedule_calendar.day_range(day)
+        return schedule_calendar.day_view(schedules.find(
+            {'date': {'$gte': start_date, '$lt': end_date}},
+            schedule_calendar.DAY_PROJECTION
+        ))
+
+    try:
+        return schedule_view_response(*schedule_views.get(('day', day), build))
+    except Exception as e:
+        print(f"Error fetching schedule details: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def revenue_by_payer_pipeline(current_date):
+    """
+    Build a single aggregation that sums every revenue window for every payer.
+    """
     # Time periods
     this_month_start = datetime(current_date.year, current_date.month, 1)
     three_months_ago = current_date - timedelta(days=90)
     six_months_ago = current_date - timedelta(days=180)
     twelve_months_ago = current_date - timedelta(days=365)
-    
-    # Aggregate revenue by payer for each time period
-    payers = payments.distinct('payer')
+
+    def window_sum(since):
+        return {'$sum': {'$cond': [{'$gte': ['$date', since]}, '$amount', 0]}}
+
+    return [
+        {'$group': {
+            '_id': '$payer',
+            'this_month': window_sum(this_month_start),
+            'last_3_months': window_sum(three_months_ago),
+            'last_6_months': window_sum(six_months_ago),
+            'last_12_months': window_sum(twelve_months_ago),
+            'lifetime': {'$sum': '$amount'}
+        }},
+        {'$sort': {'_id': 1}}
+    ]
+
+
+@app.route('/api/revenue/by_payer', methods=['GET'])
+def get_revenue_by_payer():
+    # Get revenue by payer for every time period in one scan of payments
+    pipeline = revenue_by_payer_pipeline(datetime.now())
+
     result = []
-    
-    for payer in payers:
-        this_month = payments.aggregate([
-            {'$match': {'payer': payer, 'date': {'$gte': this_month_start}}},
-            {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-        ])
-        this_month_value = list(this_month)[0]['total'] if this_month.alive else 0
-        
-        last_3_months = payments.aggregate([
-            {'$match': {'payer': payer, 'date': {'$gte': three_months_ago}}},
-            {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-        ])
-        last_3_months_value = list(last_3_months)[0]['total'] if last_3_months.alive else 0
-        
-        last_6_months = payments.aggregate([
-            {'$match': {'payer': payer, 'date': {'$gte': six_months_ago}}},
-            {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-        ])
-        last_6_months_value = list(last_6_months)[0]['total'] if last_6_months.alive else 0
-        
-        last_12_months = payments.aggregate([
-            {'$match': {'payer': payer, 'date': {'$gte': twelve_months_ago}}},
-            {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-        ])
-        last_12_months_value = list(last_12_months)[0]['total'] if last_12_months.alive else 0
-        
-        lifetime = payments.aggregate([
-            {'$match': {'payer': payer}},
-            {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-        ])
-        lifetime_value = list(lifetime)[0]['total'] if lifetime.alive else 0
-        
+    for entry in payments.aggregate(pipeline):
         result.append({
-            'payer': payer,
-            'this_month': this_month_value,
-            'last_3_months': last_3_months_value,
-            'last_6_months': last_6_months_value,
-            'last_12_months': last_12_months_value,
-            'lifetime': lifetime_value
+            'payer': entry['_id'],
+            'this_month': entry['this_month'],
+            'last_3_months': entry['last_3_months'],
+            'last_6_months': entry['last_6_months'],
+            'last_12_months': entry['last_12_months'],
+            'lifetime': entry['lifetime']
         })
-    
+
     return jsonify(result)
 
 
@@ -1577,7 +2417,6 @@ UPLOAD_FOLDER = 'static/uploads/employees'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -1676,16 +2515,12 @@ def upload_profile_image(employee_id):
 @app.route('/api/employees', methods=['GET'])
 def get_employees():
     try:
-        employees = list(employee_details.find())
-        
-        # Convert ObjectId to string for JSON serialization
-        for employee in employees:
-            employee['_id'] = str(employee['_id'])
-        
-        return jsonify({
-            'success': True,
-            'employees': employees
-        }), 200
+        # Stream employees straight from the cursor (JSON array or NDJSON)
+        return stream_cursor(
+            employee_details.find(),
+            prefix='{"success": true, "employees": [',
+            suffix=']}'
+        )
         
     except Exception as e:
         return jsonify({
@@ -1818,14 +2653,8 @@ def save_care_plan():
 @app.route('/get-care-plans', methods=['GET'])
 def get_care_plans():
     try:
-        # Retrieve all care plans
-        care_plans = list(care_plans_collection.find())
-        
-        # Convert ObjectId to string for JSON serialization
-        for plan in care_plans:
-            plan['_id'] = str(plan['_id'])
-
-        return jsonify(care_plans), 200
+        # Stream all care plans (JSON array or NDJSON)
+        return stream_cursor(care_plans_collection.find())
 
     except Exception as e:
         return jsonify({
@@ -1844,39 +2673,54 @@ def careplan():
 
 client_details_collection = db['client_details']
 
+CLIENT_NAME_PROJECTION = ['firstName', 'middleName', 'lastName', 'preferredName', 'status', 'memberId', 'referralSource']
+
+
+def format_client_name(client_info):
+    # Construct full name
+    full_name = " ".join(filter(bool, [
+        client_info.get('firstName', ''),
+        client_info.get('middleName', ''),
+        client_info.get('lastName', '')
+    ])).strip()
+
+    # If full name is empty, use preferred name or fall back to other identifiers
+    if not full_name:
+        full_name = client_info.get('preferredName', '')
+
+    # If still no name, use member ID
+    if not full_name:
+        full_name = client_info.get('memberId', 'Unnamed Client')
+
+    return {
+        'id': str(client_info['_id']),
+        'fullName': full_name,
+        'status': client_info.get('status', ''),
+        'memberId': client_info.get('memberId', ''),
+        'referralSource': client_info.get('referralSource', '')
+    }
+
+
 @app.route('/get-clients', methods=['GET'])
 def get_clients():
     try:
-        # Retrieve client details
-        clients = list(client_details_collection.find())
-        
-        # Transform client data to include full name and other relevant info
-        client_list = []
-        for client_info in clients:
-            # Construct full name
-            full_name = " ".join(filter(bool, [
-                client_info.get('firstName', ''),
-                client_info.get('middleName', ''),
-                client_info.get('lastName', '')
-            ])).strip()
-            
-            # If full name is empty, use preferred name or fall back to other identifiers
-            if not full_name:
-                full_name = client_info.get('preferredName', '')
-            
-            # If still no name, use member ID
-            if not full_name:
-                full_name = client_info.get('memberId', 'Unnamed Client')
-            
-            client_list.append({
-                'id': str(client_info['_id']),
-                'fullName': full_name,
-                'status': client_info.get('status', ''),
-                'memberId': client_info.get('memberId', ''),
-                'referralSource': client_info.get('referralSource', '')
-            })
+        limit, after = get_page_args()
+
+        # Only the fields needed to build the name list
+        cursor = keyset_find(client_details_collection, {}, CLIENT_NAME_PROJECTION, limit, after)
+
+        if limit is None:
+            return stream_cursor(cursor, format_client_name)
+
+        client_list = [format_client_name(client_info) for client_info in cursor]
+
+        response = jsonify(client_list)
+        if len(client_list) == limit:
+            response.headers['X-Next-After'] = client_list[-1]['id']
+        return response, 200
 
-        return jsonify(client_list), 200
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
 
     except Exception as e:
         return jsonify({
@@ -1907,10 +2751,8 @@ def get_client_details(client_id):
 @app.route('/api/get-schedules', methods=['GET'])
 @login_required
 def get_schedules():
-    schedules = list(schedules.find())
-    for schedule in schedules:
-        schedule['_id'] = str(schedule['_id'])  # Convert ObjectId to string
-    return jsonify(schedules)
+    # ObjectIds and dates are converted while streaming
+    return stream_cursor(schedules.find())
 
 @app.route('/api/approve-schedule/<schedule_id>', methods=['POST'])
 @login_required
@@ -1919,6 +2761,7 @@ def approve_schedule(schedule_id):
         {'_id': ObjectId(schedule_id)},
         {'$set': {'status': 'Approved'}}
     )
+    schedule_views.clear()
     if result.modified_count > 0:
         return jsonify({'message': 'Schedule approved successfully!'})
     return jsonify({'message': 'Failed to approve schedule.'}), 400
@@ -1930,6 +2773,7 @@ def reject_schedule(schedule_id):
         {'_id': ObjectId(schedule_id)},
         {'$set': {'status': 'Rejected'}}
     )
+    schedule_views.clear()
     if result.modified_count > 0:
         return jsonify({'message': 'Schedule rejected successfully!'})
     return jsonify({'message': 'Failed to reject schedule.'}), 400
@@ -0,0 +1,116 @@
+"""
+Content-hash cache for parsed service authorizations.
+
+Entries are keyed on the SHA-256 of the uploaded bytes, with a second
+lookup on the SHA-256 of the normalized extracted text, so the same
+authorization re-uploaded (or re-exported to a byte-different PDF) skips
+the LLM. Entries expire after ``ttl_seconds`` (the TTL index on
+``expires_at`` declared in indexes.py does the deleting) and the least
+recently used ones are trimmed once there are more than ``max_entries``.
+Entries are stamped with ``VERSION``; ones written for another version
+of the parser output are treated as misses and overwritten.
+"""
+import hashlib
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+STATS_ID = '__stats__'
+# 2: one service per authorization line (service_auth_parser)
+VERSION = 2
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_text(text):
+    """
+    Collapse whitespace so layout-only differences hash the same.
+    """
+    return ' '.join(text.split())
+
+
+def hash_text(text):
+    normalized = normalize_text(text)
+    return hash_bytes(normalized.encode('utf-8')) if normalized else None
+
+
+class ParseCache:
+    """Two-level (file bytes, normalized text) cache of parsed services."""
+
+    def __init__(self, collection, ttl_seconds=30 * 24 * 3600, max_entries=10000):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    def _count(self, counter):
+        self.collection.update_one({'_id': STATS_ID}, {'$inc': {counter: 1}}, upsert=True)
+
+    def _lookup(self, query):
+        now = datetime.utcnow()
+        entry = self.collection.find_one_and_update(
+            {**query, 'version': VERSION, 'expires_at': {'$gt': now}},
+            {'$set': {'last_used_at': now}, '$inc': {'hits': 1}}
+        )
+        return entry['services'] if entry else None
+
+    def get_by_file(self, file_hash):
+        """
+        Return cached services for the upload's bytes, or None.
+        """
+        services = self._lookup({'_id': file_hash})
+        self._count('file_hits' if services is not None else 'file_misses')
+        return services
+
+    def get_by_text(self, text_hash):
+        """
+        Return cached services for the normalized text, or None.
+        """
+        if text_hash is None:
+            return None
+        services = self._lookup({'text_hash': text_hash})
+        self._count('text_hits' if services is not None else 'text_misses')
+        return services
+
+    def put(self, file_hash, text_hash, services):
+        """
+        Store services under the file hash (and text hash), then trim.
+        """
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {'_id': file_hash},
+            {'$set': {
+                'text_hash': text_hash,
+                'services': services,
+                'version': VERSION,
+                'last_used_at': now,
+                'expires_at': now + timedelta(seconds=self.ttl_seconds)
+            }, '$setOnInsert': {'created_at': now, 'hits': 0}},
+            upsert=True
+        )
+        self._evict()
+
+    def _evict(self):
+        # estimated_document_count is O(1); the stats document is the extra one
+        excess = self.collection.estimated_document_count() - 1 - self.max_entries
+        if excess <= 0:
+            return
+        oldest = self.collection.find(
+            {'_id': {'$ne': STATS_ID}}, {'_id': 1}
+        ).sort('last_used_at', ASCENDING).limit(excess)
+        self.collection.delete_many({'_id': {'$in': [entry['_id'] for entry in oldest]}})
+        self.collection.update_one({'_id': STATS_ID}, {'$inc': {'evictions': excess}}, upsert=True)
+
+    def stats(self):
+        """
+        Return hit/miss counters, hit rate and current entry count.
+        """
+        stats = self.collection.find_one({'_id': STATS_ID}) or {}
+        stats.pop('_id', None)
+        hits = stats.get('file_hits', 0) + stats.get('text_hits', 0)
+        # Every lookup starts at the file level
+        lookups = stats.get('file_hits', 0) + stats.get('file_misses', 0)
+        stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0
+        stats['entries'] = self.collection.count_documents({'_id': {'$ne': STATS_ID}})
+        return stats
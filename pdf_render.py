@@ -0,0 +1,315 @@
+"""
+PDF rendering for the pdf_template.html policy documents.
+
+wkhtmltopdf has no server mode, so every document still runs the binary
+once; what the service keeps warm is everything around it: the binary is
+located and the options are built once, the worker threads are started
+up front, and at most ``workers`` renders run at a time so a burst of
+requests queues instead of starting dozens of wkhtmltopdf processes that
+fight over the CPU. Callers beyond ``workers + max_queue`` are turned away
+with ``RenderBusy`` (backpressure) instead of piling up.
+
+``FpdfEngine`` draws the same rendered HTML with fpdf inside the Python
+process, with no subprocess at all: it walks the template's blocks
+(header, client info, sections, signature) with BeautifulSoup, so the
+text always comes from pdf_template.html and template edits reach both
+engines. It is the fallback when wkhtmltopdf is missing or fails, and can
+be selected as the primary engine.
+"""
+import base64
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pdfkit
+from bs4 import BeautifulSoup
+from fpdf import FPDF
+
+# The form fields pdf_template.html is rendered from
+DOCUMENT_FIELDS = [
+    'client_name',
+    'document_type',
+    'program_name',
+    'print_name_title',
+    'date_review',
+    'date_revision',
+    'signature',
+]
+
+WKHTMLTOPDF_OPTIONS = {
+    'page-size': 'A4',
+    'margin-top': '0.75in',
+    'margin-right': '0.75in',
+    'margin-bottom': '0.75in',
+    'margin-left': '0.75in',
+    'encoding': 'UTF-8',
+    'quiet': '',
+}
+
+class RenderBusy(Exception):
+    """Raised when the render queue is full."""
+
+
+def document_fields(form):
+    """
+    Read the document fields from a form (or dict), stripping the data URL
+    header from the base64 signature.
+    """
+    fields = {name: form.get(name, '') or '' for name in DOCUMENT_FIELDS}
+    if fields['signature'] and ',' in fields['signature']:
+        fields['signature'] = fields['signature'].split(',')[1]
+    return fields
+
+
+def document_filename(fields, now=None):
+    """
+    <client>_<document type>_<timestamp>.pdf, using the first word of each.
+    """
+    client = (fields.get('client_name') or 'document').split()[0]
+    document_type = (fields.get('document_type') or 'policy').split()[0]
+    return f"{client}_{document_type}_{(now or datetime.now()).strftime('%Y%m%d%H%M%S')}.pdf"
+
+
+class WkhtmltopdfEngine:
+    """Render the template HTML with wkhtmltopdf."""
+
+    name = 'wkhtmltopdf'
+
+    def __init__(self, binary=None, options=None):
+        self.options = options or WKHTMLTOPDF_OPTIONS
+        try:
+            # Locates the binary once instead of on every from_string call
+            self.configuration = pdfkit.configuration(wkhtmltopdf=binary or '')
+        except OSError:
+            self.configuration = None
+
+    def available(self):
+        return self.configuration is not None
+
+    def render(self, html, fields):
+        if self.configuration is None:
+            raise OSError("wkhtmltopdf executable not found")
+        return pdfkit.from_string(html, False, options=self.options, configuration=self.configuration)
+
+
+def latin1_text(text):
+    # The core fpdf fonts only cover latin-1
+    return str(text).replace('•', '-').encode('latin-1', 'replace').decode('latin-1')
+
+
+def _text(element):
+    return latin1_text(' '.join(element.get_text().split()))
+
+
+def _classes(element):
+    return element.get('class') or []
+
+
+class _NumberedPDF(FPDF):
+    """FPDF with a "Page n of N" footer (N filled in by alias_nb_pages)."""
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', '', 9)
+        self.set_text_color(102, 102, 102)
+        self.cell(0, 5, f"Page {self.page_no()} of {{nb}}", align='C')
+        self.set_text_color(0, 0, 0)
+
+
+class FpdfEngine:
+    """Draw the rendered pdf_template.html with fpdf, in process."""
+
+    name = 'fpdf'
+    HEADING_SIZES = {'h1': 15, 'h2': 13, 'h3': 12, 'h4': 11, 'h5': 10, 'h6': 10}
+
+    def available(self):
+        return True
+
+    def render(self, html, fields):
+        pdf = _NumberedPDF(format='A4')
+        pdf.alias_nb_pages()
+        pdf.set_margins(19, 19, 19)
+        pdf.set_auto_page_break(True, margin=22)
+        pdf.add_page()
+        width = pdf.w - pdf.l_margin - pdf.r_margin
+
+        soup = BeautifulSoup(html, 'html.parser')
+        for block in (soup.body or soup).find_all(recursive=False):
+            classes = _classes(block)
+            if 'page-number' in classes:
+                # Numbered by the footer instead
+                continue
+            if 'header' in classes or 'document-title' in classes:
+                for heading in block.find_all(list(self.HEADING_SIZES)):
+                    pdf.set_font('Arial', 'B', self.HEADING_SIZES[heading.name])
+                    pdf.multi_cell(width, 7, _text(heading), align='C')
+                pdf.ln(4)
+            elif 'client-info' in classes:
+                pdf.set_fill_color(249, 249, 249)
+                pdf.set_draw_color(221, 221, 221)
+                pdf.set_font('Arial', '', 11)
+                pdf.multi_cell(width, 9, _text(block), border=1, fill=True)
+                pdf.ln(4)
+            elif 'signature-section' in classes:
+                self._signature_section(pdf, block, width)
+            else:
+                self._section(pdf, block, width)
+
+        output = pdf.output(dest='S')
+        return output.encode('latin-1') if isinstance(output, str) else bytes(output)
+
+    def _section(self, pdf, block, width):
+        for element in block.find_all(recursive=False) or [block]:
+            if element.name in self.HEADING_SIZES:
+                pdf.set_font('Arial', 'B', self.HEADING_SIZES[element.name])
+                pdf.multi_cell(width, 6, _text(element))
+                pdf.line(pdf.l_margin, pdf.get_y(), pdf.l_margin + width, pdf.get_y())
+                pdf.ln(2)
+            elif element.name in ('ol', 'ul'):
+                pdf.set_font('Arial', '', 10)
+                for number, item in enumerate(element.find_all('li', recursive=False), 1):
+                    marker = f"{number}." if element.name == 'ol' else '-'
+                    pdf.multi_cell(width, 5, f"{marker} {_text(item)}")
+                    pdf.ln(1)
+            elif element.name == 'div' and element.find_all(recursive=False):
+                self._section(pdf, element, width)
+            elif _text(element):
+                pdf.set_font('Arial', '', 10)
+                pdf.multi_cell(width, 5, _text(element))
+                pdf.ln(1)
+        pdf.ln(3)
+
+    def _signature_section(self, pdf, block, width):
+        pdf.set_draw_color(221, 221, 221)
+        pdf.line(pdf.l_margin, pdf.get_y(), pdf.l_margin + width, pdf.get_y())
+        pdf.ln(4)
+        pdf.set_font('Arial', '', 10)
+        half = width * 0.45
+        for element in block.find_all(recursive=False):
+            columns = element.find_all('div', recursive=False)
+            if 'signature-line' in _classes(element):
+                pdf.ln(10)
+                line_y = pdf.get_y()
+                image = element.find('img')
+                if image is not None and ',' in image.get('src', ''):
+                    self._draw_signature(pdf, image['src'].split(',', 1)[1], pdf.l_margin + width - half, line_y - 18, half)
+                pdf.set_draw_color(0, 0, 0)
+                pdf.line(pdf.l_margin, line_y, pdf.l_margin + half, line_y)
+                pdf.line(pdf.l_margin + width - half, line_y, pdf.l_margin + width, line_y)
+                pdf.cell(half, 6, _text(columns[0]) if columns else '', align='C')
+                pdf.cell(width - 2 * half, 6, '')
+                pdf.cell(half, 6, _text(columns[1]) if len(columns) > 1 else '', align='C', ln=1)
+                pdf.ln(4)
+            elif columns:
+                for column in columns:
+                    pdf.cell(width / len(columns), 6, _text(column))
+                pdf.ln(8)
+            else:
+                pdf.multi_cell(width, 6, _text(element))
+                pdf.ln(2)
+
+    def _draw_signature(self, pdf, signature, x, y, max_width):
+        # fpdf reads images from a path, so the PNG goes through a temp file
+        try:
+            data = base64.b64decode(signature)
+        except (ValueError, TypeError):
+            return
+        fd, path = tempfile.mkstemp(suffix='.png')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            pdf.image(path, x=x, y=y, h=16)
+        except Exception as e:
+            print(f"Error drawing signature: {e}")
+        finally:
+            os.remove(path)
+
+
+def create_engine(name, binary=None):
+    """
+    Build an engine by name ('wkhtmltopdf' or 'fpdf'). Any object with
+    name, available() and render(html, fields) can be used instead.
+    """
+    if name == 'wkhtmltopdf':
+        return WkhtmltopdfEngine(binary=binary)
+    if name == 'fpdf':
+        return FpdfEngine()
+    raise ValueError(f"Unknown PDF engine: {name}")
+
+
+class RenderService:
+    """
+    A bounded pool of render workers in front of an engine, with a
+    fallback engine and backpressure.
+    """
+
+    def __init__(self, engine, fallback=None, workers=4, max_queue=16, queue_timeout=5):
+        self.engine = engine
+        self.fallback = fallback
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pdf-render')
+        self.slots = threading.BoundedSemaphore(workers + max_queue)
+        self.lock = threading.Lock()
+        self.counters = {'rendered': 0, 'fallbacks': 0, 'rejected': 0, 'failed': 0, 'render_seconds': 0.0}
+
+    def warm(self):
+        """
+        Start every worker thread and switch to the fallback up front if
+        the primary engine cannot run here.
+        """
+        if not self.engine.available() and self.fallback is not None:
+            print(f"PDF engine {self.engine.name} unavailable, using {self.fallback.name}")
+            self.engine, self.fallback = self.fallback, None
+        barrier = threading.Barrier(self.workers)
+        for future in [self.executor.submit(barrier.wait, 10) for _ in range(self.workers)]:
+            future.result()
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.counters[key] += amount
+
+    def _render(self, html, fields):
+        started = time.perf_counter()
+        try:
+            pdf = self.engine.render(html, fields)
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            print(f"PDF engine {self.engine.name} failed ({e}), using {self.fallback.name}")
+            self._count('fallbacks')
+            pdf = self.fallback.render(html, fields)
+        self._count('render_seconds', time.perf_counter() - started)
+        return pdf
+
+    def submit(self, html, fields):
+        """
+        Queue a render and return its future. Raises RenderBusy if the
+        queue stays full for ``queue_timeout`` seconds.
+        """
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            self._count('rejected')
+            raise RenderBusy("PDF render queue is full")
+        future = self.executor.submit(self._render, html, fields)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        self.slots.release()
+        self._count('failed' if future.exception() else 'rendered')
+
+    def render(self, html, fields, timeout=None):
+        """
+        Render one document and return the PDF bytes.
+        """
+        return self.submit(html, fields).result(timeout=timeout)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['engine'] = self.engine.name
+        stats['fallback'] = self.fallback.name if self.fallback else None
+        return stats
@@ -0,0 +1,31 @@
+"""
+In-memory PDF text extraction.
+
+Documents are opened straight from the uploaded bytes (no temp file) and
+page text is collected in a list and joined once, which gives the same text
+as appending page by page without the quadratic copying. ``max_pages``
+caps how much of a very long document is read.
+"""
+import fitz
+
+
+def iter_page_texts(data, max_pages=None):
+    """
+    Yield the text of each page in turn, stopping after ``max_pages``.
+    """
+    with fitz.open(stream=data, filetype='pdf') as doc:
+        for index, page in enumerate(doc):
+            if max_pages and index >= max_pages:
+                break
+            yield page.get_text()
+
+
+def extract_text(data, max_pages=None):
+    """
+    Return the text of a PDF given its bytes ('' if it cannot be read).
+    """
+    try:
+        return ''.join(iter_page_texts(data, max_pages))
+    except Exception as e:
+        print(f"Error extracting text from PDF: {e}")
+        return ''
@@ -160,6 +160,45 @@ document.addEventListener('DOMContentLoaded', function() {
         pdfSection.classList.remove('section-active');
     });
 
+    // Poll a queued PDF extraction job until it finishes
+    async function waitForExtractJob(jobId) {
+        while (true) {
+            const response = await fetch(`http://localhost:5000/api/extract-pdf/${jobId}`);
+            if (!response.ok) {
+                throw new Error('Server responded with an error');
+            }
+
+            const job = await response.json();
+            if (job.status === 'done') {
+                return job.result;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error);
+            }
+
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
+    async function waitForExportJob(jobId) {
+        while (true) {
+            const response = await fetch(`http://localhost:5000/api/export-pdf/${jobId}`);
+            if (!response.ok) {
+                throw new Error('Server responded with an error');
+            }
+
+            const job = await response.json();
+            if (job.status === 'done') {
+                return `http://localhost:5000${job.download_url}`;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error);
+            }
+
+            await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+    }
+
     // PDF Form Submission
     pdfForm.addEventListener('submit', async (e) => {
         e.preventDefault();
@@ -167,7 +206,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         const formData = new FormData(pdfForm);
         try {
-            const response = await fetch('http://localhost:5000/api/extract-pdf', {
+            const response = await fetch('http://localhost:5000/api/extract-pdf?async=true', {
                 method: 'POST',
                 body: formData
             });
@@ -176,7 +215,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error('Server responded with an error');
             }
             
-            const data = await response.json();
+            const job = await response.json();
+            const data = await waitForExtractJob(job.job_id);
             displayResults(data);
             
             // Switch to results section
@@ -292,6 +332,13 @@ document.addEventListener('DOMContentLoaded', function() {
             if (!response.ok) {
                 throw new Error('Server responded with an error');
             }
+
+            // Large reports are generated in the background
+            if (response.status === 202) {
+                const job = await response.json();
+                window.location.href = await waitForExportJob(job.job_id);
+                return;
+            }
             
             // Handle PDF download
             const blob = await response.blob();
@@ -809,10 +856,9 @@ function updateCaregiverSchedule(data) {
     // Clear existing content
     calendarGrid.innerHTML = '';
     
-    // Get current month and year
-    const currentDate = new Date();
-    const currentMonth = currentDate.getMonth();
-    const currentYear = currentDate.getFullYear();
+    // Month and year the server returned (month is 1-based)
+    const currentMonth = data.month - 1;
+    const currentYear = data.year;
     
     // Get first day of the month
     const firstDay = new Date(currentYear, currentMonth, 1).getDay();
@@ -839,11 +885,9 @@ function updateCaregiverSchedule(data) {
         dayNumber.textContent = day;
         dayElement.appendChild(dayNumber);
         
-        // Check if there are any schedules for this day
-        const daySchedules = data.filter(schedule => {
-            const scheduleDate = new Date(schedule.date);
-            return scheduleDate.getDate() === day;
-        });
+        // Schedules for this day, already grouped by the server
+        const dateKey = `${currentYear}-${String(currentMonth + 1).padStart(2, '0')}-${String(day).padStart(2, '0')}`;
+        const daySchedules = data.days[dateKey] || [];
         
         // Add schedule items for this day
         daySchedules.forEach(schedule => {
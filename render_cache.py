@@ -0,0 +1,123 @@
+"""
+In-process cache of rendered policy documents.
+
+Coordinators preview the same form several times and then generate it, so
+rendered HTML and PDF bytes are kept keyed on a hash of the normalized
+form fields (signature included). Entries are evicted least recently used
+once their total size passes ``max_bytes``, and the whole cache is dropped
+when the template file's modification time or size changes.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+HTML = 'html'
+PDF = 'pdf'
+
+
+def normalize_fields(fields):
+    """
+    Collapse whitespace in every field so cosmetic differences in the form
+    map to the same document.
+    """
+    return {name: ' '.join(str(value or '').split()) for name, value in sorted(fields.items())}
+
+
+def _size(value):
+    return len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+
+
+def fields_key(fields):
+    """
+    Content hash of the normalized fields.
+    """
+    payload = json.dumps(normalize_fields(fields), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """LRU cache of rendered HTML/PDF bytes with a byte budget."""
+
+    def __init__(self, template_path, max_bytes=64 * 1024 * 1024, check_interval=1.0):
+        self.template_path = template_path
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.template_version = self._template_version()
+        self.checked_at = time.monotonic()
+        self.counters = {
+            'hits': {HTML: 0, PDF: 0},
+            'misses': {HTML: 0, PDF: 0},
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    def _template_version(self):
+        try:
+            stat = os.stat(self.template_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _check_template(self):
+        # Called with the lock held; stats the template at most once per interval
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+        version = self._template_version()
+        if version != self.template_version:
+            self.template_version = version
+            if self.entries:
+                self.counters['invalidations'] += 1
+            self.entries.clear()
+            self.bytes = 0
+
+    def get(self, kind, key):
+        """
+        Return the cached HTML (str) or PDF (bytes) for a key, or None.
+        """
+        with self.lock:
+            self._check_template()
+            value = self.entries.get((kind, key))
+            if value is None:
+                self.counters['misses'][kind] += 1
+                return None
+            self.entries.move_to_end((kind, key))
+            self.counters['hits'][kind] += 1
+            return value
+
+    def put(self, kind, key, value):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop((kind, key), None)
+            if old is not None:
+                self.bytes -= _size(old)
+            self.entries[(kind, key)] = value
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= _size(evicted)
+                self.counters['evictions'] += 1
+
+    def stats(self):
+        with self.lock:
+            hits = sum(self.counters['hits'].values())
+            misses = sum(self.counters['misses'].values())
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': dict(self.counters['hits']),
+                'misses': dict(self.counters['misses']),
+                'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+                'evictions': self.counters['evictions'],
+                'invalidations': self.counters['invalidations'],
+            }
@@ -0,0 +1,274 @@
+"""
+Materialized dashboard rollups.
+
+Running totals for the summary endpoint live in one document of the
+``dashboard_rollups`` collection. The routes that write timesheet and
+schedule documents adjust it with ``$inc`` through ``apply_change``; writes
+made elsewhere (claims and payroll are loaded outside this app) are picked
+up by the change-stream consumer in ``watch`` when it runs, or by the
+periodic ``rebuild`` that ``needs_rebuild`` asks for once the document is
+older than its max age. That rebuild runs on a background worker: the
+reader that wins ``claim_rebuild`` queues it and keeps serving the current
+totals meanwhile.
+
+Scheduled hours are kept per day and summed from today on at read time, so
+a shift later today still counts (previously ``date >= now``). Past days
+are never added and are dropped by ``rebuild`` and ``prune``, so the map
+only holds today and the days ahead.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_ID = 'summary'
+CLAIM_STATUSES = ('unpaid', 'denied', 'voided', 'replaced')
+WATCHED_COLLECTIONS = ('claims', 'timesheet', 'schedule', 'payroll')
+DAY_PREFIX = 'scheduled_hours_by_day.'
+REBUILD_TIMEOUT = timedelta(minutes=10)  # A claimed rebuild not finished by then can be claimed again
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def _day_key(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    return None
+
+
+def _today(current_date=None):
+    return (current_date or datetime.now()).strftime('%Y-%m-%d')
+
+
+def contribution(collection_name, doc):
+    """
+    Return the counters a single document adds to the rollup.
+    """
+    if not doc:
+        return {}
+
+    counters = {}
+    if collection_name == 'claims':
+        counters['total_claims'] = 1
+        if doc.get('status') in CLAIM_STATUSES:
+            counters[f"{doc['status']}_claims"] = 1
+    elif collection_name == 'timesheet':
+        hours = _number(doc.get('hours'))
+        if doc.get('paid') is False:
+            counters['unpaid_hours'] = hours
+        if doc.get('status') == 'approved':
+            counters['worked_hours'] = hours
+    elif collection_name == 'schedule':
+        # Scheduled hours are bucketed per day so "from today on" can be
+        # answered at read time without rescanning the schedule
+        day = _day_key(doc.get('date'))
+        if day:
+            counters[f'{DAY_PREFIX}{day}'] = _number(doc.get('hours'))
+    elif collection_name == 'payroll':
+        amount = _number(doc.get('amount'))
+        counters['payroll_total'] = amount
+        if doc.get('status') == 'paid':
+            counters['payroll_paid'] = amount
+    return counters
+
+
+def apply_change(rollups_collection, collection_name, before=None, after=None, current_date=None):
+    """
+    Apply the difference between two versions of a document to the rollup.
+
+    Pass ``before=None`` for inserts and ``after=None`` for deletes.
+    Changes to days before today are skipped; they no longer count.
+    """
+    increments = contribution(collection_name, after)
+    for key, value in contribution(collection_name, before).items():
+        increments[key] = increments.get(key, 0) - value
+    today = _today(current_date)
+    increments = {
+        key: value for key, value in increments.items()
+        if value and not (key.startswith(DAY_PREFIX) and key[len(DAY_PREFIX):] < today)
+    }
+    if not increments:
+        return
+
+    # A document created by this upsert holds only the increments; without
+    # 'last_rebuilt' it is rebuilt on the next read instead of being served
+    rollups_collection.update_one(
+        {'_id': ROLLUP_ID},
+        {
+            '$inc': increments,
+            '$set': {'last_updated': datetime.utcnow()},
+            '$setOnInsert': {'last_rebuilt': None}
+        },
+        upsert=True
+    )
+
+
+def _sum(collection, field, match=None):
+    pipeline = [{'$group': {'_id': None, 'total': {'$sum': f'${field}'}}}]
+    if match:
+        pipeline.insert(0, {'$match': match})
+    result = list(collection.aggregate(pipeline))
+    return result[0]['total'] if result else 0
+
+
+def rebuild(db, rollups_collection, current_date=None):
+    """
+    Recompute the rollup document from the source collections.
+    """
+    today = (current_date or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    claims = db['claims']
+    claim_counts = {
+        f'{status}_claims': 0 for status in CLAIM_STATUSES
+    }
+    total_claims = 0
+    for entry in claims.aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]):
+        total_claims += entry['count']
+        if entry['_id'] in CLAIM_STATUSES:
+            claim_counts[f"{entry['_id']}_claims"] = entry['count']
+
+    scheduled_hours_by_day = {}
+    for entry in db['schedule'].aggregate([
+        {'$match': {'date': {'$type': 'date', '$gte': today}}},
+        {'$group': {
+            '_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$date'}},
+            'total': {'$sum': '$hours'}
+        }}
+    ]):
+        scheduled_hours_by_day[entry['_id']] = entry['total']
+
+    summary = {
+        'total_claims': total_claims,
+        **claim_counts,
+        'unpaid_hours': _sum(db['timesheet'], 'hours', {'paid': False}),
+        'worked_hours': _sum(db['timesheet'], 'hours', {'status': 'approved'}),
+        'scheduled_hours_by_day': scheduled_hours_by_day,
+        'payroll_paid': _sum(db['payroll'], 'amount', {'status': 'paid'}),
+        'payroll_total': _sum(db['payroll'], 'amount'),
+        'last_updated': datetime.utcnow(),
+        'last_rebuilt': datetime.utcnow()
+    }
+    rollups_collection.replace_one({'_id': ROLLUP_ID}, summary, upsert=True)
+    summary['_id'] = ROLLUP_ID
+    return summary
+
+
+def claim_rebuild(rollups_collection, current_time=None):
+    """
+    Mark the rollup as being rebuilt. True for the one caller that should
+    queue the rebuild, False while another claim is younger than
+    ``REBUILD_TIMEOUT``. ``rebuild`` replaces the document, which releases
+    the claim.
+    """
+    now = current_time or datetime.utcnow()
+    try:
+        # Upserting onto an existing document that failed the filter
+        # collides on _id, so only one worker gets the claim
+        rollups_collection.find_one_and_update(
+            {'_id': ROLLUP_ID, '$or': [
+                {'rebuild_started': None},
+                {'rebuild_started': {'$lt': now - REBUILD_TIMEOUT}}
+            ]},
+            {'$set': {'rebuild_started': now}, '$setOnInsert': {'last_rebuilt': None}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def prune(rollups_collection, current_date=None):
+    """
+    Drop scheduled hours for days before today from the rollup.
+    """
+    summary = rollups_collection.find_one({'_id': ROLLUP_ID}, {'scheduled_hours_by_day': 1})
+    today = _today(current_date)
+    past = [
+        f'{DAY_PREFIX}{day}' for day in (summary or {}).get('scheduled_hours_by_day', {})
+        if day < today
+    ]
+    if past:
+        rollups_collection.update_one({'_id': ROLLUP_ID}, {'$unset': {key: '' for key in past}})
+
+
+def needs_rebuild(summary, max_age, current_time=None):
+    """
+    True when the rollup is missing, was started by an increment rather
+    than a rebuild, or was last rebuilt more than ``max_age`` seconds ago.
+    """
+    if summary is None or not summary.get('last_rebuilt'):
+        return True
+    if not max_age:
+        return False
+    return (current_time or datetime.utcnow()) - summary['last_rebuilt'] > timedelta(seconds=max_age)
+
+
+def enable_change_images(db):
+    """
+    Turn on pre- and post-images for the rollup sources; ``watch`` needs
+    both. Requires MongoDB 6.0+ on a replica set.
+    """
+    existing = set(db.list_collection_names())
+    for name in WATCHED_COLLECTIONS:
+        if name not in existing:
+            db.create_collection(name)
+        db.command('collMod', name, changeStreamPreAndPostImages={'enabled': True})
+
+
+def read_summary(rollups_collection, current_date=None):
+    """
+    Return the rollup document, with scheduled hours summed from today on.
+    """
+    summary = rollups_collection.find_one({'_id': ROLLUP_ID})
+    if summary is None:
+        return None
+
+    today = _today(current_date)
+    summary['scheduled_hours'] = sum(
+        hours for day, hours in summary.get('scheduled_hours_by_day', {}).items()
+        if day >= today
+    )
+    return summary
+
+
+def watch(db, rollups_collection):
+    """
+    Consume change streams for the rollup sources and keep the totals current.
+
+    Needs a replica set. Both sides of a change come from the images
+    stored with it (``changeStreamPreAndPostImages``, turned on by
+    ``enable_change_images``): looking the document up at read time
+    (``updateLookup``) would see later updates too and count them twice.
+    When a pre-image is missing the rollup is rebuilt instead of guessed.
+    Past days are pruned from the scheduled hours as the date rolls over.
+    """
+    enable_change_images(db)
+    pipeline = [{'$match': {
+        'ns.coll': {'$in': list(WATCHED_COLLECTIONS)},
+        'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}
+    }}]
+    with db.watch(
+        pipeline,
+        full_document='required',
+        full_document_before_change='whenAvailable'
+    ) as stream:
+        pruned_on = None
+        for change in stream:
+            if pruned_on != _today():
+                prune(rollups_collection)
+                pruned_on = _today()
+
+            name = change['ns']['coll']
+            operation = change['operationType']
+            before = change.get('fullDocumentBeforeChange')
+            after = change.get('fullDocument')
+
+            if operation != 'insert' and before is None:
+                logger.warning(f"No pre-image for {operation} on {name}, rebuilding rollup")
+                rebuild(db, rollups_collection)
+                continue
+
+            apply_change(rollups_collection, name, before, after)
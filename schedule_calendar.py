@@ -0,0 +1,166 @@
+"""
+Month and day views of the caregiver schedule for the dashboard calendar.
+
+Both views read one indexed date range from the ``schedule`` collection and
+project only the fields the calendar draws. The month view is grouped on
+the server, by day for the grid and by caregiver for the legend, so the
+browser no longer filters the whole month for every cell. Built views are
+kept for a short TTL, each with a content hash that the routes send as an
+ETag. Paging back to a month the browser has already seen then costs a 304
+and no query.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+MONTH_PROJECTION = {
+    'date': 1, 'caregiver_id': 1, 'caregiver_name': 1, 'client_name': 1,
+    'color': 1, 'start_time': 1, 'end_time': 1, 'hours': 1, 'status': 1,
+}
+DAY_PROJECTION = dict(MONTH_PROJECTION, service_type=1, address=1)
+
+
+def month_range(year, month):
+    """
+    [first day, first day of next month) for a 1-based month.
+    """
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+
+def day_range(day):
+    return day, day + timedelta(days=1)
+
+
+def parse_month(args, now=None):
+    """
+    (year, month) from ``month``/``year`` query arguments, defaulting to the
+    current month. Raises ValueError for values out of range.
+    """
+    now = now or datetime.now()
+    try:
+        year = int(args.get('year') or now.year)
+        month = int(args.get('month') or now.month)
+    except ValueError:
+        raise ValueError("month and year must be numbers")
+    if not 1 <= month <= 12 or not 1900 <= year <= 9999:
+        raise ValueError("month must be 1-12 and year a four-digit year")
+    return year, month
+
+
+def parse_day(value):
+    """
+    Midnight of a YYYY-MM-DD date. Raises ValueError otherwise.
+    """
+    try:
+        return datetime.strptime(value or '', '%Y-%m-%d')
+    except ValueError:
+        raise ValueError("date must be in YYYY-MM-DD format")
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def appointment(doc):
+    """
+    JSON-ready copy of a projected schedule document.
+    """
+    item = {key: value for key, value in doc.items() if key not in ('_id', 'date')}
+    item['id'] = str(doc['_id'])
+    if item.get('caregiver_id') is not None:
+        item['caregiver_id'] = str(item['caregiver_id'])
+    if isinstance(doc.get('date'), datetime):
+        item['date'] = doc['date'].strftime('%Y-%m-%d')
+    return item
+
+
+def _by_time(item):
+    return (str(item.get('start_time') or ''), str(item.get('caregiver_name') or ''))
+
+
+def month_view(docs, year, month):
+    """
+    {'year', 'month', 'days': {date: [appointments]}, 'caregivers': [...]}
+    for the schedule documents of one month.
+    """
+    days = {}
+    caregivers = {}
+    for doc in docs:
+        item = appointment(doc)
+        if 'date' not in item:
+            continue
+        days.setdefault(item['date'], []).append(item)
+        key = item.get('caregiver_id') or item.get('caregiver_name') or ''
+        caregiver = caregivers.setdefault(key, {
+            'caregiver_id': item.get('caregiver_id'),
+            'caregiver_name': item.get('caregiver_name'),
+            'color': item.get('color'),
+            'appointments': 0,
+            'days': set(),
+            'hours': 0.0,
+        })
+        caregiver['appointments'] += 1
+        caregiver['days'].add(item['date'])
+        caregiver['hours'] += _number(item.get('hours'))
+
+    for items in days.values():
+        items.sort(key=_by_time)
+    legend = []
+    for caregiver in sorted(caregivers.values(), key=lambda c: str(c['caregiver_name'] or '')):
+        caregiver['days'] = len(caregiver['days'])
+        caregiver['hours'] = round(caregiver['hours'], 2)
+        legend.append(caregiver)
+    return {'year': year, 'month': month, 'days': dict(sorted(days.items())), 'caregivers': legend}
+
+
+def day_view(docs):
+    """
+    The appointments of one day, ordered by start time and caregiver.
+    """
+    return sorted((appointment(doc) for doc in docs), key=_by_time)
+
+
+def content_etag(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:32]
+
+
+class ViewCache:
+    """Short-lived LRU of built views and their ETags."""
+
+    def __init__(self, ttl=30, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, build):
+        """
+        (payload, etag) for a key, calling ``build()`` when it is missing or
+        older than the TTL.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now < entry[2]:
+                self.entries.move_to_end(key)
+                return entry[0], entry[1]
+        payload = build()
+        etag = content_etag(payload)
+        with self.lock:
+            self.entries[key] = (payload, etag, now + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return payload, etag
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,283 @@
+"""
+Tiered extraction of service authorization fields.
+
+An authorization has header fields (payer, member, auth number) and one
+or more service lines (procedure code, modifier, dates, units, rate).
+Compiled regexes run first: every procedure code starts a service line,
+and each field is scored 1.0 when exactly one value is found, 0.5 when
+several different values compete, 0 when nothing matches. Only fields
+below CONFIDENCE_THRESHOLD are handed to the LLM, with a prompt listing
+just those fields, so complete documents never pay for an LLM call. The
+modifier and rate are optional: a line with its procedure code, dates and
+units is accepted without them. Long
+documents are cut down by ``select_relevant_text`` to the windows that
+look like authorization details before prompting.
+"""
+import re
+import uuid
+from datetime import datetime
+
+CONFIDENCE_THRESHOLD = 0.9
+
+# (service key, label used in prompts, hint for the LLM)
+FIELDS = [
+    ('payer', 'Payer', "Look for insurance company name or MINNESOTA DEPT OF HUMAN SERVICES"),
+    ('memberId', 'Member ID', "Look for a member ID number, usually following 'Member ID' or similar"),
+    ('serviceAuthNumber', 'Service Auth #', "Look for a service authorization number, usually following 'Service Auth #' or similar"),
+    ('procedureServiceCode', 'Procedure Service Code', "Look for a code like S5XXX where X are digits"),
+    ('modifierCode', 'Modifier Code', "Look for UA or UC, usually following the procedure code"),
+    ('dates', 'Service Dates', "Look for a date range in format MM/DD/YYYY to MM/DD/YYYY"),
+    ('units', 'Units', "Look for a number following 'Units' or similar"),
+    ('serviceRate', 'Service Rate', "Look for a dollar amount following 'Service Rate' or similar"),
+]
+FIELD_KEYS = [key for key, _, _ in FIELDS]
+FIELD_LABELS = {key: label for key, label, _ in FIELDS}
+FIELD_HINTS = {key: hint for key, _, hint in FIELDS}
+HEADER_KEYS = ['payer', 'memberId', 'serviceAuthNumber']
+LINE_KEYS = ['procedureServiceCode', 'modifierCode', 'dates', 'units', 'serviceRate']
+REQUIRED_LINE_KEYS = ['procedureServiceCode', 'dates', 'units']
+
+PAYER_RE = re.compile(r'MINNESOTA\s+DEPT\.?\s+OF\s+HUMAN\s+SERVICES', re.IGNORECASE)
+MEMBER_ID_RE = re.compile(r'Member ID[:\s]+(\d+)', re.IGNORECASE)
+SERVICE_AUTH_RE = re.compile(r'Service Auth #[:\s]+(\d+)', re.IGNORECASE)
+PROCEDURE_CODE_RE = re.compile(r'\bS5\d{3}\b')
+MODIFIER_AFTER_CODE_RE = re.compile(r'\bS5\d{3}[,\s]+(UA|UC)\b')
+MODIFIER_RE = re.compile(r'\b(UA|UC)\b')
+DATES_RE = re.compile(r'(\d{2}/\d{2}/\d{4})\s+[Tt]o\s+(\d{2}/\d{2}/\d{4})')
+UNITS_RE = re.compile(r'Units[:\s]+([\d.]+)', re.IGNORECASE)
+SERVICE_RATE_RE = re.compile(r'Service Rate[:\s]+\$?([\d,]*\.?\d+)', re.IGNORECASE)
+
+
+def _score(values, confidence=1.0):
+    """
+    Turn the distinct matches for a field into (value, confidence).
+    """
+    distinct = list(dict.fromkeys(v.strip() for v in values if v and v.strip()))
+    if not distinct:
+        return '', 0.0
+    if len(distinct) > 1:
+        return distinct[0], 0.5
+    return distinct[0], confidence
+
+
+def _line_fields(text):
+    """
+    Score the service-line fields found in a block of text.
+    """
+    fields = {
+        'procedureServiceCode': _score(PROCEDURE_CODE_RE.findall(text)),
+        'dates': _score([f"{start} To {end}" for start, end in DATES_RE.findall(text)]),
+        'units': _score(UNITS_RE.findall(text)),
+        'serviceRate': _score([rate.replace(',', '') for rate in SERVICE_RATE_RE.findall(text)]),
+    }
+
+    # A modifier right after the procedure code is reliable; a stray UA/UC is not
+    modifier = _score(MODIFIER_AFTER_CODE_RE.findall(text))
+    if not modifier[0]:
+        modifier = _score(MODIFIER_RE.findall(text), confidence=0.5)
+    fields['modifierCode'] = modifier
+
+    return fields
+
+
+def regex_extract(text):
+    """
+    Extract the header fields and every service line with the compiled
+    regexes. Returns (header, lines) where header is {key: (value,
+    confidence)} and lines is a list of the same for each service line.
+    """
+    header = {
+        'payer': _score([m.group(0).upper() for m in PAYER_RE.finditer(text)]),
+        'memberId': _score(MEMBER_ID_RE.findall(text)),
+        'serviceAuthNumber': _score(SERVICE_AUTH_RE.findall(text)),
+    }
+
+    # Each procedure code starts a service line that runs to the next code
+    starts = [match.start() for match in PROCEDURE_CODE_RE.finditer(text)]
+    if not starts:
+        return header, [_line_fields(text)]
+
+    document = _line_fields(text)
+    lines = []
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else len(text)
+        line = _line_fields(text[start:end])
+        # Dates, units or rate given once for the whole document apply to every line
+        for key in ('dates', 'units', 'serviceRate'):
+            if not line[key][0] and document[key][1] == 1.0:
+                line[key] = document[key]
+        lines.append(line)
+
+    # The same code and modifier listed twice is one line, not two
+    unique = {}
+    for line in lines:
+        unique.setdefault((line['procedureServiceCode'][0], line['modifierCode'][0]), line)
+    return header, list(unique.values())
+
+
+def fields_needing_llm(header, lines, threshold=CONFIDENCE_THRESHOLD):
+    """
+    Return the keys the LLM should be asked for. If any required
+    service-line field is uncertain every line field is requested, so the
+    LLM's lines are complete and can replace the regex ones.
+    """
+    needed = [key for key in HEADER_KEYS if header[key][1] < threshold]
+    if any(line[key][1] < threshold for line in lines for key in REQUIRED_LINE_KEYS):
+        needed += LINE_KEYS
+    return needed
+
+
+def parse_date_range(dates):
+    """
+    Turn 'MM/DD/YYYY To MM/DD/YYYY' into (start, end) datetimes, or
+    (None, None) when the range cannot be read.
+    """
+    match = DATES_RE.search(dates or '')
+    if not match:
+        return None, None
+    try:
+        return tuple(datetime.strptime(value, '%m/%d/%Y') for value in match.groups())
+    except ValueError:
+        return None, None
+
+
+def build_service(values):
+    """
+    Build a service_auth record from extracted field values.
+    """
+    units = values.get('units', '')
+    try:
+        units_float = float(units) if units else 0
+    except ValueError:
+        units_float = 0
+    start_date, end_date = parse_date_range(values.get('dates', ''))
+
+    return {
+        "id": str(uuid.uuid4()),
+        "payer": values.get('payer', ''),
+        "memberId": values.get('memberId', ''),
+        "serviceAuthNumber": values.get('serviceAuthNumber', ''),
+        "procedureServiceCode": values.get('procedureServiceCode', ''),
+        "modifierCode": values.get('modifierCode', ''),
+        "dates": values.get('dates', ''),
+        # Typed copies of the date range for report filters
+        "startDate": start_date,
+        "endDate": end_date,
+        "units": units,
+        "serviceRate": values.get('serviceRate', ''),
+        "usedUnits": "0",
+        "totalHoursRemaining": f"{units_float} hrs",
+        # Typed ledger balances, see unit_ledger
+        "unitsAuthorized": float(units_float),
+        "unitsUsed": 0.0,
+        "hoursPerDay": "3",  # Default value
+        "hoursPerWeek": "21",  # Default value
+    }
+
+
+def parse_tiered(text, llm_fill=None, threshold=CONFIDENCE_THRESHOLD):
+    """
+    Run the regex tier, then ask ``llm_fill(text, keys)`` only for the
+    fields that are missing or ambiguous. ``llm_fill`` returns a list of
+    service lines, each {key: value} for the requested keys; blank values
+    keep the regex result.
+
+    Returns (services, info): one {key: value} dict per service line, and
+    info recording the tier, the fields sent to the LLM and the regex
+    confidence per field.
+    """
+    header, lines = regex_extract(text)
+    header_values = {key: value for key, (value, _) in header.items()}
+    line_values = [{key: value for key, (value, _) in line.items()} for line in lines]
+    needed = fields_needing_llm(header, lines, threshold)
+    info = {
+        'tier': 'regex',
+        'llm_fields': [],
+        'confidence': {
+            'header': {key: confidence for key, (_, confidence) in header.items()},
+            'lines': [{key: confidence for key, (_, confidence) in line.items()} for line in lines],
+        },
+    }
+
+    if needed and llm_fill is not None:
+        info['tier'] = 'llm'
+        info['llm_fields'] = needed
+        llm_lines = llm_fill(text, needed)
+
+        for key in HEADER_KEYS:
+            if key in needed:
+                value = next((line.get(key) for line in llm_lines if line.get(key)), '')
+                header_values[key] = value or header_values[key]
+
+        if llm_lines and LINE_KEYS[0] in needed:
+            # The LLM's line set wins; regex values fill its blanks when the
+            # two agree on how many lines there are
+            same_shape = len(llm_lines) == len(line_values)
+            merged = []
+            for index, llm_line in enumerate(llm_lines):
+                line = line_values[index] if same_shape else {key: '' for key in LINE_KEYS}
+                merged.append({key: llm_line.get(key) or line[key] for key in LINE_KEYS})
+            line_values = merged
+
+    services = [{**header_values, **line} for line in line_values]
+    return services, info
+
+
+# Pre-filter: only the parts of a long document that look like the
+# authorization details are sent to the LLM
+WINDOW_LINES = 12
+KEYWORD_WEIGHTS = [
+    (re.compile(r'Member\s+ID', re.IGNORECASE), 3),
+    (re.compile(r'Service\s+Auth', re.IGNORECASE), 3),
+    (PROCEDURE_CODE_RE, 3),
+    (DATES_RE, 2),
+    (re.compile(r'\bUnits\b', re.IGNORECASE), 2),
+    (re.compile(r'Service\s+Rate', re.IGNORECASE), 2),
+    (PAYER_RE, 1),
+    (MODIFIER_RE, 1),
+]
+
+
+def score_window(text):
+    """
+    Keyword density score for a block of text.
+    """
+    return sum(weight * len(pattern.findall(text)) for pattern, weight in KEYWORD_WEIGHTS)
+
+
+def select_relevant_text(text, max_chars=6000, window_lines=WINDOW_LINES):
+    """
+    Return (excerpt, info): the highest-scoring windows of ``window_lines``
+    lines that fit in ``max_chars``, kept in document order. Documents that
+    already fit are returned whole.
+    """
+    if len(text) <= max_chars:
+        return text, {'windows_total': 1, 'windows_sent': 1, 'filtered': False}
+
+    lines = text.splitlines()
+    windows = [
+        '\n'.join(lines[start:start + window_lines])
+        for start in range(0, len(lines), window_lines)
+    ]
+    ranked = sorted(
+        ((score_window(window), index) for index, window in enumerate(windows)),
+        key=lambda item: (-item[0], item[1])
+    )
+
+    chosen = []
+    used = 0
+    for score, index in ranked:
+        if score == 0:
+            break
+        size = len(windows[index]) + 5
+        if used + size > max_chars:
+            continue
+        chosen.append(index)
+        used += size
+
+    if not chosen:
+        # No window looks relevant (or none fits), send the head of the document
+        return text[:max_chars], {'windows_total': len(windows), 'windows_sent': 0, 'filtered': True}
+
+    excerpt = '\n...\n'.join(windows[index] for index in sorted(chosen))
+    return excerpt, {'windows_total': len(windows), 'windows_sent': len(chosen), 'filtered': True}
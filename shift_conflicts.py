@@ -0,0 +1,316 @@
+"""
+Double-booking checks for caregivers.
+
+``ConflictIndex`` keeps each staff member's shifts in process as a list
+sorted by start, with the longest shift duration alongside. Any shift
+overlapping [start, end) must start after ``start - longest`` and before
+``end``, so two bisects bound the candidates and only the handful in
+between are compared: O(log n) per check instead of a scan. The staff
+member's recurring series (see shift_series) are checked by jumping to
+the occurrences around the new shift.
+
+A staff member's schedule is loaded from ``shifts``/``shift_series`` on
+first use (one query each on the ``staff_email`` indexes), kept up to date
+by the routes that write shifts, and reloaded after ``max_age`` seconds.
+The least recently used schedules are dropped past ``max_staff``.
+
+That warm copy can miss shifts saved by other processes, so it only
+serves validation and reads. Checks made before a write pass
+``fresh=True`` and read just the window around the new shift from the
+database: shifts starting in [start - MAX_SHIFT, end) on the
+``staff_email_start`` index, which is O(log n + k) however long the staff
+member's history is, plus their series. Shifts are never longer than
+MAX_SHIFT (the routes reject them), so the window cannot miss one.
+Routes hold ``lock`` across the check and the write, so two requests in
+one process cannot book the same slot. Across processes the only gap
+left is between that query and the insert.
+
+``validate_batch`` checks a whole imported schedule: every item against
+the stored shifts and against the items before it in the batch.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import shift_series
+import typed_fields
+
+REJECT = 'reject'
+FLAG = 'flag'
+OFF = 'off'
+
+# Occurrences of open-ended series are checked this far ahead
+HORIZON = timedelta(days=366)
+# Longest single shift; bounds the window a write check reads
+MAX_SHIFT = timedelta(days=7)
+
+
+def describe(item_id, start, end):
+    return {
+        'id': str(item_id),
+        'start': typed_fields.isoformat_utc(start),
+        'end': typed_fields.isoformat_utc(end),
+    }
+
+
+class _Schedule:
+    """One staff member's shifts sorted by start, plus their series."""
+
+    def __init__(self):
+        self.starts = []
+        self.items = []
+        self.by_id = {}
+        self.longest = timedelta(0)
+        self.series = {}
+        self.loaded_at = time.monotonic()
+
+    def add(self, item_id, start, end):
+        if item_id in self.by_id:
+            self.remove(item_id)
+        position = bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.items.insert(position, (start, end, item_id))
+        self.by_id[item_id] = start
+        self.longest = max(self.longest, end - start)
+
+    def remove(self, item_id):
+        start = self.by_id.pop(item_id, None)
+        if start is None:
+            return
+        position = bisect_left(self.starts, start)
+        while self.items[position][2] != item_id:
+            position += 1
+        del self.starts[position]
+        del self.items[position]
+
+    def add_series(self, series):
+        self.series[series['_id']] = series
+
+    def overlapping(self, start, end, ignore=None):
+        found = []
+        low = bisect_right(self.starts, start - self.longest)
+        high = bisect_left(self.starts, end)
+        for other_start, other_end, item_id in self.items[low:high]:
+            if other_end > start and item_id != ignore:
+                found.append(describe(item_id, other_start, other_end))
+        for series in self.series.values():
+            if series['_id'] == ignore:
+                continue
+            duration = timedelta(minutes=series['duration_minutes'])
+            cancelled = set(series.get('cancelled') or ())
+            for occurrence in shift_series.occurrences(series, start - duration, None):
+                if occurrence >= end:
+                    break
+                if occurrence + duration <= start or occurrence in cancelled:
+                    continue
+                occurrence_id = shift_series.occurrence_id(series['_id'], occurrence)
+                if occurrence_id != ignore:
+                    found.append(describe(occurrence_id, occurrence, occurrence + duration))
+        return found
+
+
+def _has_times(item):
+    # Shifts saved before times were typed cannot be compared
+    return 'rule' in item or (isinstance(item.get('start'), datetime) and isinstance(item.get('end'), datetime))
+
+
+def _intervals(item):
+    """
+    (start, end) of a shift, or of each occurrence of a series up to its
+    end (or HORIZON from now for open-ended ones).
+    """
+    if 'rule' not in item:
+        yield item['start'], item['end']
+        return
+    duration = timedelta(minutes=item['duration_minutes'])
+    last = None if item['rule'].get('until') else datetime.utcnow() + HORIZON
+    cancelled = set(item.get('cancelled') or ())
+    for start in shift_series.occurrences(item, None, last):
+        if start not in cancelled:
+            yield start, start + duration
+
+
+class ConflictIndex:
+    """In-process interval index of every staff member's shifts."""
+
+    def __init__(self, shifts, series, max_staff=2000, max_age=300):
+        self.shifts = shifts
+        self.series = series
+        self.max_staff = max_staff
+        self.max_age = max_age
+        self.schedules = OrderedDict()
+        self.lock = threading.RLock()
+        self.counters = {'checks': 0, 'conflicts': 0, 'loads': 0, 'window_loads': 0}
+
+    def _load(self, staff_email):
+        schedule = _Schedule()
+        # Sorted by the index, so every add is an append
+        for shift in self.shifts.find({'staff_email': staff_email}, {'start': 1, 'end': 1}).sort('start', 1):
+            if isinstance(shift.get('start'), datetime) and isinstance(shift.get('end'), datetime):
+                schedule.add(shift['_id'], shift['start'], shift['end'])
+        for series in self.series.find({'staff_email': staff_email}):
+            schedule.add_series(series)
+        self.counters['loads'] += 1
+        return schedule
+
+    def _load_window(self, staff_email, start, end):
+        """
+        A throwaway schedule of the stored shifts and series that can
+        overlap [start, end), read straight from the database.
+        """
+        schedule = _Schedule()
+        query = {
+            'staff_email': staff_email,
+            'start': {'$gte': start - MAX_SHIFT, '$lt': end},
+            'end': {'$gt': start},
+        }
+        for shift in self.shifts.find(query, {'start': 1, 'end': 1}).sort('start', 1):
+            if isinstance(shift.get('start'), datetime) and isinstance(shift.get('end'), datetime):
+                schedule.add(shift['_id'], shift['start'], shift['end'])
+        for series in self.series.find({
+            'staff_email': staff_email,
+            'series_start': {'$lt': end},
+            '$or': [{'series_end': None}, {'series_end': {'$gt': start}}],
+        }):
+            schedule.add_series(series)
+        self.counters['window_loads'] += 1
+        return schedule
+
+    def _fresh_schedule(self, staff_email, items):
+        intervals = [interval for item in items for interval in _intervals(item)]
+        if not intervals:
+            return _Schedule()
+        return self._load_window(staff_email, min(start for start, _ in intervals), max(end for _, end in intervals))
+
+    def schedule(self, staff_email):
+        """
+        The staff member's schedule, loaded or reloaded as needed. Call with
+        the lock held.
+        """
+        schedule = self.schedules.get(staff_email)
+        if schedule is None or time.monotonic() - schedule.loaded_at > self.max_age:
+            schedule = self._load(staff_email)
+            self.schedules[staff_email] = schedule
+        self.schedules.move_to_end(staff_email)
+        while len(self.schedules) > self.max_staff:
+            self.schedules.popitem(last=False)
+        return schedule
+
+    def conflicts(self, item, ignore=None, fresh=False):
+        """
+        Stored shifts and series occurrences that overlap a shift or series
+        document. Items without a staff_email are never in conflict. Pass
+        ``fresh`` before saving the item, to check against the database.
+        """
+        staff_email = item.get('staff_email')
+        if not staff_email or not _has_times(item):
+            return []
+        with self.lock:
+            self.counters['checks'] += 1
+            if fresh:
+                schedule = self._fresh_schedule(staff_email, [item])
+            else:
+                schedule = self.schedule(staff_email)
+            found = self._overlapping(schedule, item, ignore)
+            if found:
+                self.counters['conflicts'] += 1
+            return found
+
+    def _overlapping(self, schedule, item, ignore):
+        found, seen = [], set()
+        for start, end in _intervals(item):
+            for conflict in schedule.overlapping(start, end, ignore):
+                key = (conflict['id'], conflict['start'])
+                if key not in seen:
+                    seen.add(key)
+                    found.append(conflict)
+        return found
+
+    def validate_batch(self, items, fresh=False):
+        """
+        Check a list of shift/series documents against the stored schedule
+        and each other. Returns one list of conflicts per item; conflicts
+        with earlier batch items carry their ``batchIndex``. With ``fresh``
+        each staff member's stored shifts are read from the database once,
+        for the window their items span.
+        """
+        results = []
+        pending = {}
+        stored = {}
+        by_staff = {}
+        for item in items:
+            if fresh and item.get('staff_email') and _has_times(item):
+                by_staff.setdefault(item['staff_email'], []).append(item)
+        batch_index = {str(item['_id']): index for index, item in enumerate(items)}
+        with self.lock:
+            for index, item in enumerate(items):
+                staff_email = item.get('staff_email')
+                if not staff_email or not _has_times(item):
+                    results.append([])
+                    continue
+                self.counters['checks'] += 1
+                batch_schedule = pending.setdefault(staff_email, _Schedule())
+                if staff_email not in stored:
+                    stored[staff_email] = (
+                        self._fresh_schedule(staff_email, by_staff[staff_email]) if fresh
+                        else self.schedule(staff_email)
+                    )
+                found = self._overlapping(stored[staff_email], item, None)
+                for conflict in self._overlapping(batch_schedule, item, None):
+                    # Occurrence ids start with their series id
+                    conflict['batchIndex'] = batch_index[conflict['id'].split('_')[0]]
+                    found.append(conflict)
+                if found:
+                    self.counters['conflicts'] += 1
+                results.append(found)
+                # Later items are checked against this one
+                if 'rule' in item:
+                    batch_schedule.add_series(item)
+                else:
+                    batch_schedule.add(item['_id'], item['start'], item['end'])
+        return results
+
+    def add(self, item):
+        """
+        Record a saved shift or series.
+        """
+        staff_email = item.get('staff_email')
+        if not staff_email or not _has_times(item):
+            return
+        with self.lock:
+            # Schedules not loaded yet will read it from the database
+            schedule = self.schedules.get(staff_email)
+            if schedule is None:
+                return
+            if 'rule' in item:
+                schedule.add_series(item)
+            else:
+                schedule.add(item['_id'], item['start'], item['end'])
+
+    def remove(self, item_id, staff_email):
+        with self.lock:
+            schedule = self.schedules.get(staff_email)
+            if schedule is not None:
+                schedule.remove(item_id)
+                schedule.series.pop(item_id, None)
+
+    def invalidate(self, staff_email=None):
+        """
+        Drop one staff member's schedule (or all) so it is reloaded.
+        """
+        with self.lock:
+            if staff_email is None:
+                self.schedules.clear()
+            else:
+                self.schedules.pop(staff_email, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'staff': len(self.schedules),
+                'shifts': sum(len(schedule.items) for schedule in self.schedules.values()),
+                'series': sum(len(schedule.series) for schedule in self.schedules.values()),
+                **self.counters,
+            }
@@ -0,0 +1,280 @@
+"""
+Recurring shifts stored as one series document: the first occurrence, a
+daily or weekly rule and the occurrences cancelled from it.
+
+``get_shifts`` finds the series that overlap the requested window with
+one indexed query (``user_email``, ``series_start``, ``series_end``) and
+``expand`` generates only the occurrences inside it. Expansion jumps
+straight to the first period of the window instead of walking from the
+series start, so the cost depends on the window, not the series length.
+
+Editing one occurrence cancels it in the series and saves the edited copy
+as an ordinary shift (``series_id`` and ``occurrence`` point back), so a
+series never holds anything but its rule and cancellations. In Google
+Calendar a series is one recurring event: an RRULE plus EXDATEs.
+
+Rules are wall-clock rules in the series' IANA ``time_zone``: a weekly
+9:00 Monday shift in America/Chicago stays at 9:00 local across DST, and
+``byDay`` means the local weekday. Occurrences are expanded in local time
+and returned as naive UTC datetimes like every other stored time; series
+without a zone (older documents) are UTC.
+
+Occurrence ids follow Calendar's instance ids, ``<series id>_<start as
+YYYYMMDDTHHMMSSZ>`` (UTC).
+"""
+import re
+from datetime import datetime, time, timedelta, timezone
+from itertools import islice
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+import typed_fields
+
+DAILY = 'daily'
+WEEKLY = 'weekly'
+WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+MAX_COUNT = 1000
+OCCURRENCE_FORMAT = '%Y%m%dT%H%M%SZ'
+LOCAL_FORMAT = '%Y%m%dT%H%M%S'
+BARE_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$|^\d{1,2}/\d{1,2}/\d{4}$')
+
+# Fields an occurrence copies from its series
+SHIFT_FIELDS = (
+    'title', 'description', 'recipient_email', 'user_email',
+    'staff_name', 'staff_email', 'service_type', 'clock_in', 'clock_out', 'internal_notes',
+    'time_zone',
+)
+
+
+def zone(name):
+    """
+    ZoneInfo for an IANA name (UTC when empty). Raises ValueError.
+    """
+    try:
+        return ZoneInfo(name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        raise ValueError(f"Unknown time zone: {name!r}")
+
+
+def to_local(value, tz):
+    return value.replace(tzinfo=timezone.utc).astimezone(tz).replace(tzinfo=None)
+
+
+def to_utc(value, tz):
+    return value.replace(tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _until(value, tz):
+    if isinstance(value, str) and BARE_DATE.match(value.strip()):
+        # A bare date includes that whole (local) day
+        day = typed_fields.to_datetime(value)
+        return to_utc(datetime.combine(day.date(), time(23, 59, 59)), tz)
+    return typed_fields.to_datetime(value)
+
+
+def parse_rule(rule, time_zone=None):
+    """
+    Normalize a rule like {'freq': 'weekly', 'interval': 1, 'byDay': ['MO',
+    'WE'], 'until': '2024-12-31'} or with 'count' instead of 'until'. A
+    bare 'until' date runs to the end of that day in ``time_zone``.
+    Raises ValueError when it cannot be used.
+    """
+    if not isinstance(rule, dict):
+        raise ValueError("rule must be an object")
+    freq = str(rule.get('freq', '')).lower()
+    if freq not in (DAILY, WEEKLY):
+        raise ValueError("rule.freq must be 'daily' or 'weekly'")
+    try:
+        interval = int(rule.get('interval') or 1)
+    except (TypeError, ValueError):
+        raise ValueError("rule.interval must be a whole number")
+    if interval < 1:
+        raise ValueError("rule.interval must be at least 1")
+
+    by_day = []
+    if freq == WEEKLY:
+        for day in rule.get('byDay') or []:
+            if str(day).upper() not in WEEKDAYS:
+                raise ValueError(f"rule.byDay has an unknown day: {day!r}")
+            by_day.append(WEEKDAYS.index(str(day).upper()))
+
+    count = rule.get('count')
+    if count is not None:
+        try:
+            count = int(count)
+        except (TypeError, ValueError):
+            raise ValueError("rule.count must be a whole number")
+        if not 1 <= count <= MAX_COUNT:
+            raise ValueError(f"rule.count must be between 1 and {MAX_COUNT}")
+    try:
+        until = _until(rule.get('until'), zone(time_zone))
+    except typed_fields.ConversionError as e:
+        raise ValueError(f"rule.until: {e}")
+    if count and until:
+        raise ValueError("rule takes either count or until, not both")
+    return {'freq': freq, 'interval': interval, 'by_day': sorted(set(by_day)), 'until': until, 'count': count}
+
+
+def new_series(fields, rule, cancelled=()):
+    """
+    Series document from shift fields (``start``/``end`` of the first
+    occurrence as UTC datetimes, optional ``time_zone``) and a rule from
+    ``parse_rule``.
+    """
+    first, end = fields['start'], fields['end']
+    if end <= first:
+        raise ValueError("end must be after start")
+    weekday = to_local(first, zone(fields.get('time_zone'))).weekday()
+    if rule['freq'] == WEEKLY and not rule['by_day']:
+        rule = dict(rule, by_day=[weekday])
+    if rule['freq'] == WEEKLY and weekday not in rule['by_day']:
+        # Calendar treats a first occurrence off the rule inconsistently
+        raise ValueError("start must fall on one of the rule's days")
+    series = dict(fields)
+    series.update({
+        'rule': {key: rule[key] for key in ('freq', 'interval', 'by_day', 'until')},
+        'duration_minutes': (end - first).total_seconds() / 60,
+        'series_start': first,
+        'cancelled': sorted(typed_fields.to_datetime(value) for value in cancelled),
+    })
+    series.pop('start')
+    series.pop('end')
+    if rule['count']:
+        # Stored as the last occurrence so expansion never has to count from the start
+        last = list(islice(occurrences(series, first, None), rule['count']))[-1]
+        series['rule']['until'] = last
+    until = series['rule']['until']
+    series['series_end'] = _last_end(series) if until else None
+    return series
+
+
+def _last_end(series):
+    # End of the last occurrence on or before 'until'; it is within one period of it
+    rule = series['rule']
+    search_from = max(series['series_start'], rule['until'] - timedelta(weeks=rule['interval'], days=1))
+    last = series['series_start']
+    for last in occurrences(series, search_from, None):
+        pass
+    return last + timedelta(minutes=series['duration_minutes'])
+
+
+def occurrences(series, start, end):
+    """
+    Starts (UTC) of the occurrences, cancelled ones included, that start at
+    or after ``start`` and end by ``end`` (None for no limit), in order.
+    """
+    rule = series['rule']
+    tz = zone(series.get('time_zone'))
+    duration = timedelta(minutes=series['duration_minutes'])
+    low = max(series['series_start'], start) if start else series['series_start']
+    high = end - duration if end else None
+    if rule.get('until') and (high is None or rule['until'] < high):
+        high = rule['until']
+
+    # Walk local wall-clock times from a day before the window (UTC offsets
+    # are under a day) and compare in UTC
+    first = to_local(series['series_start'], tz)
+    for current in _local_starts(rule, first, to_local(low, tz) - timedelta(days=1)):
+        current = to_utc(current, tz)
+        if current < low:
+            continue
+        if high is not None and current > high:
+            return
+        yield current
+
+
+def _local_starts(rule, first, low):
+    low = max(first, low)
+    if rule['freq'] == DAILY:
+        step = timedelta(days=rule['interval'])
+        current = first + -(-(low - first) // step) * step
+        while True:
+            yield current
+            current += step
+
+    period = timedelta(weeks=rule['interval'])
+    week_zero = datetime.combine(first.date() - timedelta(days=first.weekday()), first.time())
+    number = max(0, (low - week_zero) // period)
+    while True:
+        week = week_zero + number * period
+        for day in rule['by_day']:
+            current = week + timedelta(days=day)
+            if current >= low:
+                yield current
+        number += 1
+
+
+def occurrence_id(series_id, start):
+    return f"{series_id}_{start.strftime(OCCURRENCE_FORMAT)}"
+
+
+def parse_occurrence_id(value):
+    """
+    (series ObjectId, occurrence start) for an occurrence id, or None.
+    """
+    series_id, _, stamp = str(value).partition('_')
+    try:
+        return ObjectId(series_id), datetime.strptime(stamp, OCCURRENCE_FORMAT)
+    except (InvalidId, TypeError, ValueError):
+        return None
+
+
+def occurrence(series, start):
+    """
+    Shift-like document for one occurrence.
+    """
+    shift = {field: series.get(field) for field in SHIFT_FIELDS}
+    shift.update({
+        '_id': occurrence_id(series['_id'], start),
+        'series_id': series['_id'],
+        'start': start,
+        'end': start + timedelta(minutes=series['duration_minutes']),
+        'event_link': series.get('event_link'),
+        'calendar_status': series.get('calendar_status'),
+    })
+    return shift
+
+
+def expand(series, start, end):
+    """
+    Occurrences of a series inside a window, cancelled ones left out.
+    """
+    cancelled = set(series.get('cancelled') or ())
+    for current in occurrences(series, start, end):
+        if current not in cancelled:
+            yield occurrence(series, current)
+
+
+def window_filter(user_email, start, end):
+    """
+    Filter for the series that can have occurrences inside a window.
+    """
+    return {
+        'user_email': user_email,
+        'series_start': {'$lte': end},
+        '$or': [{'series_end': None}, {'series_end': {'$gte': start}}],
+    }
+
+
+def recurrence_lines(series):
+    """
+    RRULE and EXDATE lines for the series' Calendar event. BYDAY and
+    EXDATE are local to the event's time zone; UNTIL is UTC.
+    """
+    rule = series['rule']
+    parts = [f"FREQ={rule['freq'].upper()}", f"INTERVAL={rule['interval']}"]
+    if rule['freq'] == WEEKLY:
+        parts.append('BYDAY=' + ','.join(WEEKDAYS[day] for day in rule['by_day']))
+    if rule.get('until'):
+        parts.append(f"UNTIL={rule['until'].strftime(OCCURRENCE_FORMAT)}")
+    lines = ['RRULE:' + ';'.join(parts)]
+    cancelled = sorted(series.get('cancelled') or ())
+    if cancelled and series.get('time_zone'):
+        tz = zone(series['time_zone'])
+        stamps = ','.join(to_local(day, tz).strftime(LOCAL_FORMAT) for day in cancelled)
+        lines.append(f"EXDATE;TZID={series['time_zone']}:{stamps}")
+    elif cancelled:
+        lines.append('EXDATE:' + ','.join(day.strftime(OCCURRENCE_FORMAT) for day in cancelled))
+    return lines
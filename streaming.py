@@ -0,0 +1,125 @@
+"""
+Streaming responses for collection listings.
+
+Cursors are iterated in batches of STREAM_BATCH_SIZE and written out one
+document at a time, either as NDJSON (one document per line, for bulk
+exports) or as a chunked JSON array, so memory use stays flat however
+large the collection is.
+
+The first document is read before the response starts, so a failing query
+still reaches the route's error handling. Once the 200 is sent, an error
+ends the body as valid JSON with an error marker instead: an "error"
+member when the array is wrapped in an object, otherwise a final
+{"error": ...} record.
+"""
+import itertools
+import json
+import logging
+import os
+from datetime import date, datetime
+
+from bson import Decimal128, ObjectId
+from flask import Response, current_app, request, stream_with_context
+
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '500'))
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_ERROR = 'Stream ended early, results are incomplete'
+
+logger = logging.getLogger(__name__)
+
+
+def ndjson_default(value):
+    """
+    Convert BSON values that json cannot encode; dates become ISO 8601.
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def json_default(value):
+    """
+    Convert BSON values the same way jsonify does for regular responses.
+    """
+    if isinstance(value, (ObjectId, Decimal128)):
+        return str(value)
+    return current_app.json.default(value)
+
+
+def requested_format():
+    """
+    Return 'ndjson' when asked for with ?format=ndjson or the Accept header.
+    """
+    if request.args.get('format') == 'ndjson':
+        return 'ndjson'
+    if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    return 'json'
+
+
+def stream_json_array(items, prefix='[', suffix=']'):
+    """
+    Stream an iterable of documents as a JSON array, optionally wrapped in
+    a prefix/suffix such as '{"success": true, "clients": [' and ']}'.
+    """
+    def generate():
+        yield prefix
+        index = 0
+        try:
+            for index, item in enumerate(items, 1):
+                yield (',' if index > 1 else '') + current_app.json.dumps(item, default=json_default)
+        except Exception as e:
+            logger.error(f"Error streaming JSON after {index} documents: {e}")
+            error = current_app.json.dumps(STREAM_ERROR)
+            if prefix.startswith('{') and suffix.endswith('}'):
+                yield f'{suffix[:-1]},"error":{error}}}'
+            else:
+                yield f'{"," if index else ""}{{"error":{error}}}{suffix}'
+            return
+        yield suffix
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def stream_ndjson(items):
+    """
+    Stream an iterable of documents as newline-delimited JSON.
+    """
+    def generate():
+        try:
+            for item in items:
+                yield json.dumps(item, default=ndjson_default) + '\n'
+        except Exception as e:
+            logger.error(f"Error streaming NDJSON: {e}")
+            yield json.dumps({'error': STREAM_ERROR}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def _started(items):
+    """
+    Read the first item now, so errors raise before the response starts.
+    """
+    iterator = iter(items)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return iterator
+    return itertools.chain([first], iterator)
+
+
+def stream_cursor(cursor, transform=None, prefix='[', suffix=']', fmt=None):
+    """
+    Stream a pymongo cursor in the requested format. ``transform`` is applied
+    to each document; prefix/suffix only apply to the JSON array format.
+    """
+    cursor = cursor.batch_size(STREAM_BATCH_SIZE)
+    items = _started((transform(doc) for doc in cursor) if transform else cursor)
+
+    if (fmt or requested_format()) == 'ndjson':
+        return stream_ndjson(items)
+    return stream_json_array(items, prefix, suffix)
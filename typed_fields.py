@@ -0,0 +1,195 @@
+"""
+Typed storage for numeric and date fields, and the migration that
+rewrites older string values.
+
+Money and unit counts are stored as Decimal128, dates and times as BSON
+dates (naive UTC), so range filters use indexes in date order and
+aggregations can ``$sum`` directly. The converters are used by the routes
+when writing; ``migrate_collection`` rewrites existing documents in
+batches and only touches documents that still hold strings, so it can be
+re-run safely.
+"""
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+
+from bson import Decimal128
+from pymongo import UpdateOne
+
+from service_auth_parser import parse_date_range
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+class ConversionError(ValueError):
+    """Raised when a stored string cannot be read as the target type."""
+
+
+def to_decimal(value):
+    """
+    Decimal128 from a number or a string like '$1,234.50' or '120 hrs';
+    None for empty values.
+    """
+    if value is None or isinstance(value, Decimal128):
+        return value
+    if isinstance(value, bool):
+        raise ConversionError(f"Not a number: {value!r}")
+    if isinstance(value, (int, float)):
+        return Decimal128(Decimal(str(value)))
+    text = str(value).replace('$', '').replace(',', '').strip()
+    if not text:
+        return None
+    try:
+        return Decimal128(Decimal(text.split()[0]))
+    except InvalidOperation:
+        raise ConversionError(f"Not a number: {value!r}")
+
+
+def to_datetime(value):
+    """
+    Naive UTC datetime from an ISO 8601 timestamp, 'YYYY-MM-DD' or
+    'MM/DD/YYYY'; None for empty values.
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+    text = str(value).strip()
+    if not text:
+        return None
+    try:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            parsed = datetime.strptime(text, '%m/%d/%Y')
+        except ValueError:
+            raise ConversionError(f"Not a date: {value!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def decimal_to_float(value):
+    """
+    Plain number for responses and arithmetic; strings pass through.
+    """
+    return float(value.to_decimal()) if isinstance(value, Decimal128) else value
+
+
+def isoformat_utc(value):
+    """
+    ISO 8601 with a Z suffix for stored UTC datetimes; strings pass through.
+    """
+    return value.isoformat() + 'Z' if isinstance(value, datetime) else value
+
+
+def typed_service(service):
+    """
+    Copy of a service_auth record with its numeric fields as Decimal128.
+    Values that cannot be read are stored as they came.
+    """
+    typed = dict(service)
+    for field in ('units', 'serviceRate', 'hoursPerDay', 'hoursPerWeek'):
+        try:
+            typed[field] = to_decimal(service.get(field))
+        except ConversionError:
+            pass
+    return typed
+
+
+def _convert_fields(converters):
+    def convert(doc):
+        updates = {}
+        for field, converter in converters.items():
+            if isinstance(doc.get(field), str):
+                updates[field] = converter(doc[field])
+        return updates
+    return convert
+
+
+def _convert_service_auth(doc):
+    updates = _convert_fields({
+        'units': to_decimal,
+        'serviceRate': to_decimal,
+        'hoursPerDay': to_decimal,
+        'hoursPerWeek': to_decimal,
+    })(doc)
+    # The 'MM/DD/YYYY To MM/DD/YYYY' text stays for display; the range is split out
+    if 'startDate' not in doc and doc.get('dates'):
+        start, end = parse_date_range(doc['dates'])
+        if start is None:
+            raise ConversionError(f"Not a date range: {doc['dates']!r}")
+        updates.update(startDate=start, endDate=end)
+    return updates
+
+
+def _string_fields(*fields):
+    return [{field: {'$type': 'string'}} for field in fields]
+
+
+# collection -> (filter for documents still holding strings, projection, converter)
+MIGRATIONS = {
+    'service_auth': (
+        {'$or': _string_fields('units', 'serviceRate', 'hoursPerDay', 'hoursPerWeek') + [
+            {'startDate': {'$exists': False}, 'dates': {'$type': 'string', '$ne': ''}}
+        ]},
+        {'units': 1, 'serviceRate': 1, 'hoursPerDay': 1, 'hoursPerWeek': 1, 'dates': 1, 'startDate': 1},
+        _convert_service_auth,
+    ),
+    'invoices': (
+        {'$or': _string_fields('sub_total', 'discount', 'total', 'service_date')},
+        {'sub_total': 1, 'discount': 1, 'total': 1, 'service_date': 1},
+        _convert_fields({
+            'sub_total': to_decimal,
+            'discount': to_decimal,
+            'total': to_decimal,
+            'service_date': to_datetime,
+        }),
+    ),
+    'shifts': (
+        {'$or': _string_fields('start', 'end')},
+        {'start': 1, 'end': 1},
+        _convert_fields({'start': to_datetime, 'end': to_datetime}),
+    ),
+}
+
+
+def migrate_collection(collection, name=None, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Rewrite string fields of one collection to their typed form. Documents
+    with values that cannot be converted are left alone and counted.
+    """
+    query, projection, convert = MIGRATIONS[name or collection.name]
+    summary = {'scanned': 0, 'converted': 0, 'failed': 0}
+    operations = []
+
+    def flush():
+        if operations and not dry_run:
+            collection.bulk_write(operations, ordered=False)
+        operations.clear()
+
+    for doc in collection.find(query, projection).sort('_id', 1).batch_size(batch_size):
+        summary['scanned'] += 1
+        try:
+            updates = convert(doc)
+        except ConversionError as e:
+            logger.warning(f"{collection.name} {doc['_id']}: {e}")
+            summary['failed'] += 1
+            continue
+        if updates:
+            operations.append(UpdateOne({'_id': doc['_id']}, {'$set': updates}))
+            summary['converted'] += 1
+        if len(operations) >= batch_size:
+            flush()
+    flush()
+    return summary
+
+
+def migrate(db, names=None, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Run the migration for the named collections (all by default).
+    """
+    return {
+        name: migrate_collection(db[name], name, batch_size=batch_size, dry_run=dry_run)
+        for name in (names or MIGRATIONS)
+    }
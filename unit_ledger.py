@@ -0,0 +1,250 @@
+"""
+Unit-consumption ledger for service authorizations.
+
+Each authorization carries typed running totals, ``unitsAuthorized`` and
+``unitsUsed`` (doubles), so its remaining balance is one indexed read.
+Approved timesheet entries consume units: ``apply_change`` records what
+each entry has contributed in the ``unit_ledger`` collection (one document
+per timesheet entry) and ``$inc``s the authorization by the difference, so
+replaying the same change is harmless and edits or deletes give the units
+back. ``reconcile`` rebuilds the ledger and every balance from the
+timesheet collection in bulk when they drift. Both also refresh the
+display strings the service table shows, ``usedUnits`` and
+``totalHoursRemaining``, from the typed totals.
+
+A timesheet entry is matched to an authorization by ``serviceAuthNumber``
+and, when present, ``procedureServiceCode`` (one authorization can have
+several service lines). It consumes its ``units`` if set, otherwise
+``hours * UNITS_PER_HOUR``.
+"""
+import logging
+import os
+from datetime import datetime
+
+from pymongo import ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+UNITS_PER_HOUR = float(os.getenv('UNITS_PER_HOUR', '1'))
+BATCH_SIZE = 1000
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '').split()[0])
+    except (ValueError, IndexError):
+        return 0.0
+
+
+def parse_units(units):
+    """
+    Authorized units as a number ('120', '120.0 hrs', '' -> 0.0).
+    """
+    return _number(units) if units not in (None, '') else 0.0
+
+
+def entry_units(doc):
+    """
+    Units a timesheet entry consumes: only approved entries count.
+    """
+    if not doc or doc.get('status') != 'approved' or not doc.get('serviceAuthNumber'):
+        return 0.0
+    if doc.get('units') not in (None, ''):
+        return _number(doc['units'])
+    return _number(doc.get('hours')) * UNITS_PER_HOUR
+
+
+def auth_filter(doc):
+    """
+    The service_auth filter for the line a timesheet entry bills against.
+    """
+    query = {'serviceAuthNumber': doc['serviceAuthNumber']}
+    if doc.get('procedureServiceCode'):
+        query['procedureServiceCode'] = doc['procedureServiceCode']
+    return query
+
+
+def _resolve_auth(service_auth, doc, cache=None):
+    key = tuple(sorted(auth_filter(doc).items()))
+    if cache is not None and key in cache:
+        return cache[key]
+    auth = service_auth.find_one(dict(key), {'_id': 1})
+    auth_id = auth['_id'] if auth else None
+    if cache is not None:
+        cache[key] = auth_id
+    return auth_id
+
+
+def legacy_fields(auth):
+    """
+    ``usedUnits``/``totalHoursRemaining`` display strings for a
+    service_auth document, derived from its typed balance.
+    """
+    current = balance(auth)
+    return {
+        'usedUnits': f"{current['unitsUsed']:g}",
+        'totalHoursRemaining': f"{float(current['hoursRemaining'])} hrs",
+    }
+
+
+def _consume(service_auth, auth_id, units):
+    auth = service_auth.find_one_and_update(
+        {'_id': auth_id},
+        {'$inc': {'unitsUsed': units}},
+        projection={'units': 1, 'unitsAuthorized': 1, 'unitsUsed': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if auth is None:
+        return
+    # Only while unitsUsed is unchanged; a later writer sets its own strings
+    service_auth.update_one(
+        {'_id': auth_id, 'unitsUsed': auth.get('unitsUsed')},
+        {'$set': legacy_fields(auth)}
+    )
+
+
+def apply_change(service_auth, ledger, entry_id, doc):
+    """
+    Bring the ledger in line with the current state of one timesheet entry
+    (``doc=None`` when it was deleted). Returns the units moved.
+    """
+    units = entry_units(doc)
+    auth_id = _resolve_auth(service_auth, doc) if units else None
+    if units and auth_id is None:
+        logger.warning(f"No service authorization matches timesheet entry {entry_id}")
+        units = 0.0
+
+    previous = ledger.find_one_and_update(
+        {'_id': entry_id},
+        {'$set': {'auth_id': auth_id, 'units': units, 'updated_at': datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    ) or {}
+
+    moved = 0.0
+    if previous.get('auth_id') is not None and previous.get('units'):
+        if previous['auth_id'] == auth_id:
+            units -= previous['units']
+        else:
+            # The entry moved to another authorization: give the units back first
+            _consume(service_auth, previous['auth_id'], -previous['units'])
+            moved += previous['units']
+    if auth_id is not None and units:
+        _consume(service_auth, auth_id, units)
+        moved += abs(units)
+
+    if doc is None:
+        ledger.delete_one({'_id': entry_id})
+    return moved
+
+
+def balance(auth):
+    """
+    Authorized, used and remaining units for a service_auth document.
+    """
+    authorized = auth.get('unitsAuthorized')
+    if authorized is None:
+        authorized = parse_units(auth.get('units'))
+    used = auth.get('unitsUsed') or 0.0
+    return {
+        'unitsAuthorized': authorized,
+        'unitsUsed': used,
+        'unitsRemaining': authorized - used,
+        'hoursRemaining': (authorized - used) / UNITS_PER_HOUR,
+    }
+
+
+def _flush(collection, operations):
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return []
+
+
+def reconcile(db, service_auth, ledger, batch_size=BATCH_SIZE):
+    """
+    Rebuild the ledger and every authorization's ``unitsUsed`` from the
+    approved timesheet entries, and fill in ``unitsAuthorized`` where it is
+    missing. Returns a summary of what was done.
+    """
+    started = datetime.utcnow()
+    auth_ids = {}
+    totals = {}
+    entries = 0
+    unmatched = 0
+
+    operations = []
+    cursor = db['timesheet'].find(
+        {'status': 'approved', 'serviceAuthNumber': {'$nin': ['', None]}},
+        {'serviceAuthNumber': 1, 'procedureServiceCode': 1, 'units': 1, 'hours': 1, 'status': 1}
+    ).batch_size(batch_size)
+    for doc in cursor:
+        units = entry_units(doc)
+        auth_id = _resolve_auth(service_auth, doc, auth_ids)
+        if auth_id is None:
+            unmatched += 1
+            units = 0.0
+        else:
+            totals[auth_id] = totals.get(auth_id, 0.0) + units
+        operations.append(UpdateOne(
+            {'_id': doc['_id']},
+            {'$set': {'auth_id': auth_id, 'units': units, 'updated_at': started}},
+            upsert=True
+        ))
+        entries += 1
+        if len(operations) >= batch_size:
+            operations = _flush(ledger, operations)
+    _flush(ledger, operations)
+    # Entries no longer approved (or deleted) drop out of the ledger
+    ledger.delete_many({'updated_at': {'$lt': started}})
+
+    operations = []
+    for auth_id, used in totals.items():
+        operations.append(UpdateOne({'_id': auth_id}, {'$set': {'unitsUsed': used, 'ledgerReconciledAt': started}}))
+        if len(operations) >= batch_size:
+            operations = _flush(service_auth, operations)
+    _flush(service_auth, operations)
+    reset = service_auth.update_many(
+        {'ledgerReconciledAt': {'$ne': started}},
+        {'$set': {'unitsUsed': 0.0, 'ledgerReconciledAt': started}}
+    ).modified_count
+
+    operations = []
+    authorized = 0
+    for auth in service_auth.find({'unitsAuthorized': {'$exists': False}}, {'units': 1}).batch_size(batch_size):
+        operations.append(UpdateOne({'_id': auth['_id']}, {'$set': {'unitsAuthorized': parse_units(auth.get('units'))}}))
+        authorized += 1
+        if len(operations) >= batch_size:
+            operations = _flush(service_auth, operations)
+    _flush(service_auth, operations)
+
+    operations = []
+    for auth in service_auth.find({}, {'units': 1, 'unitsAuthorized': 1, 'unitsUsed': 1}).batch_size(batch_size):
+        operations.append(UpdateOne({'_id': auth['_id']}, {'$set': legacy_fields(auth)}))
+        if len(operations) >= batch_size:
+            operations = _flush(service_auth, operations)
+    _flush(service_auth, operations)
+
+    return {
+        'timesheet_entries': entries,
+        'unmatched_entries': unmatched,
+        'authorizations_with_usage': len(totals),
+        'authorizations_reset': reset,
+        'authorized_units_filled': authorized,
+    }
+
+
+def watch(db, service_auth, ledger):
+    """
+    Consume the timesheet change stream and keep balances current. The
+    ledger remembers what each entry contributed, so no pre-images are
+    needed. Needs a replica set.
+    """
+    pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+    with db['timesheet'].watch(pipeline, full_document='updateLookup') as stream:
+        for change in stream:
+            entry_id = change['documentKey']['_id']
+            apply_change(service_auth, ledger, entry_id, change.get('fullDocument'))